@@ -0,0 +1,57 @@
+"""add office balances
+
+Revision ID: 8bb30d3dcae8
+Revises: 23f7fa2e960f
+Create Date: 2026-10-18 09:10:42.318204
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = "8bb30d3dcae8"
+down_revision = "23f7fa2e960f"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "office_balances",
+        sa.Column("office_id", sqlmodel.sql.sqltypes.GUID(), nullable=False),
+        sa.Column("accounts_balance", sa.Numeric(precision=19, scale=4), nullable=False),
+        sa.Column("fund_balance", sa.Numeric(precision=19, scale=4), nullable=False),
+        sa.Column("wallets_value", sa.Numeric(precision=19, scale=4), nullable=False),
+        sa.ForeignKeyConstraint(
+            ["office_id"],
+            ["offices.id"],
+        ),
+        sa.PrimaryKeyConstraint("office_id"),
+    )
+    # start from the current balances, the application keeps them up to date afterwards
+    op.execute(
+        """
+        INSERT INTO office_balances (office_id, accounts_balance, fund_balance, wallets_value)
+        SELECT
+            offices.id,
+            COALESCE((
+                SELECT SUM(balance) FROM accounts
+                WHERE accounts.office_id = offices.id AND accounts.type != 'FUND'
+            ), 0),
+            COALESCE((
+                SELECT SUM(balance) FROM accounts
+                WHERE accounts.office_id = offices.id AND accounts.type = 'FUND'
+            ), 0),
+            COALESCE((
+                SELECT SUM(value) FROM wallets WHERE wallets.office_id = offices.id
+            ), 0)
+        FROM offices
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("office_balances")
@@ -0,0 +1,78 @@
+"""structured transaction notes
+
+Revision ID: aa92cefba2f3
+Revises: b006f370f706
+Create Date: 2026-10-18 11:20:24.274561
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = "aa92cefba2f3"
+down_revision = "b006f370f706"
+branch_labels = None
+depends_on = None
+
+TABLES = ["deposits", "externals", "forex", "internals", "sendings"]
+
+
+def upgrade() -> None:
+    for table in TABLES:
+        op.add_column(
+            table,
+            sa.Column("request_message", sqlmodel.sql.sqltypes.AutoString(), nullable=True),
+        )
+        op.add_column(table, sa.Column("tags", postgresql.ARRAY(sa.String()), nullable=True))
+        op.alter_column(
+            table,
+            "notes",
+            existing_type=sa.VARCHAR(),
+            type_=postgresql.JSONB(astext_type=sa.Text()),
+            existing_nullable=False,
+            postgresql_using="CASE WHEN btrim(notes) = '' THEN '[]'::jsonb ELSE notes::jsonb END",
+        )
+        # same rules as note_fields: message of the REQUEST note, tags of the first tagged note
+        op.execute(
+            f"""
+            UPDATE {table} SET
+                request_message = (
+                    SELECT note->>'message'
+                    FROM jsonb_array_elements(notes) WITH ORDINALITY AS n(note, position)
+                    WHERE note->>'type' = 'REQUEST'
+                    ORDER BY position LIMIT 1
+                ),
+                tags = (
+                    SELECT CASE jsonb_typeof(note->'tags')
+                        WHEN 'array' THEN ARRAY(SELECT jsonb_array_elements_text(note->'tags'))
+                        ELSE ARRAY[note->>'tags']
+                    END
+                    FROM jsonb_array_elements(notes) WITH ORDINALITY AS n(note, position)
+                    WHERE (
+                        jsonb_typeof(note->'tags') = 'array'
+                        AND jsonb_array_length(note->'tags') > 0
+                    ) OR (jsonb_typeof(note->'tags') = 'string' AND note->>'tags' != '')
+                    ORDER BY position LIMIT 1
+                )
+            WHERE jsonb_typeof(notes) = 'array'
+            """
+        )
+        op.create_index(f"ix_{table}_tags", table, ["tags"], unique=False, postgresql_using="gin")
+
+
+def downgrade() -> None:
+    for table in TABLES:
+        op.drop_index(f"ix_{table}_tags", table_name=table, postgresql_using="gin")
+        op.alter_column(
+            table,
+            "notes",
+            existing_type=postgresql.JSONB(astext_type=sa.Text()),
+            type_=sa.VARCHAR(),
+            existing_nullable=False,
+            postgresql_using="notes::text",
+        )
+        op.drop_column(table, "tags")
+        op.drop_column(table, "request_message")
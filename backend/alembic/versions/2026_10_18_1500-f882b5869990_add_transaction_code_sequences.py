@@ -0,0 +1,68 @@
+"""add transaction code sequences
+
+Revision ID: f882b5869990
+Revises: f8fed01a7beb
+Create Date: 2026-10-18 15:00:12.408361
+
+"""
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "f882b5869990"
+down_revision = "f8fed01a7beb"
+branch_labels = None
+depends_on = None
+
+# one sequence per account and per wallet, continuing their counter
+# the names are built by mkdi_backend.models.codes
+SEQUENCES = """
+SELECT 'account_code_' || replace(id::text, '-', '') AS name, coalesce(counter, 0) AS counter
+FROM accounts
+UNION ALL
+SELECT 'wallet_code_' || md5("walletID"), coalesce(counter, 0)
+FROM wallets
+"""
+
+
+def upgrade() -> None:
+    op.execute(
+        f"""
+        DO $$
+        DECLARE r record;
+        BEGIN
+            FOR r IN {SEQUENCES} LOOP
+                EXECUTE format('CREATE SEQUENCE IF NOT EXISTS %I START %s', r.name, r.counter + 1);
+            END LOOP;
+        END $$;
+        """
+    )
+
+
+def downgrade() -> None:
+    # write the last allocated numbers back to the counters
+    op.execute(
+        """
+        DO $$
+        DECLARE r record;
+        DECLARE last bigint;
+        BEGIN
+            FOR r IN SELECT id, 'account_code_' || replace(id::text, '-', '') AS name
+                     FROM accounts LOOP
+                IF to_regclass(r.name) IS NOT NULL THEN
+                    EXECUTE format('SELECT CASE WHEN is_called THEN last_value ELSE last_value - 1 END FROM %I', r.name) INTO last;
+                    UPDATE accounts SET counter = last WHERE id = r.id;
+                    EXECUTE format('DROP SEQUENCE %I', r.name);
+                END IF;
+            END LOOP;
+            FOR r IN SELECT "walletID" AS id, 'wallet_code_' || md5("walletID") AS name
+                     FROM wallets LOOP
+                IF to_regclass(r.name) IS NOT NULL THEN
+                    EXECUTE format('SELECT CASE WHEN is_called THEN last_value ELSE last_value - 1 END FROM %I', r.name) INTO last;
+                    UPDATE wallets SET counter = last WHERE "walletID" = r.id;
+                    EXECUTE format('DROP SEQUENCE %I', r.name);
+                END IF;
+            END LOOP;
+        END $$;
+        """
+    )
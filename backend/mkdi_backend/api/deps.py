@@ -3,13 +3,19 @@ from typing import Annotated, Generator
 from fastapi import Depends, HTTPException, Security, status
 from fastapi.security import OAuth2AuthorizationCodeBearer, SecurityScopes
 from loguru import logger
-from mkdi_backend.authproviders import RoleProvider, keycloak_openid
+from mkdi_backend.authproviders import (
+    jwks_cache,
+    keycloak_openid,
+    role_catalog,
+    token_claims_to_check,
+    user_cache,
+)
 from mkdi_backend.config import settings
 from mkdi_backend.database import engine
 from mkdi_backend.models.models import KcUser
 from mkdi_backend.models.roles import Role
 from mkdi_backend.repositories.employee import EmployeeRepository
-from mkdi_backend.dbmanager import get_db_session
+from mkdi_backend.dbmanager import get_db_session, sessionmanager
 from sqlalchemy.ext.asyncio import AsyncSession
 
 # from mkdi_backend.models import ApiClient
@@ -34,18 +40,9 @@ DBSessionDep = Annotated[Session, Depends(get_db)]
 
 # Get the payload/token from keycloak
 async def get_payload(token: str = Security(oauth2_scheme)) -> dict:
-    introspect = keycloak_openid.introspect(token)
-    # make sure the token is active
-    if not introspect["active"]:
-        logger.info(f"Introspect result: {introspect}")
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid authentication credentials",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
     try:
-        # introspect user token
-        return keycloak_openid.decode_token(token)
+        # verify signature, expiry and audience locally against the cached realm keys
+        payload = await jwks_cache.decode_token(token, check_claims=token_claims_to_check())
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -53,17 +50,45 @@ async def get_payload(token: str = Security(oauth2_scheme)) -> dict:
             headers={"WWW-Authenticate": "Bearer"},
         ) from e
 
+    if settings.KC_INTROSPECT_TOKENS:
+        # opt-in revocation check, only keycloak knows about logged out sessions
+        introspect = await keycloak_openid.a_introspect(token)
+        # make sure the token is active
+        if not introspect["active"]:
+            logger.info(f"Introspect result: {introspect}")
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Invalid authentication credentials",
+                headers={"WWW-Authenticate": "Bearer"},
+            )
+
+    return payload
+
 
 # Get user infos from the payload
-async def get_user_info(
-    payload: dict = Depends(get_payload), db: Session = Depends(get_db)
-) -> KcUser:
+async def get_user_info(payload: dict = Depends(get_payload)) -> KcUser:
     try:
-        userdb = EmployeeRepository(db).get_employee(
+        user = KcUser(
+            id=payload.get("sub"),
             username=payload.get("preferred_username"),
             email=payload.get("email"),
+            first_name=payload.get("given_name"),
+            last_name=payload.get("family_name"),
+            roles=payload.get("realm_access", {}).get("roles", []),
+            office_id=payload.get("officeId"),
             organization_id=payload.get("organizationId"),
         )
+        cached: KcUser = user_cache.get(user.id)
+        # a new token may carry different claims, only reuse the employee lookup when it doesn't
+        if cached and cached.dict(exclude={"user_db_id"}) == user.dict(exclude={"user_db_id"}):
+            return cached
+
+        async with sessionmanager.session() as session:
+            userdb = await EmployeeRepository(session).a_get_employee(
+                username=user.username,
+                email=user.email,
+                organization_id=user.organization_id,
+            )
 
         if not userdb:
             raise HTTPException(
@@ -72,17 +97,9 @@ async def get_user_info(
                 headers={"WWW-Authenticate": "Bearer"},
             )
 
-        return KcUser(
-            id=payload.get("sub"),
-            username=payload.get("preferred_username"),
-            email=payload.get("email"),
-            first_name=payload.get("given_name"),
-            last_name=payload.get("family_name"),
-            roles=payload.get("realm_access", {}).get("roles", []),
-            office_id=payload.get("officeId"),
-            organization_id=payload.get("organizationId"),
-            user_db_id=str(userdb.id),
-        )
+        user.user_db_id = str(userdb.id)
+        user_cache.set(user.id, user)
+        return user
     except Exception as e:
         from loguru import logger
 
@@ -94,23 +111,6 @@ async def get_user_info(
         ) from e
 
 
-def get_roles_deps(role, roles_deps: list[str] = RoleProvider().get_roles()):
-    import re
-
-    # transform realm_roles to remove _0,_1,_2 at then end
-    # ["sofware_admin_0","office_admin_2","org_admin_1"] -> ["sofware_admin","office_admin","org_admin"]
-    pattern = re.compile(r"^\w+_\w+_\d+$")
-    for r in roles_deps:
-        if not pattern.match(r):
-            raise ValueError(f"Role {r} does not follow the pattern tok_tok_number")
-
-    transformed_roles = [r.rsplit("_", 1)[0] for r in roles_deps]
-    # Find the index of the role in the transformed list
-    role_index = transformed_roles.index(role)
-
-    return roles_deps[: role_index + 1]
-
-
 def hasSufficientPermissions(user_roles, required_roles: list = []) -> bool:
     """Check if the user has the required roles.
 
@@ -132,13 +132,15 @@ def hasSufficientPermissions(user_roles, required_roles: list = []) -> bool:
         return True
 
     for r in user_roles:
-        if Role.is_valid(r) and Role.from_str(r).can_access(Role.from_str(required_roles[0])):
+        if role_catalog.is_known(r) and Role.from_str(r).can_access(
+            Role.from_str(required_roles[0])
+        ):
             return True
 
     return False
 
 
-def check_authorization(
+async def check_authorization(
     *, scopes: SecurityScopes, user: Annotated[KcUser, Depends(get_user_info)]
 ) -> KcUser:
     """Check if the user has the required scopes.
@@ -155,6 +157,13 @@ def check_authorization(
     """
     authenticate_value = f'Bearer scope="{scopes.scope_str}"' if scopes.scopes else "Bearer"
 
+    if scopes.scopes:
+        try:
+            await role_catalog.a_ensure_loaded()
+        except Exception as e:
+            # keep authorizing with the built-in roles until keycloak answers
+            logger.error(f"Failed to load realm roles {e}")
+
     if not hasSufficientPermissions(user.roles, scopes.scopes):
         logger.info(f"User has insufficient permissions {scopes.scopes} in {user.roles}")
         raise HTTPException(
@@ -7,7 +7,7 @@ from sqlmodel import Session
 
 from mkdi_shared.schemas import protocol
 
-from mkdi_backend.api.deps import check_authorization, get_db, DBSessionDep
+from mkdi_backend.api.deps import check_authorization, get_db, AsyncDBSessionDep, DBSessionDep
 from mkdi_backend.models.models import KcUser
 from mkdi_backend.models.Account import AccountMonthlyReport
 from mkdi_backend.repositories.report_repo import ReportRepository
@@ -17,14 +17,14 @@ router = APIRouter()
 
 
 @router.get("/office/monthly-report", response_model=protocol.ReportResponse, status_code=200)
-def get_monthly_report(
+async def get_monthly_report(
     *,
     user: Annotated[KcUser, Security(check_authorization, scopes=["org_admin"])],
     start_date: str | None = None,
     end_date: str | None = None,
-    db: Session = Depends(get_db),
+    db: AsyncDBSessionDep,
 ) -> protocol.ReportResponse:
-    return ReportRepository(db).get_monthly_report(user.office_id, start_date, end_date)
+    return await ReportRepository(db).get_monthly_report(user.office_id, start_date, end_date)
 
 
 @router.get(
@@ -66,3 +66,20 @@ def get_provider_report(
     db: DBSessionDep,
 ) -> List[ForEx]:
     return ReportRepository(db).get_provider_report(user, name, start, end)
+
+
+@router.get(
+    "/office/providers/summary",
+    response_model=List[protocol.ProviderReportItem],
+    status_code=200,
+)
+def get_providers_summary(
+    *,
+    user: Annotated[KcUser, Security(check_authorization, scopes=[])],
+    start: str | None = None,
+    end: str | None = None,
+    period: protocol.ReportPeriod = protocol.ReportPeriod.DAY,
+    name: str | None = None,
+    db: DBSessionDep,
+) -> List[protocol.ProviderReportItem]:
+    return ReportRepository(db).get_providers_summary(user, start, end, period, name)
@@ -1,6 +1,12 @@
 """API Router for ping."""
 
-from fastapi import APIRouter
+from typing import Annotated
+
+from fastapi import APIRouter, Security
+from mkdi_backend.api.deps import check_authorization
+from mkdi_backend.authproviders import user_cache
+from mkdi_backend.models.models import KcUser
+from mkdi_backend.utils.retry import retry_stats
 
 router = APIRouter()
 
@@ -8,3 +14,9 @@ router = APIRouter()
 @router.get("/ping")
 def ping():
     return {"health": "UP"}
+
+
+@router.get("/stats")
+def stats(user: Annotated[KcUser, Security(check_authorization, scopes=["soft_admin"])]):
+    """Process level counters, they are reset when the worker restarts."""
+    return {"user_cache": user_cache.stats(), "transaction_retries": retry_stats.stats()}
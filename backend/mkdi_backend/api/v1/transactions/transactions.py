@@ -1,21 +1,45 @@
 """Transaction API endpoints."""
 
+from datetime import datetime
 from typing import Annotated, List
 
 from sqlmodel import Session
-from fastapi import APIRouter, Depends, Security
+from fastapi import APIRouter, Depends, Query, Response, Security
+from fastapi.responses import StreamingResponse
 
 from mkdi_backend.api.deps import check_authorization, get_db, AsyncDBSessionDep, DBSessionDep
+from mkdi_backend.config import settings
 from mkdi_backend.models.models import KcUser
 from mkdi_backend.models.transactions.transaction_item import TransactionItem, AllTransactions
-from mkdi_backend.repositories.transactions import TransactionRepository
+from mkdi_backend.repositories.transactions import EXPORT_COLUMNS, TransactionRepository
 from mkdi_backend.models.transactions.transactions import TransactionWithDetails
+from mkdi_backend.utils.export import MEDIA_TYPES, ExportFormat, csv_lines, encode, ndjson_lines
 from mkdi_shared.schemas import protocol
 
 
 router = APIRouter()
 
 
+def transaction_route(method: str, path: str, sync_endpoint, async_endpoint, **kwargs) -> None:
+    """
+    Register a transaction write route.
+
+    The async implementation is served unless the route is listed in
+    SYNC_TRANSACTION_ROUTES, the sync one then runs in the threadpool. Both share the name
+    of the sync endpoint, so the operation id stays the same.
+
+    Args:
+        method (str): The HTTP method.
+        path (str): The route path.
+        sync_endpoint: The implementation on a sync session.
+        async_endpoint: The implementation on an async session.
+        **kwargs: The route options.
+    """
+    name = sync_endpoint.__name__
+    endpoint = sync_endpoint if name in settings.SYNC_TRANSACTION_ROUTES else async_endpoint
+    router.add_api_route(path, endpoint, methods=[method], name=name, **kwargs)
+
+
 @router.get(
     "/office/transactions",
     response_model=List[TransactionItem],
@@ -24,10 +48,34 @@ router = APIRouter()
 async def get_office_transactions(
     *,
     user: Annotated[KcUser, Security(check_authorization, scopes=[])],
+    response: Response,
+    cursor: str | None = None,
+    limit: Annotated[
+        int, Query(ge=1, le=settings.TRANSACTIONS_MAX_PAGE_SIZE)
+    ] = settings.TRANSACTIONS_PAGE_SIZE,
+    types: Annotated[List[protocol.TransactionType] | None, Query()] = None,
+    states: Annotated[List[protocol.TransactionState] | None, Query()] = None,
+    start_date: datetime | None = None,
+    end_date: datetime | None = None,
     db: AsyncDBSessionDep,
 ) -> List[TransactionItem]:
-    """get all transactions for an office"""
-    return await TransactionRepository(db).get_offcie_transactions_items(user)
+    """get a page of the office transactions, newest first
+
+    The cursor of the next page is returned in the X-Next-Cursor header, the header is
+    missing on the last page.
+    """
+    items, next_cursor = await TransactionRepository(db).get_offcie_transactions_items(
+        user,
+        cursor=cursor,
+        limit=limit,
+        types=types,
+        states=states,
+        start_date=start_date,
+        end_date=end_date,
+    )
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return items
 
 
 @router.get(
@@ -40,10 +88,39 @@ def get_office_transactions_by_interval(
     user: Annotated[KcUser, Security(check_authorization, scopes=[])],
     start_date: str | None = None,
     end_date: str | None = None,
+    limit: Annotated[int | None, Query(ge=1)] = None,
     db: DBSessionDep,
 ) -> List[AllTransactions]:
-    """get all transactions for an office"""
-    return TransactionRepository(db).get_offcie_transactions(user, start_date, end_date)
+    """get the transactions of an office over a date range, newest first"""
+    return TransactionRepository(db).get_offcie_transactions(user, start_date, end_date, limit)
+
+
+@router.get("/office/transactions/export", status_code=200, response_class=StreamingResponse)
+async def export_office_transactions(
+    *,
+    user: Annotated[KcUser, Security(check_authorization, scopes=[])],
+    start_date: str | None = None,
+    end_date: str | None = None,
+    types: Annotated[List[protocol.TransactionType] | None, Query()] = None,
+    states: Annotated[List[protocol.TransactionState] | None, Query()] = None,
+    export_format: Annotated[ExportFormat, Query(alias="format")] = ExportFormat.NDJSON,
+    gzip: bool = False,
+) -> StreamingResponse:
+    """export the transactions of an office over a date range as ndjson or csv, newest first"""
+    rows = TransactionRepository(None).stream_office_transactions(
+        user, start_date, end_date, types=types, states=states
+    )
+    if export_format == ExportFormat.CSV:
+        lines = csv_lines(rows, EXPORT_COLUMNS)
+    else:
+        lines = ndjson_lines(rows)
+
+    filename = f"transactions.{export_format.value}" + (".gz" if gzip else "")
+    return StreamingResponse(
+        encode(lines, gzip=gzip),
+        media_type="application/gzip" if gzip else MEDIA_TYPES[export_format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
 
 
 @router.get(
@@ -57,15 +134,15 @@ def get_agent_transactions(
     initials: str,
     start_date: str | None = None,
     end_date: str | None = None,
+    limit: Annotated[int | None, Query(ge=1)] = None,
     db: Session = Depends(get_db),
 ) -> list[AllTransactions]:
-    """get all transactions for an agent"""
+    """get the transactions of an agent, newest first"""
     return TransactionRepository(db).get_agent_transactions(
-        user.office_id, initials, start_date, end_date
+        user.office_id, initials, start_date, end_date, limit
     )
 
 
-@router.post("/transaction", response_model=protocol.TransactionResponse, status_code=201)
 def request_transaction(
     *,
     user: Annotated[KcUser, Security(check_authorization, scopes=[])],
@@ -77,11 +154,56 @@ def request_transaction(
     return repo.request_for_approval(user, usr_input)
 
 
-@router.post(
-    "/transaction/{transaction_code}/review",
+async def a_request_transaction(
+    *,
+    user: Annotated[KcUser, Security(check_authorization, scopes=[])],
+    usr_input: protocol.TransactionRequest,
+    db: AsyncDBSessionDep,
+) -> protocol.TransactionResponse:
+    """request a transaction for approval, this will just created the transaction in the db"""
+    return await TransactionRepository(db).a_request_for_approval(user, usr_input)
+
+
+transaction_route(
+    "POST",
+    "/transaction",
+    request_transaction,
+    a_request_transaction,
     response_model=protocol.TransactionResponse,
-    status_code=200,
+    status_code=201,
 )
+
+
+def request_transactions(
+    *,
+    user: Annotated[KcUser, Security(check_authorization, scopes=[])],
+    usr_input: List[protocol.TransactionRequest],
+    db: Session = Depends(get_db),
+) -> List[protocol.TransactionResponse]:
+    """request a batch of transactions for approval, all of them are created or none"""
+    return TransactionRepository(db).request_batch(user, usr_input)
+
+
+async def a_request_transactions(
+    *,
+    user: Annotated[KcUser, Security(check_authorization, scopes=[])],
+    usr_input: List[protocol.TransactionRequest],
+    db: AsyncDBSessionDep,
+) -> List[protocol.TransactionResponse]:
+    """request a batch of transactions for approval, all of them are created or none"""
+    return await TransactionRepository(db).a_request_batch(user, usr_input)
+
+
+transaction_route(
+    "POST",
+    "/transactions",
+    request_transactions,
+    a_request_transactions,
+    response_model=List[protocol.TransactionResponse],
+    status_code=201,
+)
+
+
 def review_transaction(
     *,
     user: Annotated[KcUser, Security(check_authorization, scopes=["office_admin"])],
@@ -95,7 +217,27 @@ def review_transaction(
     return reviewed
 
 
-@router.put("/transaction/{code}")
+async def a_review_transaction(
+    *,
+    user: Annotated[KcUser, Security(check_authorization, scopes=["office_admin"])],
+    transaction_code: str,
+    usr_input: protocol.TransactionReviewReq,
+    db: AsyncDBSessionDep,
+) -> protocol.TransactionResponse:
+    """review a transaction request"""
+    return await TransactionRepository(db).a_review_transaction(transaction_code, user, usr_input)
+
+
+transaction_route(
+    "POST",
+    "/transaction/{transaction_code}/review",
+    review_transaction,
+    a_review_transaction,
+    response_model=protocol.TransactionResponse,
+    status_code=200,
+)
+
+
 def update_transaction(
     *,
     user: Annotated[KcUser, Security(check_authorization, scopes=[])],
@@ -107,6 +249,20 @@ def update_transaction(
     return TransactionRepository(db).update_transaction(user, code, usr_input)
 
 
+async def a_update_transaction(
+    *,
+    user: Annotated[KcUser, Security(check_authorization, scopes=[])],
+    code: str,
+    usr_input: protocol.TransactionRequest,
+    db: AsyncDBSessionDep,
+) -> protocol.TransactionResponse:
+    """update a transaction"""
+    return await TransactionRepository(db).a_update_transaction(user, code, usr_input)
+
+
+transaction_route("PUT", "/transaction/{code}", update_transaction, a_update_transaction)
+
+
 @router.post(
     "/transaction/{code}/pay",
     response_model=protocol.PaymentResponse,
@@ -123,9 +279,6 @@ async def add_payment(
     return await TransactionRepository(db).add_payment(user, code, usr_input)
 
 
-@router.delete(
-    "/transaction/{code}/cancel", response_model=protocol.TransactionResponse, status_code=200
-)
 def cancel_transaction(
     *,
     user: Annotated[KcUser, Security(check_authorization, scopes=["office_admin"])],
@@ -136,6 +289,26 @@ def cancel_transaction(
     return TransactionRepository(db).cancel_transaction(user, code, usr_input)
 
 
+async def a_cancel_transaction(
+    *,
+    user: Annotated[KcUser, Security(check_authorization, scopes=["office_admin"])],
+    code: str,
+    usr_input: protocol.CancelTransaction,
+    db: AsyncDBSessionDep,
+) -> protocol.TransactionResponse:
+    return await TransactionRepository(db).a_cancel_transaction(user, code, usr_input)
+
+
+transaction_route(
+    "DELETE",
+    "/transaction/{code}/cancel",
+    cancel_transaction,
+    a_cancel_transaction,
+    response_model=protocol.TransactionResponse,
+    status_code=200,
+)
+
+
 @router.get(
     "/transaction/{code}",
     response_model=TransactionWithDetails,
@@ -154,7 +327,6 @@ async def get_office_transactions_with_details(
     )
 
 
-@router.post("/payment/{id}/cancel", response_model=protocol.PaymentResponse, status_code=200)
 def cancel_payment(
     *,
     user: Annotated[KcUser, Security(check_authorization, scopes=["office_admin"])],
@@ -165,6 +337,26 @@ def cancel_payment(
     return TransactionRepository(db).cancel_payment(user, id, request)
 
 
+async def a_cancel_payment(
+    *,
+    user: Annotated[KcUser, Security(check_authorization, scopes=["office_admin"])],
+    id: str,
+    request: protocol.CancelTransaction,
+    db: AsyncDBSessionDep,
+) -> protocol.PaymentResponse:
+    return await TransactionRepository(db).a_cancel_payment(user, id, request)
+
+
+transaction_route(
+    "POST",
+    "/payment/{id}/cancel",
+    cancel_payment,
+    a_cancel_payment,
+    response_model=protocol.PaymentResponse,
+    status_code=200,
+)
+
+
 @router.post("/groupPay/forex", response_model=protocol.GroupPayResponse, status_code=201)
 async def group_pay(
     *,
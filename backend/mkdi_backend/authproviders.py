@@ -1,4 +1,6 @@
+import asyncio
 import functools
+import time
 
 from keycloak import KeycloakAdmin, KeycloakOpenID
 from keycloak.exceptions import KeycloakAuthenticationError
@@ -6,6 +8,8 @@ from loguru import logger
 from mkdi_backend.config import settings
 from mkdi_backend.models.models import KcUser
 from mkdi_backend.models.roles import Role
+from mkdi_backend.utils.cache import TTLCache
+from mkdi_backend.utils.jwks import JwksKeyCache
 from mkdi_shared.schemas import protocol
 
 # This actually does the auth checks
@@ -18,6 +22,29 @@ keycloak_openid = KeycloakOpenID(
     verify=settings.ENV == "production" and settings.KC_VERIFY_CERTS,  # True if not in development
 )
 
+# realm signing keys, fetched on first use and refreshed in the background
+jwks_cache = JwksKeyCache(
+    keycloak_openid,
+    ttl=settings.KC_JWKS_CACHE_TTL,
+    min_refresh_interval=settings.KC_JWKS_MIN_REFRESH_INTERVAL,
+)
+
+
+# KcUser resolved from a token, keyed by the token subject
+user_cache = TTLCache(maxsize=settings.USER_CACHE_SIZE, ttl=settings.USER_CACHE_TTL)
+
+
+def invalidate_cached_user(employee_id) -> None:
+    """Drop the cached identity of an employee after it has been modified."""
+    user_cache.invalidate_where(lambda user: user.user_db_id == str(employee_id))
+
+
+def token_claims_to_check() -> dict:
+    """Claims every access token must carry besides a valid signature and expiry."""
+    if settings.KC_TOKEN_AUDIENCE:
+        return {"aud": settings.KC_TOKEN_AUDIENCE}
+    return {"azp": settings.KC_CLIENT_ID}
+
 
 def refresh_keycloak_token(func):
     @functools.wraps(func)
@@ -80,51 +107,137 @@ class KeycloakAdminHelper:
         return self._kc_admin
 
 
-class RoleProvider:
-    filter_roles = ["offline_access", "uma_authorization", "default-roles-mwague"]
+# shared admin client, the admin login happens on the first admin call
+kc_admin_helper = KeycloakAdminHelper()
 
-    def __init__(self, helper=None):
-        self.keycloak_helper = KeycloakAdminHelper() if not helper else helper
-        self.realm_roles = []
-        self.roles = []
 
-        self.get_roles()
+class RoleCatalog:
+    """Weighted realm roles, shared by the whole process.
 
-    def get_roles(self) -> list[Role]:
-        if len(self.realm_roles) == 0:
-            self.roles = list()
-            self.realm_roles = self.keycloak_helper.get_kc_admin().get_realm_roles()
+    Nothing is fetched at import time. The catalog is loaded on first use with a single
+    admin call (the full representation already carries the role attributes) and is
+    reloaded in the background once it is older than ``refresh_interval`` seconds.
+    """
 
-            for r in self.realm_roles:
-                r_with_attr = self._get_role(role_name=r["name"])
+    def __init__(self, helper: KeycloakAdminHelper = None, refresh_interval: int = 300):
+        self.keycloak_helper = helper if helper else kc_admin_helper
+        self.refresh_interval = refresh_interval
+        self.realm_roles: list[dict] = []
+        self.roles: list[Role] = []
+        self._loaded_at: float | None = None
+        self._lock = asyncio.Lock()
+        self._refresh_task: asyncio.Task | None = None
 
-                if (
-                    "weight" in r_with_attr["attributes"]
-                    and len(r_with_attr["attributes"]["weight"]) == 1
-                ):
-                    self.roles.append(Role.from_number(int(r_with_attr["attributes"]["weight"][0])))
+    @property
+    def loaded(self) -> bool:
+        return self._loaded_at is not None
 
-        return self.roles
+    def _is_stale(self) -> bool:
+        return self.loaded and time.monotonic() - self._loaded_at > self.refresh_interval
 
-    def _get_role(self, role_name):
-        return self.keycloak_helper.get_kc_admin().get_realm_role(role_name=role_name)
+    def _set(self, realm_roles: list[dict]):
+        roles = []
+        for r in realm_roles:
+            weight = (r.get("attributes") or {}).get("weight", [])
+            if len(weight) == 1:
+                roles.append(Role.from_number(int(weight[0])))
 
-    def update_user_roles(self, account_id: str, roles: list[str]) -> list[str]:
+        self.realm_roles = realm_roles
+        self.roles = roles
+        self._loaded_at = time.monotonic()
+
+    def load(self) -> None:
+        """blocking load, for sync callers running in the threadpool"""
         kc_admin = self.keycloak_helper.get_kc_admin()
-        # filter self.roles by roles
+        self._set(kc_admin.get_realm_roles(brief_representation=False))
+
+    async def a_load(self) -> None:
+        async with self._lock:
+            # loaded by the request that held the lock before us
+            if self.loaded and not self._is_stale():
+                return
+            kc_admin = self.keycloak_helper.get_kc_admin()
+            self._set(await kc_admin.a_get_realm_roles(brief_representation=False))
+
+    async def _background_refresh(self) -> None:
+        try:
+            await self.a_load()
+        except Exception as e:
+            logger.error(f"Failed to refresh realm roles {e}")
+
+    async def a_ensure_loaded(self) -> "RoleCatalog":
+        if not self.loaded:
+            await self.a_load()
+        elif self._is_stale() and (self._refresh_task is None or self._refresh_task.done()):
+            self._refresh_task = asyncio.create_task(self._background_refresh())
+        return self
+
+    def ensure_loaded(self) -> "RoleCatalog":
+        if not self.loaded or self._is_stale():
+            self.load()
+        return self
+
+    def get_roles(self) -> list[Role]:
+        return self.ensure_loaded().roles
+
+    def get_realm_roles(self) -> list[dict]:
+        return self.ensure_loaded().realm_roles
+
+    def is_known(self, role: str) -> bool:
+        """check that a role is a weighted realm role, falls back to the Role enum until loaded"""
+        if not Role.is_valid(role):
+            return False
+        return not self.loaded or Role.from_str(role) in self.roles
+
 
+role_catalog = RoleCatalog(refresh_interval=settings.KC_ROLES_REFRESH_INTERVAL)
+
+
+class RoleProvider:
+    filter_roles = ["offline_access", "uma_authorization", "default-roles-mwague"]
+
+    def __init__(self, helper=None, catalog: RoleCatalog = None):
+        self.keycloak_helper = helper if helper else kc_admin_helper
+        self.catalog = catalog if catalog else role_catalog
+
+    @property
+    def realm_roles(self) -> list[dict]:
+        return self.catalog.get_realm_roles()
+
+    def get_roles(self) -> list[Role]:
+        return self.catalog.get_roles()
+
+    def _split_roles(self, realm_roles: list[dict], roles: list[str]):
         roles_to_remove = list()
         assigned_roles = list()
 
-        for r in self.realm_roles:
+        for r in realm_roles:
             if not r["name"] in roles:
                 roles_to_remove.append(r)
             elif Role.is_valid(r["name"]):
                 assigned_roles.append(r)
 
+        return roles_to_remove, assigned_roles
+
+    def update_user_roles(self, account_id: str, roles: list[str]) -> list[str]:
+        kc_admin = self.keycloak_helper.get_kc_admin()
+        roles_to_remove, assigned_roles = self._split_roles(self.realm_roles, roles)
+
         if len(assigned_roles) == 0:
             return []
 
         kc_admin.delete_realm_roles_of_user(account_id, roles_to_remove)
         kc_admin.assign_realm_roles(account_id, assigned_roles)
         return [role["name"] for role in assigned_roles]
+
+    async def a_update_user_roles(self, account_id: str, roles: list[str]) -> list[str]:
+        kc_admin = self.keycloak_helper.get_kc_admin()
+        await self.catalog.a_ensure_loaded()
+        roles_to_remove, assigned_roles = self._split_roles(self.catalog.realm_roles, roles)
+
+        if len(assigned_roles) == 0:
+            return []
+
+        await kc_admin.a_delete_realm_roles_of_user(account_id, roles_to_remove)
+        await kc_admin.a_assign_realm_roles(account_id, assigned_roles)
+        return [role["name"] for role in assigned_roles]
@@ -30,6 +30,21 @@ class Settings(BaseSettings):
     DATABASE_URI: Optional[PostgresDsn] = None
     DATABASE_ASYNC_URI: Optional[PostgresDsn] = None
     DATABASE_MAX_TX_RETRY_COUNT: int = 3
+    # a transaction that lost against a concurrent one runs again after a random delay, up to
+    # DATABASE_TX_RETRY_BASE_DELAY * 2 ** attempt and at most DATABASE_TX_RETRY_MAX_DELAY
+    DATABASE_TX_RETRY_BASE_DELAY: float = 0.05  # seconds
+    DATABASE_TX_RETRY_MAX_DELAY: float = 1.0  # seconds
+    # no new attempt once it would start this long after the call
+    DATABASE_TX_RETRY_DEADLINE: float = 5.0  # seconds
+    # transaction write routes served by their sync implementation in the threadpool,
+    # among request_transaction, request_transactions, review_transaction, update_transaction,
+    # cancel_transaction and cancel_payment, the others run on the async session
+    SYNC_TRANSACTION_ROUTES: List[str] = []
+    # requests accepted by a single call of the batch request route
+    TRANSACTIONS_BATCH_MAX_SIZE: int = 1000
+    # pay the transactions of a group payment in one database transaction, with one invariant
+    # check, instead of one managed transaction per payment
+    GROUP_PAY_BATCHED: bool = True
     # KEYCLOAK configuration
     KC_REALM = "mwague"
     KC_TOKEN_URL = "http://localhost.auth.com:8443/auth/realms/mwague/protocol/openid-connect/token"
@@ -45,6 +60,17 @@ class Settings(BaseSettings):
     KC_ADMIN_CLIENT_ID = "admin-cli"
     KC_ADMIN_USER = "kcadmincli"
     KC_ADMIN_PASSWORD = "mwague"
+    # access tokens are verified locally against the realm JWKS
+    KC_JWKS_CACHE_TTL: int = 300  # seconds
+    KC_JWKS_MIN_REFRESH_INTERVAL: int = 10  # seconds, rate limit for unknown key ids
+    # expected "aud" claim, when unset the token must have been issued to KC_CLIENT_ID (azp)
+    KC_TOKEN_AUDIENCE: Optional[str] = None
+    # also ask keycloak whether the token was revoked, costs a round trip per request
+    KC_INTROSPECT_TOKENS: bool = False
+    KC_ROLES_REFRESH_INTERVAL: int = 300  # seconds
+    # resolved users, keyed by token subject
+    USER_CACHE_SIZE: int = 1024
+    USER_CACHE_TTL: int = 60  # seconds
     DATABASE_POOL_SIZE = 75
     DATABASE_MAX_OVERFLOW = 20
     RATE_LIMIT: bool = True
@@ -52,7 +78,19 @@ class Settings(BaseSettings):
     REDIS_HOST: str = "localhost"
     REDIS_PORT: str = "6379"
 
+    # keyset pagination of the office transactions
+    TRANSACTIONS_PAGE_SIZE: int = 100
+    TRANSACTIONS_MAX_PAGE_SIZE: int = 500
+    # rows fetched per round trip by the streamed exports
+    EXPORT_BATCH_SIZE: int = 1000
+    # reports of closed periods are kept in the report_cache table
+    REPORT_CACHE: bool = True
+    REPORT_CACHE_TTL: int = 7 * 24 * 3600  # seconds
+
     INVARIANT_TOLERANCE = 0.5
+    # recompute the office totals from the accounts/wallets tables instead of
+    # reading the running totals, slower but useful to track a drift
+    INVARIANT_VERIFY_TOTALS: bool = False
 
     DEBUG_USE_SEED_DATA: bool = False
     DEBUG_USE_SEED_DATA_PATH: Optional[FilePath] = (
@@ -116,7 +154,7 @@ class Settings(BaseSettings):
     RATE_LIMIT_PROMPTER_USER_MINUTES: int = 2
 
     TASK_VALIDITY_MINUTES: int = 60 * 24 * 2  # tasks expire after 2 days
-    TASK_CREATE_REPORTS_INTERVAL: int = 1 * 1  # 6 hours
+    TASK_CREATE_REPORTS_INTERVAL: int = 6 * 60  # 6 hours
     TASK_UPDATE_REPORTS_INTERVAL: int = 1 * 1  # 1 min
 
     class Config:
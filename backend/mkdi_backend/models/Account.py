@@ -8,11 +8,13 @@ from sqlmodel import Field
 from datetime import datetime
 from decimal import Decimal
 from mkdi_backend.models.get_account_pendings import (
+    get_account_effective_balance,
     get_account_pendings,
     get_account_pendings_in,
     get_accounts_pendings_out,
 )
 from sqlalchemy.ext.hybrid import hybrid_property
+from sqlalchemy.orm import declared_attr
 from pydantic import root_validator
 
 
@@ -30,8 +32,10 @@ class Account(AccountBase, table=True):
 
     owner_id: UUID
     is_open: bool = Field(default=True)
+    # incremented by every update, an update of a stale account raises StaleDataError
     version: int = Field(default=1)
 
+    # codes are numbered by the account code sequence, see models.codes
     counter: int = Field(default=0, nullable=True)
 
     created_by: UUID = Field(foreign_key="employees.id")
@@ -39,9 +43,11 @@ class Account(AccountBase, table=True):
     office_id: UUID = Field(foreign_key="offices.id")
     pendings_in: ClassVar[Decimal] = hybrid_property(get_account_pendings_in)
     pendings_out: ClassVar[Decimal] = hybrid_property(get_accounts_pendings_out)
-    effective_balance: ClassVar[Decimal] = hybrid_property(
-        lambda cls: cls.balance + cls.pendings_in - cls.pendings_out
-    )
+    effective_balance: ClassVar[Decimal] = hybrid_property(get_account_effective_balance)
+
+    @declared_attr
+    def __mapper_args__(cls):
+        return {"version_id_col": cls.__table__.c.version}
 
 
 class AccountMonthlyReport(AccountMonthlyReportBase, table=True):
@@ -58,6 +64,8 @@ class AccountMonthlyReport(AccountMonthlyReportBase, table=True):
     account_id: UUID = Field(foreign_key="accounts.id")
     # last updated at
     updated_at: datetime = Field(default=datetime.now())
+    # version of the account at the last update, the reconciler refreshes the reports behind
+    account_version: Optional[int] = Field(default=None, nullable=True)
 
     pendings: ClassVar[Decimal] = hybrid_property(get_account_pendings)
 
@@ -1,9 +1,13 @@
 from .Account import Account, AccountMonthlyReport
+from . import account_report  # noqa: F401, keeps the open reports up to date
+from . import codes  # noqa: F401, creates the code sequences of new accounts and wallets
 from .Activity import Activity
 from .Agent import Agent
 from .employee import Employee
 from .office import Office
+from .office_balance import OfficeBalance
 from .organization import Organization
+from .report_cache import ReportCache, ReportCacheGeneration
 from .transactions.transactions import (
     Deposit,
     Internal,
@@ -17,10 +21,13 @@ from .transactions.transactions import (
 __all__ = [
     "Organization",
     "Office",
+    "OfficeBalance",
     "Employee",
     "Agent",
     "Account",
     "AccountMonthlyReport",
+    "ReportCache",
+    "ReportCacheGeneration",
     "Activity",
     "Internal",
     "Deposit",
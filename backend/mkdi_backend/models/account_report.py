@@ -0,0 +1,110 @@
+"""Open monthly reports follow the effective balance of their account."""
+
+from datetime import datetime
+from itertools import chain
+
+import sqlalchemy as sa
+from mkdi_backend.models.Account import Account, AccountMonthlyReport
+from mkdi_backend.models.get_account_pendings import pendings_query
+from mkdi_backend.models.transactions.transactions import (
+    Deposit,
+    External,
+    ForEx,
+    Internal,
+    Sending,
+    WalletTrading,
+)
+from mkdi_shared.schemas import protocol as pr
+from sqlalchemy.orm import Session as OrmSession
+from sqlmodel import func, select
+
+# columns holding the initials of the accounts whose pendings a transaction counts in
+TRANSACTION_ACCOUNTS = {
+    Deposit: ("owner_initials",),
+    Internal: ("sender_initials", "receiver_initials"),
+    Sending: ("receiver_initials",),
+    External: ("sender_initials",),
+    ForEx: ("customer_account",),
+    WalletTrading: ("account",),
+}
+
+
+def effective_balances(accounts):
+    """Effective balance of a set of accounts, pendings included, in a single query.
+
+    Args:
+        accounts (list[str] | Select): the initials of the accounts, or a select of them
+
+    Returns:
+        Select: (account_id, account, version, effective_balance) rows
+    """
+    pendings = pendings_query(accounts).subquery()
+    return (
+        select(
+            Account.id.label("account_id"),
+            Account.initials.label("account"),
+            Account.version.label("version"),
+            (
+                Account.balance
+                + func.coalesce(pendings.c.pendings_in, 0)
+                - func.coalesce(pendings.c.pendings_out, 0)
+            ).label("effective_balance"),
+        )
+        .outerjoin(pendings, pendings.c.initials == Account.initials)
+        .where(Account.initials.in_(accounts))
+    )
+
+
+def refresh_open_reports(accounts):
+    """UPDATE statement setting the end balance of the open reports of the given accounts"""
+    balances = effective_balances(accounts).cte("balances")
+    return (
+        sa.update(AccountMonthlyReport)
+        .where(AccountMonthlyReport.account_id == balances.c.account_id)
+        .where(AccountMonthlyReport.is_open == True)  # noqa: E712
+        .values(
+            end_balance=balances.c.effective_balance,
+            account_version=balances.c.version,
+            updated_at=datetime.now(),
+        )
+    )
+
+
+def _changed(obj, attr: str) -> bool:
+    return sa.inspect(obj).attrs[attr].history.has_changes()
+
+
+def track_account_reports(session: OrmSession, flush_context) -> None:
+    """after_flush hook refreshing the open reports of the accounts touched by the flush
+
+    An account is touched when its balance changes, or when one of its transactions is
+    created pending, changes state or is deleted, which changes its pendings.
+    """
+    touched = set()
+    objects = chain(
+        ((obj, True, False) for obj in session.new),
+        ((obj, False, False) for obj in session.dirty),
+        ((obj, False, True) for obj in session.deleted),
+    )
+    for obj, is_new, is_deleted in objects:
+        if isinstance(obj, Account):
+            if not is_new and _changed(obj, "balance"):
+                touched.add(obj.initials)
+            continue
+
+        columns = TRANSACTION_ACCOUNTS.get(type(obj))
+        if not columns:
+            continue
+        if is_new:
+            changed = obj.state == pr.TransactionState.PENDING
+        else:
+            changed = is_deleted or _changed(obj, "state")
+        if changed:
+            touched.update(getattr(obj, column) for column in columns)
+
+    touched.discard(None)
+    if touched:
+        session.connection().execute(refresh_open_reports(sorted(touched)))
+
+
+sa.event.listen(OrmSession, "after_flush", track_account_reports)
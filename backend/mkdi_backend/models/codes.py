@@ -0,0 +1,66 @@
+"""Transaction codes are numbered by a postgres sequence per account and per wallet.
+
+nextval never waits for another transaction, requests of an office no longer queue on the
+row of the account holding the balance to number their codes. A request rolled back leaves a
+gap in the numbers.
+"""
+
+import hashlib
+from datetime import datetime
+from typing import Dict
+
+import sqlalchemy as sa
+from mkdi_backend.models.Account import Account
+from mkdi_backend.models.office import OfficeWallet
+from sqlalchemy.orm import Session as OrmSession
+from sqlmodel import func, select, union_all
+
+
+def account_code_sequence(account_id) -> str:
+    """name of the sequence numbering the codes of an account"""
+    return f"account_code_{account_id.hex}"
+
+
+def wallet_code_sequence(wallet_id: str) -> str:
+    """name of the sequence numbering the codes of a wallet, wallet ids are free text"""
+    return f"wallet_code_{hashlib.md5(wallet_id.encode()).hexdigest()}"
+
+
+def next_code_number(sequence: str):
+    """select of the next number of a code sequence"""
+    return select(func.nextval(sequence))
+
+
+def next_code_numbers(counts: Dict[str, int]):
+    """select of the next ``count`` numbers of every code sequence, as (sequence, number) rows"""
+    return union_all(
+        *(
+            select(
+                sa.literal(sequence).label("sequence"), func.nextval(sequence).label("number")
+            ).select_from(func.generate_series(1, count))
+            for sequence, count in counts.items()
+        )
+    )
+
+
+def format_code(initials: str, number: int) -> str:
+    """code of a transaction, the initials, the month and the number"""
+    return f"{initials}{datetime.now().strftime('%m')}{number:03}"
+
+
+def create_code_sequences(session: OrmSession, flush_context) -> None:
+    """after_flush hook creating the code sequences of the new accounts and wallets"""
+    sequences = []
+    for obj in session.new:
+        if isinstance(obj, Account):
+            sequences.append(account_code_sequence(obj.id))
+        elif isinstance(obj, OfficeWallet):
+            sequences.append(wallet_code_sequence(obj.walletID))
+
+    if sequences:
+        connection = session.connection()
+        for sequence in sequences:
+            connection.execute(sa.schema.CreateSequence(sa.Sequence(sequence), if_not_exists=True))
+
+
+sa.event.listen(OrmSession, "after_flush", create_code_sequences)
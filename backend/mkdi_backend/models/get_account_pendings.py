@@ -9,7 +9,9 @@ from mkdi_backend.models.transactions.transactions import (
     Deposit,
     WalletTrading,
 )
-from sqlmodel import select, func, Session, or_
+import sqlalchemy as sa
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlmodel import select, func, Session, union_all
 from mkdi_backend.utils.database import engine
 from mkdi_shared.schemas import protocol as pr
 
@@ -37,67 +39,75 @@ def get_account_pendings(initials: str) -> Decimal:
         return (external or 0) + (forexs or 0) - (sendings or 0)
 
 
-def get_account_pendings_in(cls) -> Decimal:
+def _pendings(initials_column, amount, initials: list[str], is_out: bool):
+    """pending transactions of one type, as (initials, amount_in, amount_out) rows"""
+    table = initials_column.class_
+    return select(
+        initials_column.label("initials"),
+        (sa.literal(0) if is_out else amount).label("amount_in"),
+        (amount if is_out else sa.literal(0)).label("amount_out"),
+    ).where(table.state == pr.TransactionState.PENDING, initials_column.in_(initials))
+
+
+def pendings_query(initials):
+    """Pending in/out totals of a list of accounts, grouped in a single query.
+
+    Args:
+        initials (list[str] | Select): the initials of the accounts, or a select of them
+
+    Returns:
+        Select: (initials, pendings_in, pendings_out) rows, accounts without any
+        pending transaction are missing from the result.
+    """
+    rows = union_all(
+        # pendings in
+        _pendings(Deposit.owner_initials, Deposit.amount, initials, False),
+        _pendings(Internal.receiver_initials, Internal.amount, initials, False),
+        _pendings(Sending.receiver_initials, Sending.amount, initials, False),
+        # pendings out
+        _pendings(External.sender_initials, External.amount, initials, True),
+        _pendings(Internal.sender_initials, Internal.amount, initials, True),
+        _pendings(ForEx.customer_account, ForEx.selling_amount, initials, True),
+        _pendings(WalletTrading.account, WalletTrading.trading_amount, initials, True).where(
+            WalletTrading.trading_type.in_([pr.TradingType.SIMPLE_SELL, pr.TradingType.SELL])
+        ),
+    ).subquery()
+
+    return select(
+        rows.c.initials,
+        func.sum(rows.c.amount_in).label("pendings_in"),
+        func.sum(rows.c.amount_out).label("pendings_out"),
+    ).group_by(rows.c.initials)
+
+
+def get_accounts_pendings(session: Session, initials: list[str]) -> dict[str, tuple]:
+    """Pending (in, out) totals by account initials"""
+    if not initials:
+        return {}
+    rows = session.execute(pendings_query(initials)).all()
+    return {row.initials: (Decimal(row.pendings_in), Decimal(row.pendings_out)) for row in rows}
+
+
+async def a_get_accounts_pendings(session: AsyncSession, initials: list[str]) -> dict[str, tuple]:
+    if not initials:
+        return {}
+    rows = (await session.execute(pendings_query(initials))).all()
+    return {row.initials: (Decimal(row.pendings_in), Decimal(row.pendings_out)) for row in rows}
+
+
+def _get_pendings(initials: str) -> tuple:
     with Session(engine) as session:
-        deposits = session.scalar(
-            select(func.sum(Deposit.amount))
-            .where(Deposit.state == pr.TransactionState.PENDING)
-            .where(Deposit.owner_initials == cls.initials)
-        )
-
-        internals = session.scalar(
-            select(func.sum(Internal.amount))
-            .where(Internal.state == pr.TransactionState.PENDING)
-            .where(Internal.receiver_initials == cls.initials)
-        )
-
-        sendings = session.scalar(
-            select(func.sum(Sending.amount))
-            .where(Sending.state == pr.TransactionState.PENDING)
-            .where(Sending.receiver_initials == cls.initials)
-        )
+        return get_accounts_pendings(session, [initials]).get(initials, (Decimal(0), Decimal(0)))
 
-        ins = (deposits or 0) + (sendings or 0) + (internals or 0)
-        return Decimal(ins)
+
+def get_account_pendings_in(cls) -> Decimal:
+    return _get_pendings(cls.initials)[0]
 
 
 def get_accounts_pendings_out(cls) -> Decimal:
-    with Session(engine) as session:
-        external = session.scalar(
-            select(func.sum(External.amount))
-            .where(External.state == pr.TransactionState.PENDING)
-            .where(External.sender_initials == cls.initials)
-        )
+    return _get_pendings(cls.initials)[1]
 
-        internals = session.scalar(
-            select(func.sum(Internal.amount))
-            .where(Internal.state == pr.TransactionState.PENDING)
-            .where(Internal.sender_initials == cls.initials)
-        )
 
-        forexs = session.scalar(
-            select(func.sum(ForEx.selling_amount))
-            .where(ForEx.state == pr.TransactionState.PENDING)
-            .where(ForEx.customer_account == cls.initials)
-        )
-
-        # get simple sell pendings where the account match
-        simple_sells = session.scalars(
-            select(WalletTrading)
-            .where(
-                or_(
-                    WalletTrading.trading_type == pr.TradingType.SIMPLE_SELL,
-                    WalletTrading.trading_type == pr.TradingType.SELL,
-                )
-            )
-            .where(WalletTrading.state == pr.TransactionState.PENDING)
-            .where(WalletTrading.account == cls.initials)
-        ).all()
-
-        simple_sell_totals = 0
-        if simple_sells:
-            for sell in simple_sells:
-                simple_sell_totals += sell.trading_amount
-
-        out = (external or 0) + (forexs or 0) + (internals or 0) + simple_sell_totals
-        return Decimal(out)
+def get_account_effective_balance(cls) -> Decimal:
+    pendings_in, pendings_out = _get_pendings(cls.initials)
+    return cls.balance + pendings_in - pendings_out
@@ -1,6 +1,5 @@
 """Office model."""
 
-from datetime import datetime
 from typing import Optional, List, ClassVar
 from uuid import UUID, uuid4
 
@@ -8,130 +7,183 @@ import sqlalchemy as sa
 from sqlalchemy.ext.mutable import MutableList
 import sqlalchemy.dialects.postgresql as pg
 from sqlalchemy.ext.hybrid import hybrid_property
+from sqlalchemy.orm import declared_attr
 from mkdi_shared.schemas.protocol import OfficeBase, CryptoWalletBase
-from sqlmodel import Field, Relationship, Session, select, and_, or_
+from sqlmodel import Field, Relationship, Session, select, and_, or_, func, union_all
 from decimal import Decimal
 from mkdi_backend.models.transactions.transactions import WalletTrading
 from mkdi_shared.schemas import protocol as pr
 from mkdi_backend.database import engine
-from functools import reduce
 
 
-def in_reducer(acc: Decimal, tr: WalletTrading):
-    amount = tr.amount
-    if tr.trading_type == pr.TradingType.EXCHANGE_WITH_SIMPLE_WALLET:
-        amount = tr.amount * (tr.exchange_rate / tr.trading_rate) if tr.trading_rate else 0
-
-    return acc + Decimal(amount)
-
-
-def out_reducer(acc: Decimal, tr: WalletTrading):
-    amount = tr.amount
-
-    return acc + Decimal(amount)
+def _exchange_in_amount():
+    """amount a simple wallet receives from an exchange, converted with the exchange rate"""
+    return sa.case(
+        (
+            func.coalesce(WalletTrading.trading_rate, 0) != 0,
+            WalletTrading.amount * (WalletTrading.exchange_rate / WalletTrading.trading_rate),
+        ),
+        else_=0,
+    )
 
 
-def get_pending_in(self) -> Decimal:
-    """Get the pending in amount"""
-    with Session(engine) as db:
-        condition = None
-        if self.wallet_type == pr.WalletType.SIMPLE:
-            condition = or_(
-                and_(
-                    WalletTrading.walletID == self.walletID,
-                    WalletTrading.trading_type == pr.TradingType.DEPOSIT,
+def _wallet_pendings(wallet_column, amount, condition, column: str):
+    """trades of the given wallets as (wallet_id, pending_in, pending_out, pending_payment) rows"""
+    columns = {
+        name: (amount if name == column else sa.literal(0)).label(name)
+        for name in ("pending_in", "pending_out", "pending_payment")
+    }
+    return select(wallet_column.label("wallet_id"), *columns.values()).where(condition)
+
+
+def wallet_pendings_query(wallet_ids: list[str]):
+    """Pending in/out and payment totals of a list of wallets, grouped in a single query.
+
+    The trades are joined to their wallet, so simple and crypto wallets of the same list
+    each get their own rules.
+
+    Args:
+        wallet_ids (list[str]): the ids of the wallets
+
+    Returns:
+        Select: (wallet_id, pending_in, pending_out, pending_payment) rows, wallets without
+        any trade are missing from the result.
+    """
+    is_simple = OfficeWallet.wallet_type == pr.WalletType.SIMPLE
+    # wallets created before the wallet type existed are crypto wallets
+    is_crypto = OfficeWallet.wallet_type.is_distinct_from(pr.WalletType.SIMPLE)
+    trading_type = WalletTrading.trading_type
+    is_pending = WalletTrading.state == pr.TransactionState.PENDING
+    by_wallet = OfficeWallet.walletID == WalletTrading.walletID
+    by_exchange_wallet = OfficeWallet.walletID == WalletTrading.exchange_walletID
+
+    rows = union_all(
+        # deposits and buys into the wallet
+        _wallet_pendings(
+            WalletTrading.walletID,
+            WalletTrading.amount,
+            and_(
+                is_pending,
+                WalletTrading.walletID.in_(wallet_ids),
+                or_(
+                    trading_type == pr.TradingType.DEPOSIT,
+                    and_(is_crypto, trading_type == pr.TradingType.BUY),
                 ),
-                and_(
-                    WalletTrading.trading_type == pr.TradingType.EXCHANGE_WITH_SIMPLE_WALLET,
-                    WalletTrading.exchange_walletID == self.walletID,
+            ),
+            "pending_in",
+        ).join(OfficeWallet, by_wallet),
+        # exchanges from another wallet
+        _wallet_pendings(
+            WalletTrading.exchange_walletID,
+            sa.case(
+                (
+                    trading_type == pr.TradingType.EXCHANGE_WITH_SIMPLE_WALLET,
+                    _exchange_in_amount(),
                 ),
-            )
-        else:
-            condition = or_(
-                and_(
-                    WalletTrading.walletID == self.walletID,
-                    WalletTrading.trading_type == pr.TradingType.BUY,
+                else_=WalletTrading.amount,
+            ),
+            and_(
+                is_pending,
+                WalletTrading.exchange_walletID.in_(wallet_ids),
+                or_(
+                    and_(is_simple, trading_type == pr.TradingType.EXCHANGE_WITH_SIMPLE_WALLET),
+                    and_(is_crypto, trading_type == pr.TradingType.EXCHANGE),
                 ),
-                and_(
-                    WalletTrading.walletID == self.walletID,
-                    WalletTrading.trading_type == pr.TradingType.DEPOSIT,
+            ),
+            "pending_in",
+        ).join(OfficeWallet, by_exchange_wallet),
+        # sells and exchanges out of the wallet
+        _wallet_pendings(
+            WalletTrading.walletID,
+            WalletTrading.amount,
+            and_(
+                is_pending,
+                WalletTrading.walletID.in_(wallet_ids),
+                or_(
+                    and_(is_simple, trading_type == pr.TradingType.SIMPLE_SELL),
+                    and_(
+                        is_crypto,
+                        trading_type.in_(
+                            [
+                                pr.TradingType.SELL,
+                                pr.TradingType.EXCHANGE,
+                                pr.TradingType.EXCHANGE_WITH_SIMPLE_WALLET,
+                            ]
+                        ),
+                    ),
                 ),
-                # or the trading type is Exchange with crypto and the exchange wallet ID maches the current wallet
-                and_(
-                    WalletTrading.trading_type == pr.TradingType.EXCHANGE,
-                    WalletTrading.exchange_walletID == self.walletID,
+            ),
+            "pending_out",
+        ).join(OfficeWallet, by_wallet),
+        # trades not paid to the partner yet
+        _wallet_pendings(
+            WalletTrading.walletID,
+            WalletTrading.amount,
+            and_(
+                WalletTrading.partner_paid == False,
+                WalletTrading.walletID.in_(wallet_ids),
+                WalletTrading.state.not_in(
+                    [pr.TransactionState.CANCELLED, pr.TransactionState.REVIEW]
                 ),
-            )
+            ),
+            "pending_payment",
+        ),
+    ).subquery()
+
+    return select(
+        rows.c.wallet_id,
+        func.sum(rows.c.pending_in).label("pending_in"),
+        func.sum(rows.c.pending_out).label("pending_out"),
+        func.sum(rows.c.pending_payment).label("pending_payment"),
+    ).group_by(rows.c.wallet_id)
+
+
+NO_PENDINGS = (Decimal(0), Decimal(0), Decimal(0))
+
+
+def is_pending_out(trade: WalletTrading, wallet: "OfficeWallet") -> bool:
+    """whether a pending trade counts in the pending out of its wallet, see wallet_pendings_query"""
+    if wallet.wallet_type == pr.WalletType.SIMPLE:
+        return trade.trading_type == pr.TradingType.SIMPLE_SELL
+    return trade.trading_type in [
+        pr.TradingType.SELL,
+        pr.TradingType.EXCHANGE,
+        pr.TradingType.EXCHANGE_WITH_SIMPLE_WALLET,
+    ]
+
+
+def get_wallets_pendings(session: Session, wallet_ids: list[str]) -> dict[str, tuple]:
+    """Pending (in, out, payment) totals by wallet id"""
+    if not wallet_ids:
+        return {}
+    rows = session.execute(wallet_pendings_query(wallet_ids)).all()
+    return {
+        row.wallet_id: (
+            Decimal(row.pending_in),
+            Decimal(row.pending_out),
+            Decimal(row.pending_payment),
+        )
+        for row in rows
+    }
 
-        results = db.scalars(
-            select(WalletTrading).where(
-                and_(condition, WalletTrading.state == pr.TransactionState.PENDING)
-            )
-        ).all()
-        return reduce(in_reducer, results, Decimal(0))
+
+def _get_pendings(wallet_id: str) -> tuple:
+    with Session(engine) as db:
+        return get_wallets_pendings(db, [wallet_id]).get(wallet_id, NO_PENDINGS)
+
+
+def get_pending_in(self) -> Decimal:
+    """Get the pending in amount"""
+    return _get_pendings(self.walletID)[0]
 
 
 def get_pending_payment(self) -> Decimal:
-    with Session(engine) as db:
-        results = db.scalars(
-            select(WalletTrading)
-            .where(
-                and_(
-                    WalletTrading.partner_paid == False,
-                    WalletTrading.walletID == self.walletID,
-                )
-            )
-            .where(
-                and_(
-                    WalletTrading.state != pr.TransactionState.CANCELLED,
-                    WalletTrading.state != pr.TransactionState.REVIEW,
-                )
-            )
-        ).all()
-        reduced = reduce(out_reducer, results, Decimal(0))
-        return reduced
+    return _get_pendings(self.walletID)[2]
 
 
 def get_pending_out(self) -> Decimal:
     """Get the pending out amount"""
-    condition = None
-    if self.wallet_type == pr.WalletType.SIMPLE:
-        condition = or_(
-            and_(
-                WalletTrading.walletID == self.walletID,
-                WalletTrading.trading_type == pr.TradingType.SIMPLE_SELL,
-            )
-        )
-    else:
-        condition = or_(
-            and_(
-                WalletTrading.walletID == self.walletID,
-                WalletTrading.trading_type == pr.TradingType.SELL,
-            ),
-            # crypto exchange
-            and_(
-                WalletTrading.walletID == self.walletID,
-                WalletTrading.trading_type == pr.TradingType.EXCHANGE,
-            ),
-            # simple exchange
-            and_(
-                WalletTrading.walletID == self.walletID,
-                WalletTrading.trading_type == pr.TradingType.EXCHANGE_WITH_SIMPLE_WALLET,
-            ),
-        )
-
-    with Session(engine) as db:
-        results = db.scalars(
-            select(WalletTrading).where(
-                and_(
-                    condition,
-                    WalletTrading.state == pr.TransactionState.PENDING,
-                ),
-            )
-        ).all()
-
-        reduced = reduce(out_reducer, results, Decimal(0))
-        return reduced
+    return _get_pendings(self.walletID)[1]
 
 
 class Office(OfficeBase, table=True):
@@ -181,18 +233,17 @@ class OfficeWallet(CryptoWalletBase, table=True):
     pending_out: ClassVar[Decimal] = hybrid_property(get_pending_out)
     pending_payment: ClassVar[Decimal] = hybrid_property(get_pending_payment)
 
+    # codes are numbered by the wallet code sequence, see models.codes
     counter: int = Field(nullable=True, default=0)
+    # incremented by every update, an update of a stale wallet raises StaleDataError
+    version: int = Field(default=1)
 
     office_id: UUID = Field(foreign_key="offices.id")
     office: Office = Relationship(back_populates="wallets")  # type: ignore
 
-    def generate_code(self) -> str:
-        """generate a unique code for the internal transaction"""
-        now = datetime.now()
-        month = now.strftime("%m")
-        self.counter = self.counter + 1 if self.counter else 1
-
-        return f"{self.initials}{month}{self.counter:03}"
+    @declared_attr
+    def __mapper_args__(cls):
+        return {"version_id_col": cls.__table__.c.version}
 
 
 class WalletRates:
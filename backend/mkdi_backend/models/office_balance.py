@@ -0,0 +1,118 @@
+"""Running balance totals of an office, used by the invariant check."""
+
+from collections import defaultdict
+from decimal import Decimal
+from itertools import chain
+from uuid import UUID
+
+import sqlalchemy as sa
+import sqlalchemy.dialects.postgresql as pg
+from mkdi_backend.models.Account import Account
+from mkdi_backend.models.office import OfficeWallet
+from mkdi_shared.schemas import protocol as pr
+from sqlalchemy.orm import Session as OrmSession
+from sqlmodel import Field, SQLModel, func, select
+
+ACCOUNTS, FUND, WALLETS = "accounts_balance", "fund_balance", "wallets_value"
+
+
+class OfficeBalance(SQLModel, table=True):
+    """Office totals, updated in the same transaction as the accounts and wallets"""
+
+    __tablename__ = "office_balances"
+
+    office_id: UUID = Field(foreign_key="offices.id", primary_key=True)
+    # sum of the balances of every non FUND account
+    accounts_balance: Decimal = Field(default=0, max_digits=19, decimal_places=4)
+    fund_balance: Decimal = Field(default=0, max_digits=19, decimal_places=4)
+    wallets_value: Decimal = Field(default=0, max_digits=19, decimal_places=4)
+
+    @property
+    def invariant(self) -> Decimal:
+        return Decimal(self.accounts_balance) - Decimal(self.fund_balance + self.wallets_value)
+
+
+def office_totals(office_id) -> dict:
+    """scalar sub queries recomputing the office totals from scratch"""
+    is_fund = Account.type == pr.AccountType.FUND
+    return {
+        ACCOUNTS: select(func.coalesce(func.sum(Account.balance).filter(~is_fund), 0))
+        .where(Account.office_id == office_id)
+        .scalar_subquery(),
+        FUND: select(func.coalesce(func.sum(Account.balance).filter(is_fund), 0))
+        .where(Account.office_id == office_id)
+        .scalar_subquery(),
+        WALLETS: select(func.coalesce(func.sum(OfficeWallet.value), 0))
+        .where(OfficeWallet.office_id == office_id)
+        .scalar_subquery(),
+    }
+
+
+def upsert_office_balance(office_id, values: dict, increment: bool = True):
+    """insert the office totals row, or add (increment) / overwrite the given values"""
+    table = OfficeBalance.__table__
+    stmt = pg.insert(table).values(office_id=office_id, **values)
+    return stmt.on_conflict_do_update(
+        index_elements=[table.c.office_id],
+        set_={
+            name: (table.c[name] + stmt.excluded[name]) if increment else stmt.excluded[name]
+            for name in values
+        },
+    )
+
+
+def _delta(obj, attr: str, is_new: bool, is_deleted: bool) -> Decimal | None:
+    if is_new:
+        return Decimal(getattr(obj, attr) or 0)
+    if is_deleted:
+        return -Decimal(getattr(obj, attr) or 0)
+
+    history = sa.inspect(obj).attrs[attr].history
+    if not history.added:
+        return Decimal(0)
+    if not history.deleted:
+        # the previous value was never loaded, the totals have to be recomputed
+        return None
+    return Decimal(history.added[0] or 0) - Decimal(history.deleted[0] or 0)
+
+
+def track_office_balances(session: OrmSession, flush_context) -> None:
+    """after_flush hook applying the balance variations of the flush to the office totals
+
+    Attribute history is still available at this point, so the variations of credit/debit
+    and wallet value updates are added to the totals with a single upsert per office.
+    """
+    deltas = defaultdict(lambda: {ACCOUNTS: Decimal(0), FUND: Decimal(0), WALLETS: Decimal(0)})
+    rebuild = set()
+    objects = chain(
+        ((obj, True, False) for obj in session.new),
+        ((obj, False, False) for obj in session.dirty),
+        ((obj, False, True) for obj in session.deleted),
+    )
+    for obj, is_new, is_deleted in objects:
+        if isinstance(obj, Account):
+            is_fund = pr.AccountType(obj.type) == pr.AccountType.FUND
+            attr, column = "balance", FUND if is_fund else ACCOUNTS
+        elif isinstance(obj, OfficeWallet):
+            attr, column = "value", WALLETS
+        else:
+            continue
+
+        delta = _delta(obj, attr, is_new, is_deleted)
+        if delta is None:
+            rebuild.add(obj.office_id)
+        elif delta:
+            deltas[obj.office_id][column] += delta
+
+    connection = session.connection()
+    for office_id, values in deltas.items():
+        # transfers between two non fund accounts cancel out, don't lock the totals row for them
+        if office_id in rebuild or not any(values.values()):
+            continue
+        connection.execute(upsert_office_balance(office_id, values))
+
+    for office_id in rebuild:
+        connection.execute(upsert_office_balance(office_id, office_totals(office_id), False))
+
+
+sa.event.listen(OrmSession, "after_flush", track_office_balances)
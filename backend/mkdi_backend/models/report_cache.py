@@ -0,0 +1,183 @@
+"""Serialized reports of closed periods, dropped when a transaction of the period changes."""
+
+import json
+from collections import defaultdict
+from datetime import datetime, timedelta
+from decimal import Decimal
+from itertools import chain
+from uuid import UUID
+
+import sqlalchemy as sa
+import sqlalchemy.dialects.postgresql as pg
+from mkdi_backend.config import settings
+from mkdi_backend.models.office import OfficeWallet
+from mkdi_backend.models.transactions.transactions import WalletTrading
+from mkdi_shared.schemas import protocol as pr
+from pydantic.json import pydantic_encoder
+from sqlalchemy.orm import Session as OrmSession
+from sqlmodel import Field, SQLModel, delete, select
+
+
+class ReportCache(SQLModel, table=True):
+    """A report of a period that no longer receives transactions"""
+
+    __tablename__ = "report_cache"
+
+    key: str = Field(primary_key=True)
+    office_id: UUID = Field(foreign_key="offices.id", index=True)
+    # transactions created in this period invalidate the report when they change
+    start_date: datetime
+    end_date: datetime
+    payload: str = Field(sa_column=sa.Column(pr.JsonText, nullable=False))
+    created_at: datetime = Field(default_factory=datetime.now)
+
+
+class ReportCacheGeneration(SQLModel, table=True):
+    """Invalidations of the cached reports of an office.
+
+    A report is only stored when the generation it was computed under is still current, so a
+    report computed before a concurrent invalidation is never cached after it.
+    See store_report.
+    """
+
+    __tablename__ = "report_cache_generations"
+
+    office_id: UUID = Field(foreign_key="offices.id", primary_key=True)
+    generation: int = Field(default=0, nullable=False)
+
+
+def _encode(value):
+    if isinstance(value, Decimal):
+        return str(value)
+    return pydantic_encoder(value)
+
+
+def dumps(report) -> str:
+    """json of a report, decimals are written as strings so they are read back exactly"""
+    return json.dumps(report, default=_encode)
+
+
+def cached_report(key: str):
+    """payload of a cached report, entries older than REPORT_CACHE_TTL are ignored"""
+    expires = datetime.now() - timedelta(seconds=settings.REPORT_CACHE_TTL)
+    return select(ReportCache.payload).where(
+        ReportCache.key == key, ReportCache.created_at >= expires
+    )
+
+
+def ensure_generation(office_id):
+    """create the generation row of the office, so that the stores can lock it"""
+    table = ReportCacheGeneration.__table__
+    return (
+        pg.insert(table)
+        .values(office_id=office_id, generation=0)
+        .on_conflict_do_nothing(index_elements=[table.c.office_id])
+    )
+
+
+def report_generation(office_id):
+    """current generation of the office, read before computing a report to cache"""
+    return select(ReportCacheGeneration.generation).where(
+        ReportCacheGeneration.office_id == office_id
+    )
+
+
+def store_report(
+    key: str, office_id, start_date: datetime, end_date: datetime, payload: str, generation: int
+):
+    """insert or replace a cached report, unless the office was invalidated since ``generation``
+
+    The statement rewrites the generation row it checks. An invalidation in progress makes it
+    wait then skip the report, and an invalidation whose snapshot predates it fails with a
+    serialization error when bumping the row, its retry then deletes the stored report.
+    """
+    table = ReportCache.__table__
+    generations = ReportCacheGeneration.__table__
+    values = dict(
+        office_id=office_id,
+        start_date=start_date,
+        end_date=end_date,
+        payload=payload,
+        created_at=datetime.now(),
+    )
+    current = (
+        sa.update(generations)
+        .where(generations.c.office_id == office_id, generations.c.generation == generation)
+        .values(generation=generations.c.generation)
+        .returning(generations.c.office_id)
+        .cte("current_generation")
+    )
+    rows = select(
+        *(sa.literal(value, table.c[name].type).label(name) for name, value in values.items()),
+        sa.literal(key, table.c.key.type).label("key"),
+    ).select_from(current)
+    stmt = pg.insert(table).from_select([*values, "key"], rows).add_cte(current)
+    return stmt.on_conflict_do_update(
+        index_elements=[table.c.key], set_={name: stmt.excluded[name] for name in values}
+    )
+
+
+def bump_generation(offices):
+    """start a new generation for the offices selected by ``offices``"""
+    table = ReportCacheGeneration.__table__
+    stmt = pg.insert(table).from_select(
+        ["office_id", "generation"], select(offices.subquery(), sa.literal(1))
+    )
+    return stmt.on_conflict_do_update(
+        index_elements=[table.c.office_id], set_={"generation": table.c.generation + 1}
+    )
+
+
+def _changed(obj) -> bool:
+    return sa.inspect(obj).attrs.state.history.has_changes()
+
+
+def invalidate_reports(session: OrmSession, flush_context) -> None:
+    """after_flush hook dropping the cached reports of the periods touched by the flush
+
+    Closed periods only change when an existing transaction changes state (rollback,
+    cancellation, late payment) or is deleted, new transactions belong to the current period.
+    """
+    dates = defaultdict(set)
+    objects = chain(
+        ((obj, False) for obj in session.dirty),
+        ((obj, True) for obj in session.deleted),
+    )
+    for obj, is_deleted in objects:
+        # keyed by value, the trades of a wallet share a single delete
+        if isinstance(obj, pr.TransactionDB):
+            owner = ("office", obj.office_id)
+        elif isinstance(obj, WalletTrading):
+            owner = ("wallet", obj.walletID)
+        else:
+            continue
+        if (is_deleted or _changed(obj)) and obj.created_at:
+            dates[owner].add(obj.created_at)
+
+    connection = session.connection() if dates else None
+    # cached reports only cover the periods before the current month, the generation of the
+    # office is only bumped, and its row locked, when one of those changes
+    current_month = datetime.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    for (kind, value), created in dates.items():
+        if kind == "office":
+            office = ReportCache.office_id == value
+            offices = select(sa.literal(value, ReportCache.office_id.type))
+        else:
+            offices = select(OfficeWallet.office_id).where(OfficeWallet.walletID == value)
+            office = ReportCache.office_id.in_(offices)
+        if min(created) < current_month:
+            connection.execute(bump_generation(offices))
+        connection.execute(
+            delete(ReportCache).where(
+                office,
+                sa.or_(
+                    *(
+                        sa.and_(ReportCache.start_date <= date, ReportCache.end_date >= date)
+                        for date in created
+                    )
+                ),
+            )
+        )
+
+
+sa.event.listen(OrmSession, "after_flush", invalidate_reports)
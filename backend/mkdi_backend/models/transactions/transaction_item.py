@@ -1,8 +1,7 @@
 from mkdi_backend.models import External, Internal, Deposit, Sending, ForEx
-from pydantic import BaseModel, root_validator
+from pydantic import BaseModel
 from typing import Union, List
 from mkdi_shared.schemas import protocol
-import json
 
 
 AllTransactions = Union[Internal, Deposit, Sending, External, ForEx]
@@ -10,23 +9,11 @@ AllTransactions = Union[Internal, Deposit, Sending, External, ForEx]
 
 class TransactionItem(BaseModel):
     item: AllTransactions
-    notes: List[protocol.Note]
-
-    @root_validator
-    def extract_notes(cls, values):
-        item = values.get("item")
-        if not item:
-            return values
-        notes = json.loads(item.notes) if len(item.notes) > 0 else []
-        values["notes"] = notes
-
-        return values
+    # left empty by the listings, the notes are sent once as the JSON text of item.notes
+    notes: List[protocol.Note] = []
 
     def get_request_message(self) -> str:
-        request = next((note for note in self.notes if note["type"] == "REQUEST"), None)
-        if request:
-            return request["message"]
-        return ""
+        return self.item.request_message or ""
 
     def to_report_item(self, is_out: bool = False) -> dict:
         request_message = self.get_request_message()
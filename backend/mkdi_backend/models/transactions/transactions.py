@@ -2,6 +2,7 @@
 
 from datetime import datetime
 import dataclasses
+import json
 
 from decimal import Decimal, getcontext
 from typing import Annotated, Mapping, Any, Optional, Union, List, ClassVar
@@ -12,13 +13,42 @@ from pydantic import Field as PydanticField
 from mkdi_shared.schemas import protocol as pr
 from sqlmodel import Field, SQLModel, Session, select
 from sqlalchemy.ext.hybrid import hybrid_property
+from sqlalchemy.orm import declared_attr
 import sqlalchemy as sa
 import sqlalchemy.dialects.postgresql as pg
 from mkdi_backend.database import engine
 
 
+def transaction_indexes(table: str, *initials: str) -> tuple:
+    """indexes of a transaction table: office listings by date and pending lookups by account"""
+    return (
+        sa.Index(f"ix_{table}_office_created_at", "office_id", "created_at", "id"),
+        sa.Index(f"ix_{table}_tags", "tags", postgresql_using="gin"),
+        *(
+            sa.Index(
+                f"ix_{table}_pending_{column}",
+                column,
+                postgresql_where=sa.text("state = 'PENDING'"),
+            )
+            for column in initials
+        ),
+    )
+
+
+class TransactionVersion(SQLModel):
+    """version of the transaction tables reviewed by the transaction repositories"""
+
+    # incremented by every update, an update of a stale transaction raises StaleDataError
+    version: int = Field(default=1)
+
+    @declared_attr
+    def __mapper_args__(cls):
+        return {"version_id_col": cls.__table__.c.version}
+
+
 class Payment(pr.PaymentBase, table=True):
     __tablename__ = "payments"
+    __table_args__ = (sa.Index("ix_payments_transaction_state", "transaction_id", "state"),)
     id: Optional[UUID] = Field(
         sa_column=sa.Column(
             pg.UUID(as_uuid=True),
@@ -31,8 +61,9 @@ class Payment(pr.PaymentBase, table=True):
     paid_by: UUID = Field(foreign_key="employees.id")
 
 
-class Internal(pr.TransactionDB, table=True):
+class Internal(pr.TransactionDB, TransactionVersion, table=True):
     __tablename__ = "internals"
+    __table_args__ = transaction_indexes("internals", "sender_initials", "receiver_initials")
 
     """
       An internal transaction is made between two accounts domiciled in the same office.
@@ -77,11 +108,26 @@ def get_forex_buying_amount(cls) -> Decimal:
         return cls.amount / cls.buying_rate
 
     if cls.bank_rate:
-        return ((cls.amount * cls.bank_rate) + cls.bank_fees) / cls.rate
+        return ((cls.amount * cls.bank_rate) + (cls.bank_fees or 0)) / cls.rate
 
     return cls.amount
 
 
+def forex_buying_amount_expression(cls):
+    """SQL counterpart of get_forex_buying_amount"""
+    return sa.case(
+        (
+            sa.and_(cls.tag.is_distinct_from("BANKTT"), sa.func.coalesce(cls.buying_rate, 0) != 0),
+            cls.amount / cls.buying_rate,
+        ),
+        (
+            sa.func.coalesce(cls.bank_rate, 0) != 0,
+            ((cls.amount * cls.bank_rate) + sa.func.coalesce(cls.bank_fees, 0)) / cls.rate,
+        ),
+        else_=cls.amount,
+    )
+
+
 def get_forex_selling_amount(cls) -> Decimal:
 
     if cls.tag != "BANKTT" and cls.selling_rate:
@@ -90,6 +136,17 @@ def get_forex_selling_amount(cls) -> Decimal:
     return cls.amount * (1 + cls.selling_rate / 100)
 
 
+def forex_selling_amount_expression(cls):
+    """SQL counterpart of get_forex_selling_amount"""
+    return sa.case(
+        (
+            sa.and_(cls.tag.is_distinct_from("BANKTT"), sa.func.coalesce(cls.selling_rate, 0) != 0),
+            cls.amount / cls.selling_rate,
+        ),
+        else_=cls.amount * (1 + cls.selling_rate / 100),
+    )
+
+
 class ForExBase(pr.TransactionDB):
     """
     Une transaction de change est effectué
@@ -107,8 +164,12 @@ class ForExBase(pr.TransactionDB):
     tag: str = Field(nullable=True)
     charge_percentage: Annotated[Decimal, Field(ge=0, le=100)]
     is_valid: ClassVar[bool] = hybrid_property(lambda cls: cls.buying_rate > cls.selling_rate)
-    buying_amount: ClassVar[Decimal] = hybrid_property(get_forex_buying_amount)
-    selling_amount: ClassVar[Decimal] = hybrid_property(get_forex_selling_amount)
+    buying_amount: ClassVar[Decimal] = hybrid_property(
+        get_forex_buying_amount, expr=forex_buying_amount_expression
+    )
+    selling_amount: ClassVar[Decimal] = hybrid_property(
+        get_forex_selling_amount, expr=forex_selling_amount_expression
+    )
     forex_result: ClassVar[Decimal] = hybrid_property(
         lambda cls: cls.selling_amount - cls.buying_amount
     )
@@ -118,7 +179,12 @@ class ForExWithPayments(ForExBase):
     payments: List[Payment] = PydanticField(default=[])
 
 
-class ForEx(ForExBase, table=True):
+class ForEx(ForExBase, TransactionVersion, table=True):
+    __table_args__ = transaction_indexes("forex", "customer_account") + (
+        # provider reports, the provider name is stored in the tag
+        sa.Index("ix_forex_office_tag_created_at", "office_id", "tag", "created_at"),
+    )
+
     def withPayments(self, payments: List[Payment]) -> ForExWithPayments:
         return ForExWithPayments(**self.dict(), payments=payments)
 
@@ -148,24 +214,51 @@ class DepositWithPayments(DepositBase):
     payments: List[Payment] = PydanticField(default=[])
 
 
-class External(ExternalBase, table=True):
+class External(ExternalBase, TransactionVersion, table=True):
+    __table_args__ = transaction_indexes("externals", "sender_initials")
 
     def withPayments(self, payments: List[Payment]) -> ExternalWithPayments:
         return ExternalWithPayments(**self.dict(), payments=payments)
 
 
-class Sending(SendingBase, table=True):
+class Sending(SendingBase, TransactionVersion, table=True):
+    __table_args__ = transaction_indexes("sendings", "receiver_initials")
 
     def withPayments(self, payments: List[Payment]) -> SendingWithPayments:
         return SendingWithPayments(**self.dict(), payments=payments)
 
 
-class Deposit(DepositBase, table=True):
+class Deposit(DepositBase, TransactionVersion, table=True):
+    __table_args__ = transaction_indexes("deposits", "owner_initials")
 
     def withPayments(self, payments: List[Payment]) -> DepositWithPayments:
         return DepositWithPayments(**self.dict(), payments=payments)
 
 
+def note_fields(notes: str | None) -> tuple[str | None, List[str] | None]:
+    """the request message and the first tags of a transaction notes"""
+    notes = json.loads(notes) if notes else []
+    if not isinstance(notes, list):
+        return None, None
+    request = next((note for note in notes if note.get("type") == "REQUEST"), None)
+    tags = next((note["tags"] for note in notes if note.get("tags")), None)
+    return (
+        request.get("message") if request else None,
+        [tags] if isinstance(tags, str) else tags,
+    )
+
+
+def sync_note_fields(mapper, connection, target: pr.TransactionDB) -> None:
+    """keep request_message and tags in line with the notes being written"""
+    if sa.inspect(target).attrs.notes.history.has_changes():
+        target.request_message, target.tags = note_fields(target.notes)
+
+
+for model in (Internal, Deposit, Sending, External, ForEx):
+    sa.event.listen(model, "before_insert", sync_note_fields)
+    sa.event.listen(model, "before_update", sync_note_fields)
+
+
 class Rate(SQLModel):
     quotient: Decimal
     divider: Decimal
@@ -232,6 +325,29 @@ def get_trading_amount(cls) -> Decimal:
     return cls.amount / cls.trading_rate
 
 
+def trading_amount_expression(cls):
+    """SQL counterpart of get_trading_amount"""
+    return sa.case(
+        (
+            cls.trading_type == pr.TradingType.EXCHANGE_WITH_SIMPLE_WALLET,
+            cls.amount * (cls.selling_rate / cls.daily_rate),
+        ),
+        (
+            cls.trading_type.in_([pr.TradingType.BUY, pr.TradingType.EXCHANGE]),
+            cls.amount * (cls.trading_rate / cls.daily_rate),
+        ),
+        (
+            cls.trading_currency.is_distinct_from(cls.selling_currency),
+            cls.amount * (cls.trading_rate / cls.daily_rate),
+        ),
+        (
+            cls.trading_type == pr.TradingType.SIMPLE_SELL,
+            cls.amount * (1 + cls.trading_rate / 100),
+        ),
+        else_=cls.amount / cls.trading_rate,
+    )
+
+
 def get_trading_cost(cls) -> Decimal:
 
     if cls.trading_type == pr.TradingType.BUY:
@@ -316,6 +432,21 @@ def get_payments(cls) -> List[Payment]:
 
 class WalletTrading(pr.WalletTradingBase, table=True):
     __tablename__ = "wallet_trading"
+    __table_args__ = (
+        sa.Index("ix_wallet_trading_wallet_created_at", "walletID", "created_at"),
+        sa.Index(
+            "ix_wallet_trading_exchange_wallet_created_at",
+            "exchange_walletID",
+            "created_at",
+            postgresql_where=sa.text('"exchange_walletID" IS NOT NULL'),
+        ),
+        sa.Index("ix_wallet_trading_account_created_at", "account", "created_at"),
+        sa.Index(
+            "ix_wallet_trading_pending_wallet",
+            "walletID",
+            postgresql_where=sa.text("state = 'PENDING'"),
+        ),
+    )
     id: Optional[UUID] = Field(
         sa_column=sa.Column(
             pg.UUID(as_uuid=True),
@@ -358,7 +489,9 @@ class WalletTrading(pr.WalletTradingBase, table=True):
     )
 
     trading_cost: ClassVar[Decimal] = hybrid_property(get_trading_cost)
-    trading_amount: ClassVar[Decimal] = hybrid_property(get_trading_amount)
+    trading_amount: ClassVar[Decimal] = hybrid_property(
+        get_trading_amount, expr=trading_amount_expression
+    )
     trading_exchange: ClassVar[Decimal] = hybrid_property(get_exchange_amount)
     trading_crypto: ClassVar[Decimal] = hybrid_property(get_trading_crypto)
 
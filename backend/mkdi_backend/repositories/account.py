@@ -1,9 +1,9 @@
 from decimal import Decimal
 
 from loguru import logger
-from sqlmodel import Session, func
+from sqlmodel import Session
 
-from sqlalchemy import select, case, or_
+from sqlalchemy import select, or_
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from mkdi_shared.exceptions.mkdi_api_error import MkdiError, MkdiErrorCode
@@ -13,7 +13,16 @@ from mkdi_backend.api.deps import KcUser
 from mkdi_backend.config import settings
 from mkdi_backend.models.Account import Account
 from mkdi_backend.models.Agent import Agent
-from mkdi_backend.models.office import Office, OfficeWallet
+from mkdi_backend.models.get_account_pendings import get_accounts_pendings
+from mkdi_backend.models.office import Office
+from mkdi_backend.models.office_balance import (
+    ACCOUNTS,
+    FUND,
+    WALLETS,
+    OfficeBalance,
+    office_totals,
+    upsert_office_balance,
+)
 from mkdi_backend.utils.database import CommitMode, managed_tx_method
 
 
@@ -98,7 +107,31 @@ class AccountRepository:
         self.db.add(account)
         return account
 
-    def get_office_accounts(self, office_id: str) -> list[Account]:
+    def with_pendings(self, accounts: list[Account]) -> list[protocol.AccountResponse]:
+        """
+        Serialize accounts along with their pending totals, computed for the whole list at once.
+
+        Args:
+            accounts (list[Account]): The accounts to serialize.
+
+        Returns:
+            list[protocol.AccountResponse]: The accounts with pendings and effective balance.
+        """
+        pendings = get_accounts_pendings(self.db, [account.initials for account in accounts])
+        responses = []
+        for account in accounts:
+            pendings_in, pendings_out = pendings.get(account.initials, (Decimal(0), Decimal(0)))
+            responses.append(
+                protocol.AccountResponse(
+                    **account.dict(),
+                    pendings_in=pendings_in,
+                    pendings_out=pendings_out,
+                    effective_balance=account.balance + pendings_in - pendings_out,
+                )
+            )
+        return responses
+
+    def get_office_accounts(self, office_id: str) -> list[protocol.AccountResponse]:
         """
         Retrieves all accounts associated with a specific office.
 
@@ -106,9 +139,9 @@ class AccountRepository:
             office_id (str): The ID of the office.
 
         Returns:
-            list[Account]: A list of accounts associated with the office.
+            list[protocol.AccountResponse]: A list of accounts associated with the office.
         """
-        return self.db.scalars(
+        accounts = self.db.scalars(
             select(Account)
             .where(Account.office_id == office_id)
             .filter(
@@ -118,8 +151,9 @@ class AccountRepository:
                 )
             )
         ).all()
+        return self.with_pendings(accounts)
 
-    def get_owner_accounts(self, owner_id: str) -> list[Account]:
+    def get_owner_accounts(self, owner_id: str) -> list[protocol.AccountResponse]:
         """
         Retrieves all accounts associated with a specific owner.
 
@@ -127,145 +161,128 @@ class AccountRepository:
             owner_id (str): The ID of the owner.
 
         Returns:
-            list[Account]: A list of accounts associated with the owner.
+            list[protocol.AccountResponse]: A list of accounts associated with the owner.
         """
-        return self.db.query(Account).filter(Account.owner_id == owner_id).all()
+        return self.with_pendings(self.db.query(Account).filter(Account.owner_id == owner_id).all())
+
+    def _compute_totals(self, office_id: str) -> OfficeBalance:
+        """recompute the office totals from the accounts and wallets tables"""
+        totals = office_totals(office_id)
+        row = self.db.execute(select(*[v.label(k) for k, v in totals.items()])).one()
+        return OfficeBalance(office_id=office_id, **row._asdict())
+
+    async def _a_compute_totals(self, office_id: str) -> OfficeBalance:
+        totals = office_totals(office_id)
+        row = (await self.db.execute(select(*[v.label(k) for k, v in totals.items()]))).one()
+        return OfficeBalance(office_id=office_id, **row._asdict())
+
+    def _verify_totals(self, stored: OfficeBalance | None, computed: OfficeBalance) -> None:
+        # offices without any balance movement have no totals row yet
+        stored = stored if stored else OfficeBalance(office_id=computed.office_id)
+        if any(
+            Decimal(getattr(stored, name) or 0) != Decimal(getattr(computed, name))
+            for name in (ACCOUNTS, FUND, WALLETS)
+        ):
+            logger.error(
+                f"Office {computed.office_id} totals drifted, stored {stored} computed {computed}"
+            )
+
+    def _totals_query(self, office_id: str):
+        # the row is updated behind the ORM by the flush hook, always reload it
+        return (
+            select(OfficeBalance)
+            .where(OfficeBalance.office_id == office_id)
+            .execution_options(populate_existing=True)
+        )
 
-    async def a_check_invariant(self, office_id: str) -> bool:
+    def get_totals(self, office_id: str, verify: bool = False) -> OfficeBalance:
         """
-        Check the invariant for the given organization and office.
+        Get the running totals of an office.
 
         Args:
-            org_id (str): The ID of the organization.
             office_id (str): The ID of the office.
+            verify (bool): recompute the totals from scratch and report any drift.
 
         Returns:
-            bool: True if the invariant holds, False otherwise.
+            OfficeBalance: the office totals.
         """
-        try:
-
-            # Query to get the sum of balances for positive accounts and the fund account balance in one go
-            session: AsyncSession = self.db
-            result = await session.execute(
-                select(
-                    func.sum(
-                        case(
-                            (Account.type != protocol.AccountType.FUND, Account.balance), else_=0
-                        ).label("positive_balance_sum")
-                    ),
-                    func.sum(
-                        case(
-                            (Account.type == protocol.AccountType.FUND, Account.balance), else_=0
-                        ).label("fund_balance")
-                    ),
-                ).where(Account.office_id == office_id)
-            )
-            positive_balance_sum, fund_balance = result.one()
-
-            wallet_stm = await self.db.execute(
-                select(func.sum(OfficeWallet.value)).where(OfficeWallet.office_id == office_id)
-            )
-
-            wallet_balance_sum = wallet_stm.scalar()
-            wallet_balance_sum = wallet_balance_sum or 0
-
-            # Convert None to 0 if there are no positive accounts or no fund account
-            positive_balance_sum = positive_balance_sum or 0
-            fund_balance = fund_balance or 0
+        stored = self.db.scalar(self._totals_query(office_id))
+        if not verify:
+            return stored if stored else OfficeBalance(office_id=office_id)
+
+        computed = self._compute_totals(office_id)
+        self._verify_totals(stored, computed)
+        return computed
+
+    async def a_get_totals(self, office_id: str, verify: bool = False) -> OfficeBalance:
+        session: AsyncSession = self.db
+        stored = await session.scalar(self._totals_query(office_id))
+        if not verify:
+            return stored if stored else OfficeBalance(office_id=office_id)
+
+        computed = await self._a_compute_totals(office_id)
+        self._verify_totals(stored, computed)
+        return computed
+
+    def rebuild_totals(self, office_id: str) -> None:
+        """overwrite the running totals of an office with freshly computed ones"""
+        self.db.execute(upsert_office_balance(office_id, office_totals(office_id), False))
+
+    def _is_healthy(self, totals: OfficeBalance) -> bool:
+        logger.info(
+            f"Total positive balance: {totals.accounts_balance}, Fund account balance: {totals.fund_balance}"
+        )
+        invariant_check = totals.invariant
+        logger.debug(f"Invariant difference: {invariant_check}")
+        # whe should accept a small difference due to floating point precision
+        return abs(invariant_check) < Decimal(settings.INVARIANT_TOLERANCE)
 
-            logger.info(
-                f"Total positive balance: {positive_balance_sum}, Fund account balance: {fund_balance}"
-            )
+    async def a_check_invariant(self, office_id: str, verify: bool = None) -> bool:
+        """
+        Check the invariant for the given organization and office.
 
-            # Check the invariant
-            invariant_check = Decimal(positive_balance_sum) - Decimal(
-                fund_balance + wallet_balance_sum
-            )
-            logger.debug(f"Invariant difference: {invariant_check}")
-            # whe should accept a small difference due to floating point precision
+        Args:
+            office_id (str): The ID of the office.
+            verify (bool): recompute the totals instead of reading the running ones,
+                defaults to settings.INVARIANT_VERIFY_TOTALS
 
-            return abs(invariant_check) < Decimal(settings.INVARIANT_TOLERANCE)
+        Returns:
+            bool: True if the invariant holds, False otherwise.
+        """
+        try:
+            if verify is None:
+                verify = settings.INVARIANT_VERIFY_TOTALS
+            return self._is_healthy(await self.a_get_totals(office_id, verify))
 
         except Exception as e:
             logger.error(f"Error checking invariant: {e}")
             return False
 
-    def get_invariant(self, office_id: str) -> Decimal:
-
-        positive_balance_sum = self.db.execute(
-            select(
-                func.sum(Account.balance).filter(Account.type != protocol.AccountType.FUND)
-            ).where(Account.office_id == office_id)
-        ).scalar()
-
-        fund_balance = self.db.scalar(
-            select(
-                func.sum(Account.balance).filter(Account.type == protocol.AccountType.FUND)
-            ).where(Account.office_id == office_id)
-        )
-
-        wallet_balance_sum = self.db.execute(
-            select(func.sum(OfficeWallet.value)).where(OfficeWallet.office_id == office_id)
-        ).scalar()
+    def get_invariant(self, office_id: str, verify: bool = False) -> Decimal:
+        return self.get_totals(office_id, verify).invariant
 
-        wallet_balance_sum = wallet_balance_sum or 0
-        # Convert None to 0 if there are no positive accounts or no fund account
-        positive_balance_sum = positive_balance_sum or 0
-
-        fund_balance = fund_balance or 0
-
-        # Check the invariant
-        return Decimal(positive_balance_sum) - Decimal(fund_balance + wallet_balance_sum)
-
-    def check_invariant(self, office_id: str) -> bool:
+    def check_invariant(self, office_id: str, verify: bool = None) -> bool:
         """
         Check the invariant for the given organization and office.
 
         Args:
-            org_id (str): The ID of the organization.
             office_id (str): The ID of the office.
+            verify (bool): recompute the totals instead of reading the running ones,
+                defaults to settings.INVARIANT_VERIFY_TOTALS
 
         Returns:
             bool: True if the invariant holds, False otherwise.
         """
         try:
-
-            # Query to get the sum of balances for positive accounts and the fund account balance in one go
-            positive_balance_sum, fund_balance = (
-                self.db.query(
-                    func.sum(Account.balance).filter(Account.type != protocol.AccountType.FUND),
-                    func.sum(Account.balance).filter(Account.type == protocol.AccountType.FUND),
-                )
-                .filter(Account.office_id == office_id)
-                .one()
-            )
-
-            wallet_balance_sum = self.db.execute(
-                select(func.sum(OfficeWallet.value)).where(OfficeWallet.office_id == office_id)
-            ).scalar()
-            wallet_balance_sum = wallet_balance_sum or 0
-            # Convert None to 0 if there are no positive accounts or no fund account
-            positive_balance_sum = positive_balance_sum or 0
-            fund_balance = fund_balance or 0
-
-            logger.info(
-                f"Total positive balance: {positive_balance_sum}, Fund account balance: {fund_balance}"
-            )
-
-            # Check the invariant
-            invariant_check = Decimal(positive_balance_sum) - Decimal(
-                fund_balance + wallet_balance_sum
-            )
-            logger.debug(f"Invariant difference: {invariant_check}")
-            # whe should accept a small difference due to floating point precision
-
-            return abs(invariant_check) < Decimal(settings.INVARIANT_TOLERANCE)
+            if verify is None:
+                verify = settings.INVARIANT_VERIFY_TOTALS
+            return self._is_healthy(self.get_totals(office_id, verify))
 
         except Exception as e:
             logger.error(f"Error checking invariant: {e}")
             return False
 
-    def get_all_accounts(self, office_id: str) -> list[Account]:
+    def get_all_accounts(self, office_id: str) -> list[protocol.AccountResponse]:
         """
         Retrieves all accounts associated with a specific office.
 
@@ -273,8 +290,9 @@ class AccountRepository:
             office_id (str): The ID of the office.
 
         Returns:
-            list[Account]: A list of accounts associated with the office.
+            list[protocol.AccountResponse]: A list of accounts associated with the office.
         """
-        return self.db.scalars(
+        accounts = self.db.scalars(
             select(Account).where(Account.office_id == office_id).order_by(Account.type)
         ).all()
+        return self.with_pendings(accounts)
@@ -1,6 +1,7 @@
 from mkdi_backend.api.deps import KcUser
 from mkdi_backend.models.Account import Account
 from mkdi_backend.models.Agent import Agent
+from mkdi_backend.repositories.account import AccountRepository
 from mkdi_backend.utils.database import CommitMode, managed_tx_method
 from mkdi_shared.exceptions.mkdi_api_error import MkdiError, MkdiErrorCode
 from mkdi_shared.schemas import protocol
@@ -65,6 +66,12 @@ class AgentRepository:
             .all()
         )
 
+        # serialize all the accounts at once, pendings are computed in a single query
+        accounts = AccountRepository(self.db).with_pendings(
+            [account for _, account in response if account]
+        )
+        accounts_map = {account.initials: account for account in accounts}
+
         # Aggregate accounts for each agent
         agents_accounts_map = {}
         for agent, account in response:
@@ -73,7 +80,7 @@ class AgentRepository:
                     **agent.dict(), accounts=[]
                 )
             if account:
-                agents_accounts_map[agent.id].accounts.append(account)
+                agents_accounts_map[agent.id].accounts.append(accounts_map[account.initials])
 
         # Convert the map to a list
         agents_with_accounts = list(agents_accounts_map.values())
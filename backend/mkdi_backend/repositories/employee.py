@@ -1,6 +1,6 @@
 from loguru import logger
 from mkdi_backend.api.deps import KcUser
-from mkdi_backend.authproviders import KeycloakAdminHelper, RoleProvider
+from mkdi_backend.authproviders import RoleProvider, invalidate_cached_user, kc_admin_helper
 from mkdi_backend.models.employee import Employee
 from mkdi_backend.utils.database import CommitMode, async_managed_tx_method, managed_tx_method
 from mkdi_backend.repositories.office import OfficeRepository
@@ -38,6 +38,15 @@ class EmployeeRepository:
             .first()
         )
 
+    async def a_get_employee(self, username, email, organization_id) -> Employee:
+        session: AsyncSession = self.db
+        return await session.scalar(
+            select(Employee)
+            .where((Employee.username == username) | (Employee.email == email))
+            .where(Employee.organization_id == organization_id)
+            .limit(1)
+        )
+
     @managed_tx_method(auto_commit=CommitMode.COMMIT)
     def update_user_roles(self, org_id: str, username: str, roles: list[str]):
         user = self.get_by_username_with_id(org_id, username)
@@ -47,6 +56,7 @@ class EmployeeRepository:
 
         user.roles = roles
         self.db.add(user)
+        invalidate_cached_user(user.id)
         return user
 
     @async_managed_tx_method(auto_commit=CommitMode.COMMIT)
@@ -79,14 +89,15 @@ class EmployeeRepository:
             roles=[],
         )
 
-        kc_admin = KeycloakAdminHelper()
-        user_id = kc_admin.create_user(
+        user_id = kc_admin_helper.create_user(
             auth_user=auth_user, usr_input=usr_input, office_id=str(office.id)
         )
         user.provider_account_id = user_id
 
         # assing user roles
-        assinged_roles = RoleProvider(kc_admin).update_user_roles(user_id, usr_input.roles)
+        assinged_roles = await RoleProvider(kc_admin_helper).a_update_user_roles(
+            user_id, usr_input.roles
+        )
         # update the user with the provider account id
         if len(assinged_roles) != len(usr_input.roles):
             raise MkdiError(
@@ -133,6 +144,7 @@ class EmployeeRepository:
         user.email = data.email
         user.username = data.username
         self.db.add(user)
+        invalidate_cached_user(user.id)
         return user
 
     @async_managed_tx_method(auto_commit=CommitMode.COMMIT)
@@ -143,6 +155,7 @@ class EmployeeRepository:
         # session: AsyncSession = self.db
         # get the list of users
         session: AsyncSession = self.db
+        rprovider = RoleProvider()
         result = []
         for updated in updated_users.employees:
             # attempt to change the user roles
@@ -159,9 +172,10 @@ class EmployeeRepository:
                     )
                 )
             ).scalar()
-            rprovider = RoleProvider()
-            updated_roles = rprovider.update_user_roles(u.provider_account_id, updated.roles)
-            KeycloakAdminHelper().update_user(
+            updated_roles = await rprovider.a_update_user_roles(
+                u.provider_account_id, updated.roles
+            )
+            kc_admin_helper.update_user(
                 user_id=u.provider_account_id, data={"email": updated.email.lower()}
             )
             if len(updated_roles) != len(updated.roles):
@@ -170,6 +184,7 @@ class EmployeeRepository:
                     error_code=MkdiErrorCode.INVALID_ROLE,
                 )
             session.add(u)
+            invalidate_cached_user(u.id)
             result.append(u)
 
         return result
@@ -1,5 +1,5 @@
 from mkdi_backend.models.models import KcUser
-from mkdi_backend.models.office import Office, OfficeWallet
+from mkdi_backend.models.office import NO_PENDINGS, Office, OfficeWallet, get_wallets_pendings
 from mkdi_backend.utils.database import CommitMode, managed_tx_method, async_managed_tx_method
 from mkdi_shared.exceptions.mkdi_api_error import MkdiError, MkdiErrorCode
 from mkdi_shared.schemas import protocol
@@ -167,19 +167,44 @@ class OfficeRepository:
         self.db.add(wallet)
         return wallet
 
-    def get_wallets(self, office_id: str) -> List[OfficeWallet]:
+    def with_pendings(self, wallets: List[OfficeWallet]) -> List[protocol.OfficeWalletResponse]:
+        """
+        Serialize wallets along with their pending totals, computed for the whole list at once.
+
+        Args:
+            wallets (List[OfficeWallet]): The wallets to serialize.
+
+        Returns:
+            List[protocol.OfficeWalletResponse]: The wallets with pending in, out and payment.
+        """
+        pendings = get_wallets_pendings(self.db, [wallet.walletID for wallet in wallets])
+        responses = []
+        for wallet in wallets:
+            pending_in, pending_out, pending_payment = pendings.get(wallet.walletID, NO_PENDINGS)
+            responses.append(
+                protocol.OfficeWalletResponse(
+                    **wallet.dict(),
+                    pending_in=pending_in,
+                    pending_out=pending_out,
+                    pending_payment=pending_payment,
+                )
+            )
+        return responses
+
+    def get_wallets(self, office_id: str) -> List[protocol.OfficeWalletResponse]:
         """get all wallet for an office"""
         results = self.db.scalars(
             select(OfficeWallet).where(OfficeWallet.office_id == office_id)
         ).all()
-        return results
+        return self.with_pendings(results)
 
     def get_health(self, office_id: str):
         """return office health"""
         acc_repo = AccountRepository(self.db)
-        healthy = acc_repo.check_invariant(office_id)
+        # the health page recomputes the totals so a drift of the running ones shows up
+        healthy = acc_repo.check_invariant(office_id, verify=True)
         accounts = acc_repo.get_all_accounts(office_id)
-        invariant = acc_repo.get_invariant(office_id)
+        invariant = acc_repo.get_invariant(office_id, verify=True)
 
         return protocol.OfficeHealth(
             status="healthy" if healthy else "unhealthy", accounts=accounts, invariant=invariant
@@ -1,6 +1,6 @@
 from mkdi_shared.schemas import protocol
-from sqlmodel import Session
-from typing import List
+from sqlmodel import Session, func
+from typing import List, Tuple
 from mkdi_shared.exceptions.mkdi_api_error import MkdiError, MkdiErrorCode
 from mkdi_backend.models.transactions.transactions import (
     Internal,
@@ -15,14 +15,33 @@ from mkdi_backend.models.models import KcUser
 from mkdi_backend.models.office import OfficeWallet, Office
 from mkdi_backend.models.Account import Account, AccountMonthlyReport
 from mkdi_backend.models.Agent import Agent
+from mkdi_backend.models.account_report import effective_balances, refresh_open_reports
 
 from sqlmodel.sql.expression import select, or_
+from sqlalchemy import union_all
+import sqlalchemy as sa
 
+from asyncio import TaskGroup
 from datetime import timedelta, datetime
 from dateutil import parser
 from loguru import logger
 from mkdi_backend.repositories.transactions import TransactionRepository
-import json
+from mkdi_backend.dbmanager import sessionmanager
+from mkdi_backend.config import settings
+from mkdi_backend.models.report_cache import (
+    cached_report,
+    dumps,
+    ensure_generation,
+    report_generation,
+    store_report,
+)
+from pydantic import parse_raw_as
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+# position of the wallet trading results in the monthly report
+TRADING_PART = 4
+RESULT_TYPE = sa.Enum(protocol.ResultType, native_enum=False)
 
 
 class ReportRepository:
@@ -30,12 +49,9 @@ class ReportRepository:
     def __init__(self, db: Session):
         self.db = db
 
-    def get_monthly_report(
+    async def get_monthly_report(
         self, office_id: str, start_date_str: str, end_date_str: str
     ) -> protocol.ReportResponse:
-        # This is a dummy implementation
-        report = protocol.ReportResponse(results=[])
-
         today = datetime.now()
 
         date_format = "%Y-%m-%dT%H:%M:%S.%fZ"
@@ -50,34 +66,73 @@ class ReportRepository:
         else:
             end_date = self._end_of_day(datetime.strptime(end_date_str, date_format))
 
-        internals = self._get_model_result(Internal, office_id, start_date, end_date)
-        externals = self._get_model_result(External, office_id, start_date, end_date)
-        sending = self._get_model_result(Sending, office_id, start_date, end_date)
-        forex = self._get_forex_result(office_id, start_date, end_date)
-        tradings = self._get_wallet_trading_result(office_id, start_date, end_date)
-
-        office_deposits = self._get_office_deposits(office_id, start_date, end_date)
-        office_internals = self._get_office_internals(office_id, start_date, end_date)
-        office_externals = self._get_office_externals(office_id, start_date, end_date)
-
-        report.results.extend(internals)
-        report.results.extend(externals)
-        report.results.extend(sending)
-        report.results.extend(forex)
-        report.results.extend(tradings)
-        report.results.extend(office_deposits)
-        report.results.extend(office_internals)
-        report.results.extend(office_externals)
-
+        # reports of past months no longer receive transactions
+        closed = settings.REPORT_CACHE and end_date < self._start_of_day(
+            self._first_day_of_month(today)
+        )
+        key = f"office-report:{office_id}:{start_date.isoformat()}:{end_date.isoformat()}"
+        # self.db is the async session of the request here
+        session: AsyncSession = self.db
+        generation = None
+        if closed:
+            payload = await session.scalar(cached_report(key))
+            if payload is not None:
+                return protocol.ReportResponse.parse_raw(payload)
+            generation = await self._a_report_generation(office_id)
+
+        report = await self._get_monthly_results(office_id, start_date, end_date)
+        if generation is not None:
+            try:
+                await session.execute(
+                    store_report(key, office_id, start_date, end_date, dumps(report), generation)
+                )
+                await session.commit()
+            except SQLAlchemyError as e:
+                await session.rollback()
+                logger.warning(f"Could not cache report {key}: {e}")
         return report
 
-    def _get_office_account(self, office_id: str):
-        return self.db.scalar(
-            select(Account)
-            .where(Account.type == protocol.AccountType.OFFICE)
-            .where(Account.office_id == office_id)
+    async def _a_report_generation(self, office_id) -> int | None:
+        """async version of _report_generation"""
+        session: AsyncSession = self.db
+        try:
+            await session.execute(ensure_generation(office_id))
+            generation = await session.scalar(report_generation(office_id))
+            await session.commit()
+            return generation
+        except SQLAlchemyError as e:
+            await session.rollback()
+            logger.warning(f"Could not read the report generation of {office_id}: {e}")
+            return None
+
+    async def _get_monthly_results(
+        self, office_id: str, start_date: datetime, end_date: datetime
+    ) -> protocol.ReportResponse:
+        # the trading results are only computed in python, both queries run concurrently
+        async with TaskGroup() as tg:
+            office_results = tg.create_task(
+                self._fetch_all(self._office_results_query(office_id, start_date, end_date))
+            )
+            tradings = tg.create_task(
+                self._get_wallet_trading_result(office_id, start_date, end_date)
+            )
+
+        fields = protocol.OfficeResult.__fields__
+        results = [
+            (row["part"], protocol.OfficeResult.construct(**{name: row[name] for name in fields}))
+            for row in office_results.result()
+        ]
+        # keep the report order: charges and forex, tradings, then the office account results
+        return protocol.ReportResponse.construct(
+            results=[result for part, result in results if part < TRADING_PART]
+            + tradings.result()
+            + [result for part, result in results if part > TRADING_PART]
         )
 
+    async def _fetch_all(self, stmt) -> list:
+        async with sessionmanager.session() as session:
+            return (await session.execute(stmt)).mappings().all()
+
     def _start_of_day(self, date):
         return date.replace(hour=0, minute=0, second=0, microsecond=0)
 
@@ -90,66 +145,92 @@ class ReportRepository:
     def _last_day_of_month(self, date):
         return date.replace(day=28) + timedelta(days=4)
 
-    def _get_model_result(self, model, office_id: str, start_date: datetime, end_date: datetime):
-        transactions = self.db.scalars(
-            select(model)
-            .where(model.charges > 0)
-            .where(model.office_id == office_id)
-            .where(model.created_at >= start_date)
-            .where(model.created_at <= end_date)
-            .order_by(model.created_at)
-        ).all()
+    def _office_results_query(self, office_id: str, start_date: datetime, end_date: datetime):
+        """Every result of the monthly report but the tradings, as a single UNION ALL.
 
-        return list(
-            map(
-                lambda transaction: protocol.OfficeResult(
-                    result_source=transaction.type,
-                    result_type=protocol.ResultType.BENEFIT,
-                    amount=transaction.charges,
-                    code=transaction.code,
-                    transaction_id=transaction.id,
-                    date=transaction.created_at,
-                    state=transaction.state,
-                ),
-                transactions,
-            )
+        The office account is resolved once by a sub query. Rows are ordered by report part,
+        then by date, and carry the fields of protocol.OfficeResult.
+        """
+        office_account = (
+            select(Account.initials)
+            .where(Account.type == protocol.AccountType.OFFICE)
+            .where(Account.office_id == office_id)
+            .limit(1)
+            .scalar_subquery()
         )
 
-    def _get_forex_result(self, office_id: str, start_date: datetime, end_date: datetime):
-        results = self.db.scalars(
-            select(ForEx)
-            .where(ForEx.created_at >= start_date)
-            .where(ForEx.created_at <= end_date)
-            .where(ForEx.office_id == office_id)
-            .order_by(ForEx.created_at)
-        ).all()
-        # filter the results to keep only those with forex_result != 0
-        results = list(filter(lambda transaction: transaction.forex_result != 0, results))
-        return list(
-            map(
-                lambda transaction: protocol.OfficeResult(
-                    result_source=transaction.type,
-                    result_type=protocol.ResultType.BENEFIT,
-                    amount=transaction.forex_result,
-                    code=transaction.code,
-                    transaction_id=transaction.id,
-                    date=transaction.created_at,
-                    state=transaction.state,
-                    tag=transaction.tag,
-                ),
-                results,
+        def result(part, model, result_type, amount, tag=None):
+            return (
+                select(
+                    sa.literal(part).label("part"),
+                    model.type.label("result_source"),
+                    result_type.label("result_type"),
+                    amount.label("amount"),
+                    model.code,
+                    model.id.label("transaction_id"),
+                    model.created_at.label("date"),
+                    model.state,
+                    (sa.null() if tag is None else tag).label("tag"),
+                )
+                .where(model.office_id == office_id)
+                .where(model.created_at >= start_date)
+                .where(model.created_at <= end_date)
             )
-        )
 
-    def _get_wallet_trading_result(self, office_id: str, start_date: datetime, end_date: datetime):
-        results = self.db.scalars(
-            select(WalletTrading)
-            .join(OfficeWallet, WalletTrading.walletID == OfficeWallet.walletID)
-            .where(OfficeWallet.office_id == office_id)
-            .where(WalletTrading.created_at >= start_date)
-            .where(WalletTrading.created_at <= end_date)
-            .order_by(WalletTrading.created_at)
-        ).all()
+        def tags(model):
+            return func.nullif(func.array_to_string(model.tags, ","), "")
+
+        benefit = sa.literal(protocol.ResultType.BENEFIT, RESULT_TYPE)
+        expense = sa.literal(protocol.ResultType.EXPENSE, RESULT_TYPE)
+        parts = [
+            result(0, Internal, benefit, Internal.charges).where(Internal.charges > 0),
+            result(1, External, benefit, External.charges).where(External.charges > 0),
+            result(2, Sending, benefit, Sending.charges).where(Sending.charges > 0),
+            result(3, ForEx, benefit, ForEx.forex_result, ForEx.tag).where(ForEx.forex_result != 0),
+            # the wallet trading results come here, see TRADING_PART
+            result(5, Deposit, benefit, Deposit.amount, tags(Deposit)).where(
+                Deposit.owner_initials == office_account
+            ),
+            result(
+                6,
+                Internal,
+                sa.case((Internal.sender_initials == office_account, expense), else_=benefit),
+                Internal.amount,
+                tags(Internal),
+            ).where(
+                or_(
+                    Internal.sender_initials == office_account,
+                    Internal.receiver_initials == office_account,
+                )
+            ),
+            result(7, External, expense, External.amount, tags(External)).where(
+                External.sender_initials == office_account
+            ),
+        ]
+        rows = union_all(*parts).subquery()
+        return select(rows).order_by(rows.c.part, rows.c.date)
+
+    async def _get_wallet_trading_result(
+        self, office_id: str, start_date: datetime, end_date: datetime
+    ) -> List[protocol.OfficeResult]:
+        async with sessionmanager.session() as session:
+            results = (
+                await session.scalars(
+                    select(WalletTrading)
+                    .join(OfficeWallet, WalletTrading.walletID == OfficeWallet.walletID)
+                    .where(OfficeWallet.office_id == office_id)
+                    .where(WalletTrading.created_at >= start_date)
+                    .where(WalletTrading.created_at <= end_date)
+                    # the result of those tradings is always 0
+                    .where(WalletTrading.state != protocol.TransactionState.PENDING)
+                    .where(
+                        WalletTrading.trading_type.not_in(
+                            [protocol.TradingType.DEPOSIT, protocol.TradingType.BUY]
+                        )
+                    )
+                    .order_by(WalletTrading.created_at)
+                )
+            ).all()
         # filter the results to keep only those with trading_result != 0
         results = list(filter(lambda transaction: transaction.trading_result != 0, results))
         return list(
@@ -172,64 +253,89 @@ class ReportRepository:
         )
 
     def start_reports(self):
-        """
-        this function will check in the database
-        for every account
-          check if there is an open account report in the db
-          if there is then no action
-          if not create the account report that should start now
-        """
+        """Open the report of the current month of every agent and supplier account.
 
-        # get current month date
-        current_month = datetime.now().replace(day=1, hour=0, minute=0, second=0)
-        # for every office get all accounts
-        offices = self.db.scalars(select(Office)).all()
-
-        for office in offices:
-            #
-            accounts = self.db.scalars(
-                select(Account)
-                .where(Account.office_id == office.id)
-                .where(
-                    Account.type.in_([protocol.AccountType.AGENT, protocol.AccountType.SUPPLIER])
+        The reports of the previous months still open are closed with the current effective
+        balance. Each office is rolled over with one UPDATE and one INSERT ... SELECT, the
+        effective balances being computed by a single grouped pendings query, and every office
+        is committed in the same transaction.
+        """
+        current_month = datetime.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        office_ids = self.db.scalars(select(Office.id)).all()
+        try:
+            for office_id in office_ids:
+                closed, created = self.start_office_reports(office_id, current_month)
+                logger.info(
+                    f"Office {office_id}: {created} reports opened, {closed} closed "
+                    f"for month {current_month.month}"
                 )
-            ).all()
-
-            for account in accounts:
+            self.db.commit()
+        except SQLAlchemyError as e:
+            self.db.rollback()
+            logger.error(f"Error starting the monthly reports {e}")
 
-                self.start_report(account, current_month)
+    def start_office_reports(self, office_id, current_month: datetime) -> Tuple[int, int]:
+        """Roll the reports of an office accounts over to ``current_month``, without committing.
 
-    def start_report(self, account: Account, current_month: datetime):
-        # Get the first day of the next month
-        next_month = (current_month + timedelta(days=32)).replace(day=1, hour=0, minute=0, second=0)
-        try:
+        Args:
+            office_id (UUID): the office
+            current_month (datetime): first day of the month the reports start
 
-            has_report = self.db.scalar(
-                select(AccountMonthlyReport)
-                .where(AccountMonthlyReport.account_id == account.id)
-                .where(AccountMonthlyReport.start_date <= (current_month + timedelta(hours=1)))
-                .where(AccountMonthlyReport.end_date < next_month)
+        Returns:
+            Tuple[int, int]: number of reports closed and opened
+        """
+        next_month = (current_month + timedelta(days=32)).replace(day=1)
+        accounts = (
+            select(Account.initials)
+            .where(Account.office_id == office_id)
+            .where(Account.type.in_([protocol.AccountType.AGENT, protocol.AccountType.SUPPLIER]))
+        )
+        balances = effective_balances(accounts).cte("balances")
+        now = datetime.now()
+
+        closed = self.db.execute(
+            sa.update(AccountMonthlyReport)
+            .where(AccountMonthlyReport.account_id == balances.c.account_id)
+            .where(AccountMonthlyReport.is_open == True)  # noqa: E712
+            .where(AccountMonthlyReport.end_date < current_month)
+            .values(is_open=False, end_balance=balances.c.effective_balance, updated_at=now)
+        ).rowcount
+
+        has_report = (
+            select(AccountMonthlyReport.id)
+            .where(AccountMonthlyReport.account_id == balances.c.account_id)
+            .where(AccountMonthlyReport.start_date < next_month)
+            .where(AccountMonthlyReport.end_date >= current_month)
+        )
+        created = self.db.execute(
+            sa.insert(AccountMonthlyReport).from_select(
+                [
+                    "account_id",
+                    "account",
+                    "start_date",
+                    "end_date",
+                    "is_open",
+                    "start_balance",
+                    "end_balance",
+                    "updated_at",
+                    "account_version",
+                ],
+                select(
+                    balances.c.account_id,
+                    balances.c.account,
+                    sa.literal(current_month),
+                    sa.literal(next_month - timedelta(days=1)),
+                    sa.true(),
+                    balances.c.effective_balance,
+                    balances.c.effective_balance,
+                    sa.literal(now),
+                    balances.c.version,
+                ).where(~has_report.exists()),
+                # the ids are generated by the database
+                include_defaults=False,
             )
-
-            if not has_report:
-                # Create a new report if one doesn't exist for the current month
-                logger.info(
-                    f"Creating report for month {current_month.month} for account {account.initials}"
-                )
-                new_report = AccountMonthlyReport(
-                    account_id=account.id,
-                    start_date=current_month,
-                    end_date=next_month - timedelta(days=1),
-                    account=account.initials,
-                    is_open=True,
-                    start_balance=account.effective_balance,
-                    end_balance=account.effective_balance,
-                    # Add other necessary fields
-                )
-                self.db.add(new_report)
-                self.db.commit()
-        except Exception as e:
-            logger.info(f"Error creating report for account {e}")
+        ).rowcount
+        return closed, created
 
     def get_agent_yearly_reports(
         self, user: KcUser, initials: str, year: int
@@ -259,13 +365,68 @@ class ReportRepository:
         if not account_report:
             raise MkdiError(message="", error_code=MkdiErrorCode.GENERIC_ERROR)
 
-        account = account_report.account
         next_month = datetime.now().replace(day=1, hour=0, minute=0, second=0) + timedelta(days=32)
-        end_date = next_month if account_report.is_open else account_report.end_date
+        # a closed report only changes when one of its transactions is rolled back
+        cache_key = None if account_report.is_open else f"account-report:{account_report.id}"
+        payload = generation = office_id = None
+        if cache_key and settings.REPORT_CACHE:
+            payload = self.db.scalar(cached_report(cache_key))
+            if payload is None:
+                office_id = self.db.scalar(
+                    select(Account.office_id).where(Account.id == account_report.account_id)
+                )
+                generation = self._report_generation(office_id)
+
+        if payload is not None:
+            results = parse_raw_as(List[protocol.AccountReportItem], payload)
+        else:
+            end_date = next_month if account_report.is_open else account_report.end_date
+            results = self._get_account_report_items(
+                account_report.account, account_report.start_date, end_date
+            )
+
+        res = protocol.AccountMonthlyReportResponse(
+            **account_report.dict(), reports=results, pendings=0
+        )
+        if generation is not None:
+            self._store_report(
+                cache_key, office_id, res.start_date, res.end_date, dumps(results), generation
+            )
+        return res
+
+    def _report_generation(self, office_id) -> int | None:
+        """generation of the office cached reports, None when the report must not be cached
+
+        Committed at once, an invalidation must not wait for the report to be computed.
+        """
+        try:
+            self.db.execute(ensure_generation(office_id))
+            generation = self.db.scalar(report_generation(office_id))
+            self.db.commit()
+            return generation
+        except SQLAlchemyError as e:
+            self.db.rollback()
+            logger.warning(f"Could not read the report generation of {office_id}: {e}")
+            return None
+
+    def _store_report(
+        self, key: str, office_id, start_date, end_date, payload: str, generation: int
+    ):
+        try:
+            self.db.execute(store_report(key, office_id, start_date, end_date, payload, generation))
+            self.db.commit()
+        except SQLAlchemyError as e:
+            # the report was computed, failing to cache it is not an error for the caller
+            self.db.rollback()
+            logger.warning(f"Could not cache report {key}: {e}")
+
+    def _get_account_report_items(
+        self, account: str, start_date: datetime, end_date: datetime
+    ) -> List[protocol.AccountReportItem]:
         deposits = self.db.scalars(
             select(Deposit)
             .where(Deposit.owner_initials == account)
-            .where(Deposit.created_at >= account_report.start_date)
+            .where(Deposit.created_at >= start_date)
             .where(Deposit.created_at <= end_date)
             .order_by(Deposit.created_at.desc())
         ).all()
@@ -273,7 +434,7 @@ class ReportRepository:
         externals = self.db.scalars(
             select(External)
             .where(External.sender_initials == account)
-            .where(External.created_at >= account_report.start_date)
+            .where(External.created_at >= start_date)
             .where(External.created_at <= end_date)
             .order_by(External.created_at.desc())
         ).all()
@@ -281,7 +442,7 @@ class ReportRepository:
         internals = self.db.scalars(
             select(Internal)
             .where(or_(Internal.sender_initials == account, Internal.receiver_initials == account))
-            .where(Internal.created_at >= account_report.start_date)
+            .where(Internal.created_at >= start_date)
             .where(Internal.created_at <= end_date)
             .order_by(Internal.created_at.desc())
         ).all()
@@ -289,7 +450,7 @@ class ReportRepository:
         sendings = self.db.scalars(
             select(Sending)
             .where(Sending.receiver_initials == account)
-            .where(Sending.created_at >= account_report.start_date)
+            .where(Sending.created_at >= start_date)
             .where(Sending.created_at <= end_date)
             .order_by(Sending.created_at.desc())
         ).all()
@@ -297,7 +458,7 @@ class ReportRepository:
         forExs = self.db.scalars(
             select(ForEx)
             .where(ForEx.customer_account == account)
-            .where(ForEx.created_at >= account_report.start_date)
+            .where(ForEx.created_at >= start_date)
             .where(ForEx.created_at <= end_date)
             .order_by(ForEx.created_at.desc())
         ).all()
@@ -310,173 +471,106 @@ class ReportRepository:
 
             results.append(rep.report(is_out))
 
-        res = protocol.AccountMonthlyReportResponse(
-            **account_report.dict(), reports=results, pendings=0
-        )
-        return res
+        return results
 
-    def update_reports(self):
-        offices = self.db.scalars(select(Office)).all()
+    def update_reports(self, office_id=None) -> int:
+        """Reconcile the open reports with their account.
 
-        for office in offices:
-            #
-            accounts = self.db.scalars(
-                select(Account)
-                .where(Account.office_id == office.id)
-                .where(
-                    Account.type.in_([protocol.AccountType.AGENT, protocol.AccountType.SUPPLIER])
-                )
-            ).all()
+        Reports are refreshed when their account is written through the ORM, this catches
+        the balances changed by other means. Only the accounts whose version moved since
+        their report was last refreshed are recomputed.
 
-            for account in accounts:
-                try:
-                    self.update_report(account)
-                except Exception as e:
-                    logger.info(f"Error updating report for account {e}")
+        Args:
+            office_id (UUID, optional): only reconcile the reports of this office
 
-    # @managed_tx_method()
-    def update_report(self, account: Account):
-        # Get the first day of the next month
-        account_report = self.db.scalar(
-            select(AccountMonthlyReport)
-            .where(AccountMonthlyReport.account_id == account.id)
-            .add_columns(AccountMonthlyReport.is_open == True)
+        Returns:
+            int: number of reports updated
+        """
+        stale = (
+            select(Account.initials)
+            .join(AccountMonthlyReport, AccountMonthlyReport.account_id == Account.id)
+            .where(AccountMonthlyReport.is_open == True)  # noqa: E712
+            .where(AccountMonthlyReport.account_version.is_distinct_from(Account.version))
         )
-
-        if account_report:
-            account_report.end_balance = account.effective_balance
-            account_report.updated_at = datetime.now()
-            self.db.add(account_report)
+        if office_id:
+            stale = stale.where(Account.office_id == office_id)
+        try:
+            updated = self.db.execute(refresh_open_reports(stale)).rowcount
             self.db.commit()
-        else:
-            logger.info(f"Report for account {account.initials} not found")
-
-    def _get_tag(self, transaction):
-        if isinstance(transaction.notes, str):
-            notes = json.loads(transaction.notes if hasattr(transaction, "notes") else "[]")
-
-            for note in notes:
-                if "tags" in note:
-                    return ",".join(note["tags"])
-
-    def _get_office_deposits(self, office_id: str, start_date: datetime, end_date: datetime):
-        office_account = self._get_office_account(office_id)
-        results = self.db.scalars(
-            select(Deposit)
-            .where(Deposit.owner_initials == office_account.initials)
-            .where(Deposit.office_id == office_id)
-            .where(Deposit.created_at >= start_date)
-            .where(Deposit.created_at <= end_date)
-            .order_by(Deposit.created_at)
-        ).all()
-
-        return list(
-            map(
-                lambda transaction: protocol.OfficeResult(
-                    result_source=transaction.type,
-                    result_type=protocol.ResultType.BENEFIT,
-                    amount=transaction.amount,
-                    code=transaction.code,
-                    transaction_id=transaction.id,
-                    date=transaction.created_at,
-                    state=transaction.state,
-                    tag=self._get_tag(transaction),
-                ),
-                results,
-            )
-        )
-
-    def _get_office_internals(self, office_id: str, start_date: datetime, end_date: datetime):
-        office_account = self._get_office_account(office_id)
-        results = self.db.scalars(
-            select(Internal)
-            .where(
-                or_(
-                    Internal.sender_initials == office_account.initials,
-                    Internal.receiver_initials == office_account.initials,
-                )
-            )
-            .where(Internal.office_id == office_id)
-            .where(Internal.created_at >= start_date)
-            .where(Internal.created_at <= end_date)
-            .order_by(Internal.created_at)
-        ).all()
-
-        return list(
-            map(
-                lambda transaction: protocol.OfficeResult(
-                    result_source=transaction.type,
-                    result_type=(
-                        protocol.ResultType.EXPENSE
-                        if transaction.sender_initials == office_account.initials
-                        else protocol.ResultType.BENEFIT
-                    ),
-                    amount=transaction.amount,
-                    code=transaction.code,
-                    transaction_id=transaction.id,
-                    date=transaction.created_at,
-                    state=transaction.state,
-                    tag=self._get_tag(transaction),
-                ),
-                results,
-            )
-        )
-
-    def _get_office_externals(self, office_id: str, start_date: datetime, end_date: datetime):
-        office_account = self._get_office_account(office_id)
-        results = self.db.scalars(
-            select(External)
-            .where(External.sender_initials == office_account.initials)
-            .where(External.office_id == office_id)
-            .where(External.created_at >= start_date)
-            .where(External.created_at <= end_date)
-            .order_by(External.created_at)
-        ).all()
-
-        return list(
-            map(
-                lambda transaction: protocol.OfficeResult(
-                    result_source=transaction.type,
-                    result_type=protocol.ResultType.EXPENSE,
-                    amount=transaction.amount,
-                    code=transaction.code,
-                    transaction_id=transaction.id,
-                    date=transaction.created_at,
-                    state=transaction.state,
-                    tag=self._get_tag(transaction),
-                ),
-                results,
-            )
+            logger.info(f"{updated} open reports reconciled")
+            return updated
+        except SQLAlchemyError as e:
+            self.db.rollback()
+            logger.error(f"Error updating the open reports {e}")
+            return 0
+
+    def _report_period(self, start: str | None, end: str | None):
+        today = datetime.now()
+        try:
+            start_date = self._start_of_day(parser.parse(start)) if start else None
+            end_date = self._end_of_day(parser.parse(end)) if end else None
+        except (ValueError, OverflowError) as e:
+            logger.debug(f"Error parsing report dates {e}")
+            raise MkdiError(
+                f"Invalid report period {start} - {end}", error_code=MkdiErrorCode.INVALID_INPUT
+            ) from e
+
+        return (
+            start_date or self._first_day_of_month(today),
+            end_date or self._last_day_of_month(today),
         )
 
     def get_provider_report(self, user, name, start, end):
-
-        today = datetime.now()
-
-        if not start:
-            start_date = self._first_day_of_month(today)
-        else:
-            try:
-                start_date = self._start_of_day(parser.parse(start))
-            except Exception as e:
-                logger.debug(f"Error parsing start date {e}")
-
-        if not end:
-            end_date = self._last_day_of_month(today)
-        else:
-            end_date = self._end_of_day(parser.parse(end))
-
-        results = self.db.scalars(
+        start_date, end_date = self._report_period(start, end)
+        return self.db.scalars(
             select(ForEx)
+            .where(ForEx.office_id == user.office_id)
+            .where(ForEx.tag == name)
             .where(ForEx.created_at >= start_date)
             .where(ForEx.created_at <= end_date)
-            .where(ForEx.office_id == user.office_id)
             .order_by(ForEx.created_at)
         ).all()
-        filtered = list()
 
-        for item in results:
-            if name == item.tag:
-                filtered.append(item)
+    def get_providers_summary(
+        self,
+        user: KcUser,
+        start: str | None,
+        end: str | None,
+        period: protocol.ReportPeriod = protocol.ReportPeriod.DAY,
+        name: str | None = None,
+    ) -> List[protocol.ProviderReportItem]:
+        """Forex totals by provider and by day or month, aggregated by the database.
+
+        Args:
+            user (KcUser): the office user
+            start (str | None): first day of the report, the current month by default
+            end (str | None): last day of the report
+            period (protocol.ReportPeriod): length of the periods the totals are grouped by
+            name (str | None): only report this provider
+
+        Returns:
+            List[protocol.ProviderReportItem]: one item per provider and period
+        """
+        start_date, end_date = self._report_period(start, end)
+        period_start = func.date_trunc(period.value, ForEx.created_at).label("period")
+        stmt = (
+            select(
+                ForEx.tag.label("provider"),
+                period_start,
+                func.count().label("count"),
+                func.sum(ForEx.amount).label("amount"),
+                func.sum(ForEx.buying_amount).label("buying_amount"),
+                func.sum(ForEx.selling_amount).label("selling_amount"),
+                func.sum(ForEx.forex_result).label("forex_result"),
+            )
+            .where(ForEx.office_id == user.office_id)
+            .where(ForEx.tag.is_not(None))
+            .where(ForEx.created_at >= start_date)
+            .where(ForEx.created_at <= end_date)
+            .group_by(ForEx.tag, period_start)
+            .order_by(ForEx.tag, period_start)
+        )
+        if name:
+            stmt = stmt.where(ForEx.tag == name)
 
-        return filtered
+        return [protocol.ProviderReportItem(**row) for row in self.db.execute(stmt).mappings()]
@@ -16,7 +16,7 @@ class BuyTrade(IPayableTrade):
         wallet = self.get_wallet(request.walletID)
         provider = self.get_account(br.provider)
 
-        code = wallet.generate_code()
+        code = self.generate_code(wallet)
 
         trade = WalletTrading(
             walletID=wallet.walletID,
@@ -16,7 +16,7 @@ class DepositTrade(IPayableTrade):
         wallet = self.get_wallet(request.walletID)
         provider = self.get_account(dr.provider)
 
-        code = wallet.generate_code()
+        code = self.generate_code(wallet)
 
         trade = WalletTrading(
             walletID=wallet.walletID,
@@ -21,7 +21,7 @@ class ExchangeTrade(ITrade):
         wallet = self.get_wallet(request.walletID)
         exchange_wallet = self.get_wallet(er.walletID)
 
-        code = wallet.generate_code()
+        code = self.generate_code(wallet)
 
         trade = WalletTrading(
             walletID=wallet.walletID,
@@ -48,10 +48,6 @@ class ExchangeTrade(ITrade):
 
         return trade
 
-    def accounts(self):
-        """Get accounts involved in trading"""
-        return [self.get_office()]
-
     def selling_amount(self, trade: WalletTrading, wallet_type: pr.WalletType):
         if wallet_type == pr.WalletType.CRYPTO:
             return trade.amount * trade.trading_rate / trade.daily_rate
@@ -1,15 +1,36 @@
 """Sell Trade"""
 
+from typing import List
+from sqlalchemy.orm.attributes import flag_modified
+from sqlmodel import select
+from mkdi_shared.exceptions.mkdi_api_error import MkdiError, MkdiErrorCode
 from mkdi_shared.schemas import protocol as pr
 from mkdi_backend.models.transactions.transactions import WalletTrading
+from mkdi_backend.models.Account import Account
 
 from mkdi_backend.repositories.trades.trade import ITrade
-from mkdi_backend.models.office import WalletRates, OfficeWallet
+from mkdi_backend.models.office import (
+    WalletRates,
+    OfficeWallet,
+    get_wallets_pendings,
+    is_pending_out,
+)
 from mkdi_backend.repositories.transaction_repos.invariant import (
     managed_invariant_tx_method,
     CommitMode,
 )
 
+# columns of a trade changed by its commit
+COMMITTED_COLUMNS = [
+    "amount",
+    "trading_rate",
+    "state",
+    "pendings",
+    "wallet_trading",
+    "wallet_value",
+    "wallet_crypto",
+]
+
 
 class SellTrade(ITrade):
     """Buy Trade Class"""
@@ -21,7 +42,7 @@ class SellTrade(ITrade):
         wallet = self.get_wallet(request.walletID)
         account = self.get_account(br.customer)
 
-        code = wallet.generate_code()
+        code = self.generate_code(wallet)
 
         trade = WalletTrading(
             walletID=wallet.walletID,
@@ -43,10 +64,6 @@ class SellTrade(ITrade):
 
         return trade
 
-    def accounts(self):
-        """Get accounts involved in selling"""
-        return [self.get_account(self.trade.account), self.get_office()]
-
     def selling_amount(self, trade: WalletTrading, wallet: OfficeWallet):
         """
         Determine how much the trade has been sold
@@ -144,6 +161,17 @@ class SellTrade(ITrade):
         office = self.get_office()
 
         self.update_trade(trade, wallet)
+        return self.apply_commit(commit, trade, wallet, account, office)
+
+    def apply_commit(
+        self,
+        commit: pr.CommitTradeRequest,
+        trade: WalletTrading,
+        wallet: OfficeWallet,
+        account: Account,
+        office: Account,
+    ) -> WalletTrading:
+        """apply the committed amounts of a pending sell to its wallet and accounts"""
         trade.amount = commit.amount
         trade.trading_rate = commit.trading_rate
 
@@ -164,6 +192,82 @@ class SellTrade(ITrade):
 
         return trade
 
+    @managed_invariant_tx_method(auto_commit=CommitMode.COMMIT)
+    def commit_group(self, group: List[pr.CommitTradeRequest]) -> List[WalletTrading]:
+        """Commit a group of pending sells in one database transaction.
+
+        The trades with their wallets, the accounts and the wallet pendings are loaded once,
+        the sells are then applied in the order of the group on the loaded wallets, keeping
+        their pendings up to date. Nothing is committed when a trade of the group can't be.
+
+        Args:
+            group (List[pr.CommitTradeRequest]): the commits, one per trade
+
+        Raises:
+            MkdiError: INVALID_STATE, listing every trade that can't be committed
+
+        Returns:
+            List[WalletTrading]: the committed trades, in the order of the group
+        """
+        db = self.session.db
+        codes = [commit.code for commit in group]
+        trades = {
+            trade.code: (trade, wallet)
+            for trade, wallet in db.execute(
+                select(WalletTrading, OfficeWallet)
+                .join(OfficeWallet, OfficeWallet.walletID == WalletTrading.walletID)
+                .where(WalletTrading.code.in_(codes))
+            )
+        }
+
+        initials = {trade.account for trade, _ in trades.values()}
+        accounts = {
+            account.initials: account
+            for account in db.scalars(select(Account).where(Account.initials.in_(initials)))
+        }
+
+        failures, seen = [], set()
+        for code in codes:
+            trade, _ = trades.get(code, (None, None))
+            if trade is None:
+                failures.append(f"{code}: not found")
+            elif code in seen:
+                failures.append(f"{code}: committed twice")
+            elif trade.trading_type not in [pr.TradingType.SELL, pr.TradingType.SIMPLE_SELL]:
+                failures.append(f"{code}: {trade.trading_type.value} trades are not committed")
+            elif trade.state != pr.TransactionState.PENDING:
+                failures.append(f"{code}: {trade.state.value} trades are not committed")
+            elif trade.account not in accounts:
+                failures.append(f"{code}: account {trade.account} not found")
+            seen.add(code)
+        if failures:
+            raise MkdiError(
+                f"Trades not committed, {'; '.join(failures)}",
+                error_code=MkdiErrorCode.INVALID_STATE,
+            )
+
+        office = self.get_office()
+        pendings = get_wallets_pendings(
+            db, list({wallet.walletID for _, wallet in trades.values()})
+        )
+
+        committed = []
+        for commit in group:
+            trade, wallet = trades[commit.code]
+            self.update_trade(trade, wallet, pendings)
+            if is_pending_out(trade, wallet):
+                # the trade is no longer pending once committed
+                pending_in, pending_out, payment = pendings[wallet.walletID]
+                pendings[wallet.walletID] = (pending_in, pending_out - trade.amount, payment)
+            committed.append(
+                self.apply_commit(commit, trade, wallet, accounts[trade.account], office)
+            )
+            # update every trade with the same columns, the flush sends them in one batch
+            for column in COMMITTED_COLUMNS:
+                flag_modified(trade, column)
+
+        return committed
+
     @managed_invariant_tx_method(auto_commit=CommitMode.COMMIT)
     def rollback_paid(self, trade: WalletTrading) -> WalletTrading:
         """Rollback a paid trade"""
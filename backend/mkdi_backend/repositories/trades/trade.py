@@ -9,9 +9,10 @@ from decimal import Decimal
 from mkdi_shared.schemas import protocol as pr
 from mkdi_backend.api.deps import UserDBSession
 from mkdi_backend.models.transactions.transactions import WalletTrading, Payment
-from mkdi_backend.models.office import OfficeWallet
+from mkdi_backend.models.office import NO_PENDINGS, OfficeWallet, get_wallets_pendings
 from mkdi_backend.models.Account import Account
 from mkdi_backend.models.Activity import Activity, FundCommit
+from mkdi_backend.models.codes import format_code, next_code_number, wallet_code_sequence
 from mkdi_backend.utils.database import managed_tx_method, CommitMode
 from mkdi_backend.repositories.transaction_repos.invariant import managed_invariant_tx_method
 
@@ -122,6 +123,13 @@ class ITrade:
             select(OfficeWallet).where(OfficeWallet.walletID == wallet_id)
         )
 
+    def generate_code(self, wallet: OfficeWallet) -> str:
+        """allocate the code of a new trade of the wallet"""
+        number = self.session.get_db().scalar(
+            next_code_number(wallet_code_sequence(wallet.walletID))
+        )
+        return format_code(wallet.initials, number)
+
     def get_account(self, initials: str) -> Account:
         """get Account"""
         return self.session.get_db().exec(select(Account).where(Account.initials == initials)).one()
@@ -152,9 +160,14 @@ class ITrade:
             )
         )
 
-    def update_trade(self, trade: WalletTrading, wallet: OfficeWallet):
-        """update trade infos from wallet"""
-        trade.pendings = wallet.pending_in - wallet.pending_out
+    def update_trade(self, trade: WalletTrading, wallet: OfficeWallet, pendings: dict = None):
+        """update trade infos from wallet, ``pendings`` are the wallet pendings when known"""
+        if pendings is None:
+            # the trade may still be half built, don't flush it to compute the wallet pendings
+            with self.session.db.no_autoflush:
+                pendings = get_wallets_pendings(self.session.db, [wallet.walletID])
+        pending_in, pending_out, _ = pendings.get(wallet.walletID, NO_PENDINGS)
+        trade.pendings = pending_in - pending_out
         trade.wallet_trading = wallet.trading_balance
         trade.wallet_value = wallet.value
         trade.wallet_crypto = wallet.crypto_balance
@@ -195,10 +208,6 @@ class IPayableTrade(ITrade):
     ) -> WalletTrading:
         """create a trade from the user request"""
 
-    def accounts(self):
-        """return office accounts (fund and office)"""
-        return [self.get_office(), self.get_fund()]
-
     @abstractmethod
     def get_payment_amount(self, trade: WalletTrading) -> Decimal:
         """Get the amount to be paid"""
@@ -1,4 +1,4 @@
-from typing import Callable
+from typing import Callable, List
 from mkdi_shared.schemas import protocol as pr
 
 from mkdi_backend.models.transactions.transactions import WalletTrading
@@ -63,6 +63,10 @@ class TradeBuilder:
     def commit(self,commit:pr.CommitTradeRequest, trade:WalletTrading)-> WalletTrading:
         return self.get_instance(trade).commit(commit,trade)
 
+    def commit_group(self,group:List[pr.CommitTradeRequest])-> List[WalletTrading]:
+        """Commit pending sells at once"""
+        return SellTrade(self.session).commit_group(group)
+
     def rollback(self,cancellation:pr.CancelTransaction,trade:WalletTrading)-> WalletTrading:
         return self.get_instance(trade).rollback(cancellation,trade)
     
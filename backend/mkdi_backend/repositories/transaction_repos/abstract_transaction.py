@@ -1,12 +1,14 @@
 """Module providing a generic interface for transaction handling."""
 
 from abc import ABC, abstractmethod
-from typing import List, Tuple
+from typing import Dict, List, Tuple
 
 from datetime import datetime
+from http import HTTPStatus
 from loguru import logger
 from sqlalchemy.ext.asyncio.session import AsyncSession
 from mkdi_backend.models.Account import Account
+from mkdi_backend.models.codes import account_code_sequence, format_code, next_code_number
 from mkdi_backend.models import (
     Activity,
     Deposit,
@@ -19,10 +21,13 @@ from mkdi_backend.models import (
 )
 
 from mkdi_backend.models.models import KcUser
-from mkdi_backend.utils.database import CommitMode, managed_tx_method
+from mkdi_backend.utils.database import CommitMode, async_managed_tx_method, managed_tx_method
 from mkdi_shared.exceptions.mkdi_api_error import MkdiError, MkdiErrorCode
 from mkdi_shared.schemas import protocol as pr
-from mkdi_backend.repositories.transaction_repos.invariant import has_activity_started
+from mkdi_backend.repositories.transaction_repos.invariant import (
+    async_has_activity_started,
+    has_activity_started,
+)
 
 from sqlmodel import Session, select
 import json
@@ -61,6 +66,8 @@ class AbstractTransaction(ABC):
         self.activity = None
         self.input = user_input
         self.transaction = None
+        # notes written by the review methods, inside their managed transaction
+        self.pending_notes = []
 
     def set_transaction(self, transaction: pr.TransactionDB):
         """
@@ -83,14 +90,13 @@ class AbstractTransaction(ABC):
     async def a_has_started_activity(self):
         session: AsyncSession = self.db
         if not self.activity:
-            self.activity = dict(
-                await session.scalar(
-                    select(Activity).where(
-                        Activity.office_id == self.user.office_id,
-                        Activity.state == pr.ActivityState.OPEN,
-                    )
+            activity = await session.scalar(
+                select(Activity).where(
+                    Activity.office_id == self.user.office_id,
+                    Activity.state == pr.ActivityState.OPEN,
                 )
             )
+            self.activity = dict(activity) if activity else None
 
         return self.activity
 
@@ -120,6 +126,16 @@ class AbstractTransaction(ABC):
         # apply steps to request a transaction
         return self.do_transaction()
 
+    @async_has_activity_started
+    @async_managed_tx_method(auto_commit=CommitMode.COMMIT)
+    async def a_request(self):
+        """Request review for a transaction on an async session
+
+        Returns:
+            the created transaction
+        """
+        return await self.a_do_transaction()
+
     def set_activity(self, activity: Activity):
         """set current activity
 
@@ -174,6 +190,18 @@ class AbstractTransaction(ABC):
 
         return account
 
+    async def a_use_account(
+        self, initials: str, account_type: pr.AccountType = pr.AccountType.AGENT
+    ) -> Account:
+        """async version of use_account"""
+        session: AsyncSession = self.db
+        accounts = await session.scalars(
+            select(Account)
+            .where(Account.initials == initials)
+            .where(Account.office_id == self.user.office_id)
+        )
+        return accounts.one()
+
     def get_rate(self):
         """
         Returns the rate of the transaction amount.
@@ -217,14 +245,22 @@ class AbstractTransaction(ABC):
         """
         return self.input
 
-    def review(self, code: str) -> pr.TransactionResponse:
-        """Review a transaction"""
+    def prepare_review(self, transaction: pr.TransactionDB, code: str) -> pr.ValidationState:
+        """
+        Check that a transaction can be reviewed and queue the review note.
 
-        transaction: pr.TransactionDB = self.get_transaction(code)
+        Args:
+            transaction (pr.TransactionDB): The transaction to review, None when not found.
+            code (str): The transaction code.
+
+        Returns:
+            pr.ValidationState: The requested review.
+        """
         if not transaction:
             raise MkdiError(
                 error_code=MkdiErrorCode.NOT_FOUND,
                 message=f"Transaction with code {code} not found",
+                http_status_code=HTTPStatus.NOT_FOUND,
             )
 
         self.set_transaction(transaction)
@@ -236,34 +272,29 @@ class AbstractTransaction(ABC):
             )
 
         user_input: pr.TransactionReviewReq = self.get_inputs()
-        try:
-            review = None
-            match user_input.state:
-                case pr.ValidationState.APPROVED:
-
-                    review = self.approve
-                case pr.ValidationState.REJECTED:
-                    review = self.reject
-                case pr.ValidationState.CANCELLED:
-                    review = self.cancel
-                case _:
-                    raise MkdiError(
-                        error_code=MkdiErrorCode.INVALID_INPUT,
-                        message="Invalid transaction request",
-                    )
-
-            if not review:
-                logger.info("Could not find a review function")
-                raise MkdiError(
-                    error_code=MkdiErrorCode.INVALID_INPUT, message="Invalid transaction request"
-                )
+        if user_input.state not in (
+            pr.ValidationState.APPROVED,
+            pr.ValidationState.REJECTED,
+            pr.ValidationState.CANCELLED,
+        ):
+            logger.info("Could not find a review function")
+            raise MkdiError(
+                error_code=MkdiErrorCode.INVALID_INPUT, message="Invalid transaction request"
+            )
 
-            user_input: pr.TransactionReviewReq = self.get_inputs()
-            note = user_input.notes or ""
-            notes = json.loads(transaction.notes if hasattr(transaction, "notes") else "[]")
-            self.update_notes(notes, "REVIEW", note)
-            transaction.notes = json.dumps(notes)
+        self.add_note("REVIEW", user_input.notes or "")
+        return user_input.state
 
+    def review(self, code: str) -> pr.TransactionResponse:
+        """Review a transaction"""
+
+        transaction: pr.TransactionDB = self.get_transaction(code)
+        try:
+            review = {
+                pr.ValidationState.APPROVED: self.approve,
+                pr.ValidationState.REJECTED: self.reject,
+                pr.ValidationState.CANCELLED: self.cancel,
+            }[self.prepare_review(transaction, code)]
             transaction = review(transaction)
         except Exception as e:
             logger.error(f"Error reviewing transaction {e}")
@@ -271,6 +302,23 @@ class AbstractTransaction(ABC):
 
         return transaction.to_response()
 
+    async def a_review(self, code: str) -> pr.TransactionResponse:
+        """Review a transaction on an async session"""
+
+        transaction: pr.TransactionDB = await self.a_get_transaction(code)
+        try:
+            review = {
+                pr.ValidationState.APPROVED: self.a_approve,
+                pr.ValidationState.REJECTED: self.a_reject,
+                pr.ValidationState.CANCELLED: self.a_cancel,
+            }[self.prepare_review(transaction, code)]
+            transaction = await review(transaction)
+        except Exception as e:
+            logger.error(f"Error reviewing transaction {e}")
+            raise e
+
+        return transaction.to_response()
+
     @abstractmethod
     def approve(self, transaction: pr.TransactionDB) -> pr.TransactionResponse:
         """approve a transaction request
@@ -282,6 +330,10 @@ class AbstractTransaction(ABC):
             pr.TransactionResponse: _description_
         """
 
+    @abstractmethod
+    async def a_approve(self, transaction: pr.TransactionDB) -> pr.TransactionDB:
+        """approve a transaction request on an async session"""
+
     @managed_tx_method(auto_commit=CommitMode.COMMIT)
     def update_transaction(self) -> pr.TransactionResponse:
         """update a transaction request"""
@@ -296,6 +348,7 @@ class AbstractTransaction(ABC):
         Returns:
             pr.TransactionResponse: _description_
         """
+        self.write_notes(transaction)
         transaction.state = pr.TransactionState.REJECTED
         transaction.reviwed_by = self.user.user_db_id
         self.db.add(transaction)
@@ -311,20 +364,64 @@ class AbstractTransaction(ABC):
         Returns:
             pr.TransactionResponse: _description_
         """
+        self.write_notes(transaction)
         transaction.state = pr.TransactionState.CANCELLED
         transaction.reviwed_by = self.user.user_db_id
         self.db.add(transaction)
 
         return transaction
 
+    @async_managed_tx_method(auto_commit=CommitMode.COMMIT)
+    async def a_reject(self, transaction: pr.TransactionDB) -> pr.TransactionDB:
+        """reject a transaction request on an async session"""
+        self.write_notes(transaction)
+        transaction.state = pr.TransactionState.REJECTED
+        transaction.reviwed_by = self.user.user_db_id
+        self.db.add(transaction)
+        return transaction
+
+    @async_managed_tx_method(auto_commit=CommitMode.COMMIT)
+    async def a_cancel(self, transaction: pr.TransactionDB) -> pr.TransactionDB:
+        """cancel a transaction request on an async session"""
+        self.write_notes(transaction)
+        transaction.state = pr.TransactionState.CANCELLED
+        transaction.reviwed_by = self.user.user_db_id
+        self.db.add(transaction)
+        return transaction
+
     @abstractmethod
     def rollback(self, transaction: pr.TransactionDB) -> pr.TransactionDB:
         """Rollback a commited transaction"""
 
+    @abstractmethod
+    async def a_rollback(self, transaction: pr.TransactionDB) -> pr.TransactionDB:
+        """Rollback a commited transaction on an async session"""
+
     @abstractmethod
     def do_transaction(self) -> None:
         """add a transaction request and wait for approval"""
 
+    @abstractmethod
+    async def a_do_transaction(self) -> pr.TransactionDB:
+        """add a transaction request on an async session and wait for approval"""
+
+    @abstractmethod
+    def request_initials(self) -> List[str]:
+        """validate the request inputs, returns the initials of the accounts it refers to"""
+
+    @abstractmethod
+    def validate_accounts(self, accounts: Dict[str, Account], office: Account) -> Account:
+        """validate the accounts of the request, returns the account numbering its code
+
+        Args:
+            accounts (Dict[str, Account]): the accounts of the office by initials
+            office (Account): the office account
+        """
+
+    @abstractmethod
+    def create_requested(self, accounts: Dict[str, Account], code: str) -> pr.TransactionDB:
+        """create the requested transaction from the accounts of the office, by initials"""
+
     @abstractmethod
     def accounts(self) -> List[Account]:
         """
@@ -333,6 +430,10 @@ class AbstractTransaction(ABC):
         :return: A list of Account objects.
         """
 
+    @abstractmethod
+    async def a_accounts(self) -> List[Account]:
+        """async version of accounts"""
+
     @abstractmethod
     def get_transaction(self, code: str) -> pr.TransactionDB:
         """
@@ -345,6 +446,10 @@ class AbstractTransaction(ABC):
             pr.TransactionDB: The retrieved transaction if found, otherwise None.
         """
 
+    @abstractmethod
+    async def a_get_transaction(self, code: str) -> pr.TransactionDB:
+        """async version of get_transaction"""
+
     def get_model(self, tr_type: pr.TransactionType):
         """
         get the model for the transaction type
@@ -404,11 +509,39 @@ class AbstractTransaction(ABC):
         # compete from here
         return transaction_with_details
 
-    def generate_code(self, initial, counter) -> str:
-        """generate a unique code for the internal transaction"""
-        now = datetime.now()
-        month = now.strftime("%m")
-        return f"{initial}{month}{counter+1:03}"
+    def next_code(self, account: Account) -> str:
+        """allocate the code of a new transaction numbered by the given account"""
+        number = self.db.scalar(next_code_number(account_code_sequence(account.id)))
+        return format_code(account.initials, number)
+
+    async def a_next_code(self, account: Account) -> str:
+        """async version of next_code"""
+        session: AsyncSession = self.db
+        number = await session.scalar(next_code_number(account_code_sequence(account.id)))
+        return format_code(account.initials, number)
+
+    def add_note(self, type, note, tags: List[str] | None = None):
+        """
+        Queue a note, written on the transaction by the approve, reject and cancel methods.
+
+        The notes are written inside the managed transaction of the review, an attempt that is
+        retried after a conflict writes them again on the reloaded transaction.
+
+        Args:
+            type (str): The note type.
+            note (str): The message of the note.
+            tags (List[str], optional): The tags of the note.
+        """
+        self.pending_notes.append((type, note, tags))
+
+    def write_notes(self, transaction: pr.TransactionDB) -> None:
+        """write the queued notes on the transaction"""
+        if not self.pending_notes:
+            return
+        notes = json.loads(transaction.notes or "[]")
+        for type, note, tags in self.pending_notes:
+            self.update_notes(notes, type, note, tags=tags)
+        transaction.notes = json.dumps(notes)
 
     def update_notes(self, notes, type, note, tags: List[str] | None = None):
         """create a note"""
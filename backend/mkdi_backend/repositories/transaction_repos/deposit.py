@@ -1,7 +1,7 @@
 """Deposit Transaction"""
 
 from datetime import datetime
-from typing import List
+from typing import Dict, List
 from mkdi_backend.models.transactions.transactions import Payment
 from mkdi_backend.models.Account import Account
 from mkdi_backend.models.Activity import Activity
@@ -74,18 +74,39 @@ class DepositTransaction(PayableTransaction):
         self.db.add(fund_history)
         return commits
 
+    def validate_request(self) -> pr.DepositRequest:
+        """validate the request inputs"""
+        user_input: pr.DepositRequest = self.get_inputs().data
+        assert user_input.receiver is not None
+        return user_input
+
     def do_transaction(self) -> Deposit:
         """create a deposit transaction"""
+        account = self.use_account(self.validate_request().receiver)
+        return self.create_transaction(account, self.next_code(account))
+
+    async def a_do_transaction(self) -> Deposit:
+        account = await self.a_use_account(self.validate_request().receiver)
+        return self.create_transaction(account, await self.a_next_code(account))
+
+    def request_initials(self) -> List[str]:
+        return [self.validate_request().receiver]
+
+    def validate_accounts(self, accounts: Dict[str, Account], office: Account) -> Account:
+        return accounts[self.validate_request().receiver]
+
+    def create_requested(self, accounts: Dict[str, Account], code: str) -> Deposit:
+        return self.create_transaction(accounts[self.validate_request().receiver], code)
+
+    def create_transaction(self, account: Account, code: str) -> Deposit:
+        """create the requested deposit, numbered by the account"""
         user: KcUser = self.user
-        user_input: pr.DepositRequest = self.get_inputs().data
-        assert user_input.receiver is not None
-        account = self.use_account(user_input.receiver)
         assert account is not None
 
         deposit = Deposit(
             owner_initials=account.initials,
             amount=self.get_amount(),
-            code=self.generate_code(account.initials, account.counter if account.counter else 0),
+            code=code,
             created_at=datetime.now(),
             created_by=user.user_db_id,
             office_id=user.office_id,
@@ -101,19 +122,15 @@ class DepositTransaction(PayableTransaction):
             tags = self.input.tags.split(",")
         notes = self.update_notes(notes, "REQUEST", self.get_inputs().message, tags)
         deposit.notes = json.dumps(notes)
-        account.counter = account.counter + 1 if account.counter else 1
 
         self.db.add(deposit)
-        self.db.add(account)
         return deposit
 
     @managed_invariant_tx_method(auto_commit=CommitMode.COMMIT)
     def approve(self, transaction: Deposit) -> Deposit:
         """Approve deposit transaction"""
-        transaction.state = pr.TransactionState.PENDING
-        transaction.reviwed_by = self.user.user_db_id
-        self.db.add(transaction)
-        return transaction
+        self.write_notes(transaction)
+        return self.mark_pending(transaction)
 
     def accounts(self, receiver=None) -> List[Account]:
         """
@@ -138,10 +155,10 @@ class DepositTransaction(PayableTransaction):
 
     def get_transaction(self, code: str) -> pr.TransactionDB:
         """get deposit transaction"""
-        return self.db.query(Deposit).filter(Deposit.code == code).one()
+        return self.db.scalars(select(Deposit).where(Deposit.code == code)).one_or_none()
 
-    def rollback(self, transaction: Deposit) -> pr.TransactionResponse:
-        pass
+    async def a_get_transaction(self, code: str) -> Deposit:
+        return await self.db.scalar(select(Deposit).where(Deposit.code == code))
 
     async def a_accounts(self, receiver=None) -> List[Account]:
         receiver = (
@@ -160,11 +177,14 @@ class DepositTransaction(PayableTransaction):
         ]
         return (await self.db.scalars(select(Account).where(or_(*cdt)))).all()
 
+    def payment_initials(self, transaction: Deposit) -> str:
+        return transaction.owner_initials
+
     async def a_commit(
         self, amount: int, transaction: pr.TransactionDB, has_complete: bool
     ) -> List:
         commits = list()
-        accounts = await self.a_accounts()
+        accounts = await self.payment_accounts()
 
         depositer: Account = next(
             (x for x in accounts if x.initials == transaction.owner_initials), None
@@ -194,9 +214,10 @@ class DepositTransaction(PayableTransaction):
         return commits, fund_history
 
     def cancel_payment_commit(self, payment: Payment):
-        commits = list()
+        return self.reverse_payment(payment, self.accounts(), self.has_started_activity().id)
 
-        accounts = self.accounts()
+    def reverse_payment(self, payment: Payment, accounts: List[Account], activity_id) -> FundCommit:
+        commits = list()
 
         depositer: Account = next(
             (x for x in accounts if x.initials == self.transaction.owner_initials), None
@@ -206,12 +227,10 @@ class DepositTransaction(PayableTransaction):
         commits.append(depositer.debit(payment.amount))
         commits.append(fund.debit(payment.amount))
 
-        activity = self.has_started_activity()
-
         fund_history = FundCommit(
             v_from=fund.balance,
             variation=payment.amount,
-            activity_id=activity.id,
+            activity_id=activity_id,
             account=self.transaction.owner_initials,
             description=f"Cancelling Deposit {self.transaction.code}",
             is_out=True,
@@ -1,6 +1,6 @@
 """Internal Transaction Repository"""
 
-from typing import List
+from typing import Dict, List
 
 from datetime import datetime
 
@@ -32,11 +32,14 @@ class ExternalTransaction(PayableTransaction):
         assert request.charges.amount == transaction.charges
         assert request.data.sender == transaction.sender_initials
 
+    def payment_initials(self, transaction: External) -> str:
+        return transaction.sender_initials
+
     async def a_commit(
         self, commited_amount, transaction: External, has_complete=False
     ) -> List[pr.TransactionCommit]:
         commits = []
-        accounts: List[Account] = await self.a_accounts()
+        accounts: List[Account] = await self.payment_accounts()
 
         sender = await self.db.scalar(
             select(Account).where(
@@ -94,32 +97,61 @@ class ExternalTransaction(PayableTransaction):
         """
         pass
 
-    def do_transaction(self) -> None:
-        user: KcUser = self.user
+    def validate_request(self) -> pr.ExternalRequest:
+        """validate the request inputs"""
         user_input: pr.ExternalRequest = self.get_inputs().data
 
         assert isinstance(user_input, pr.ExternalRequest)
         assert user_input.sender is not None
-
-        sender = self.db.scalar(
-            select(Account).where(
-                or_(
-                    Account.type == pr.AccountType.AGENT,
-                    Account.type == pr.AccountType.OFFICE,
-                ),
-                Account.initials == user_input.sender,
-            )
+        return user_input
+
+    def sender_query(self, sender: str):
+        return select(Account).where(
+            or_(
+                Account.type == pr.AccountType.AGENT,
+                Account.type == pr.AccountType.OFFICE,
+            ),
+            Account.initials == sender,
         )
 
-        office = self.db.scalar(
-            select(Account).where(
-                Account.type == pr.AccountType.OFFICE, Account.owner_id == user.office_id
-            )
+    def office_query(self):
+        return select(Account).where(
+            Account.type == pr.AccountType.OFFICE, Account.owner_id == self.user.office_id
         )
 
+    def do_transaction(self) -> None:
+        user_input = self.validate_request()
+        sender = self.db.scalar(self.sender_query(user_input.sender))
+        office = self.db.scalar(self.office_query())
+        return self.create_transaction(sender, self.next_code(office))
+
+    async def a_do_transaction(self) -> External:
+        session: AsyncSession = self.db
+        user_input = self.validate_request()
+        sender = await session.scalar(self.sender_query(user_input.sender))
+        office = await session.scalar(self.office_query())
+        return self.create_transaction(sender, await self.a_next_code(office))
+
+    def request_initials(self) -> List[str]:
+        return [self.validate_request().sender]
+
+    def validate_accounts(self, accounts: Dict[str, Account], office: Account) -> Account:
+        sender = accounts[self.validate_request().sender]
+        assert sender.type in [pr.AccountType.AGENT, pr.AccountType.OFFICE]
+        assert office is not None
+        return office
+
+    def create_requested(self, accounts: Dict[str, Account], code: str) -> External:
+        return self.create_transaction(accounts[self.validate_request().sender], code)
+
+    def create_transaction(self, sender: Account, code: str) -> External:
+        """create the requested transaction, numbered by the office account"""
+        user: KcUser = self.user
+        user_input: pr.ExternalRequest = self.get_inputs().data
+
         external = External(
             amount=self.get_amount(),
-            code=self.generate_code(office.initials, office.counter if office.counter else 0),
+            code=code,
             office_id=user.office_id,
             org_id=user.organization_id,
             type=pr.TransactionType.EXTERNAL,
@@ -139,9 +171,7 @@ class ExternalTransaction(PayableTransaction):
 
         notes = self.update_notes(notes, "REQUEST", self.get_inputs().message, tags)
         external.notes = json.dumps(notes)
-        office.counter = office.counter + 1 if office.counter else 1
         self.db.add(external)
-        self.db.add(office)
         return external
 
     @managed_invariant_tx_method(auto_commit=CommitMode.COMMIT)
@@ -149,10 +179,8 @@ class ExternalTransaction(PayableTransaction):
         """
         Approve internal transaction
         """
-        transaction.state = pr.TransactionState.PENDING
-        transaction.reviwed_by = self.user.user_db_id
-        self.db.add(transaction)
-        return transaction
+        self.write_notes(transaction)
+        return self.mark_pending(transaction)
 
     async def a_accounts(self, sender=None) -> List[Account]:
         session: AsyncSession = self.db
@@ -223,11 +251,16 @@ class ExternalTransaction(PayableTransaction):
         """
         get internal transaction
         """
-        return self.db.query(External).filter(External.code == code).one()
+        return self.db.scalars(select(External).where(External.code == code)).one_or_none()
+
+    async def a_get_transaction(self, code: str) -> External:
+        return await self.db.scalar(select(External).where(External.code == code))
 
     def cancel_payment_commit(self, payment: Payment):
+        return self.reverse_payment(payment, self.accounts(), self.has_started_activity().id)
+
+    def reverse_payment(self, payment: Payment, accounts: List[Account], activity_id) -> FundCommit:
         commits = list()
-        accounts = self.accounts()
 
         office: Account = next((x for x in accounts if x.type == pr.AccountType.OFFICE), None)
         sender: Account = next(
@@ -249,13 +282,11 @@ class ExternalTransaction(PayableTransaction):
                 commits.append(office.debit(self.transaction.charges))
                 self.db.add(office)
 
-        activity = self.has_started_activity()
-
         fund_history = FundCommit(
             v_from=(fund.balance),
             variation=payment.amount,
             account=self.transaction.sender_initials,
-            activity_id=activity.id,
+            activity_id=activity_id,
             description=f"Cancelling External {self.transaction.code}",
             is_out=False,
             date=datetime.now(),
@@ -1,8 +1,8 @@
 """Foreign Exchange Transaction Repository"""
 
-from typing import List
+from typing import Dict, List
 
-from mkdi_backend.utils.database import managed_tx_method
+from mkdi_backend.utils.database import async_managed_tx_method, managed_tx_method
 from mkdi_backend.repositories.transaction_repos.invariant import (
     managed_invariant_tx_method,
     CommitMode,
@@ -23,11 +23,14 @@ import json
 class ForExTransaction(PayableTransaction):
     """Foreign Exchange Transaction"""
 
+    def payment_initials(self, transaction: ForeignEx) -> str:
+        return transaction.customer_account
+
     async def a_commit(
         self, amount, transaction: ForeignEx, has_complete=False
     ) -> List[pr.TransactionCommit]:
         commits = []
-        accounts: List[Account] = await self.a_accounts()
+        accounts: List[Account] = await self.payment_accounts()
         office: Account = next((x for x in accounts if x.type == pr.AccountType.OFFICE), None)
         sender: Account = next(
             (x for x in accounts if x.initials == transaction.customer_account), None
@@ -65,28 +68,57 @@ class ForExTransaction(PayableTransaction):
 
         return commits, fund_history
 
-    def do_transaction(self) -> None:
-        user = self.user
+    def validate_request(self) -> pr.ForExRequest:
+        """validate the request inputs"""
         user_input: pr.ForExRequest = self.get_inputs().data
 
         assert isinstance(user_input, pr.ForExRequest)
+        return user_input
 
-        provider_account = self.db.scalar(
+    def request_queries(self, user_input: pr.ForExRequest) -> tuple:
+        """queries of the provider, office and customer accounts of a request"""
+        office_id = self.user.office_id
+        return (
             select(Account)
             .where(Account.initials == user_input.provider_account)
-            .where(Account.office_id == user.office_id)
-        )
-        office = self.db.scalar(
+            .where(Account.office_id == office_id),
             select(Account)
             .where(Account.type == pr.AccountType.OFFICE)
-            .where(Account.office_id == user.office_id)
-        )
-        customer = self.db.scalar(
+            .where(Account.office_id == office_id),
             select(Account)
             .where(Account.initials == user_input.customer_account)
-            .where(Account.office_id == user.office_id)
+            .where(Account.office_id == office_id),
         )
 
+    def do_transaction(self) -> None:
+        queries = self.request_queries(self.validate_request())
+        provider_account, office, customer = (self.db.scalar(query) for query in queries)
+        return self.create_transaction(provider_account, customer, self.next_code(office))
+
+    async def a_do_transaction(self) -> ForeignEx:
+        queries = self.request_queries(self.validate_request())
+        provider_account, office, customer = [await self.db.scalar(query) for query in queries]
+        return self.create_transaction(provider_account, customer, await self.a_next_code(office))
+
+    def request_initials(self) -> List[str]:
+        user_input = self.validate_request()
+        return [user_input.provider_account, user_input.customer_account]
+
+    def validate_accounts(self, accounts: Dict[str, Account], office: Account) -> Account:
+        assert office is not None
+        return office
+
+    def create_requested(self, accounts: Dict[str, Account], code: str) -> ForeignEx:
+        provider, customer = self.request_initials()
+        return self.create_transaction(accounts[provider], accounts[customer], code)
+
+    def create_transaction(
+        self, provider_account: Account, customer: Account, code: str
+    ) -> ForeignEx:
+        """create the requested transaction, numbered by the office account"""
+        user = self.user
+        user_input: pr.ForExRequest = self.get_inputs().data
+
         assert provider_account is not None
         assert customer is not None
 
@@ -96,7 +128,7 @@ class ForExTransaction(PayableTransaction):
             provider_account=provider_account.initials,
             customer_account=customer.initials,
             amount=user_input.amount,
-            code=self.generate_code(office.initials, office.counter if office.counter else 0),
+            code=code,
             rate=user_input.daily_rate,
             buying_rate=user_input.buying_rate,
             selling_rate=user_input.selling_rate,
@@ -116,20 +148,21 @@ class ForExTransaction(PayableTransaction):
         notes = self.update_notes(notes, "REQUEST", self.get_inputs().message)
 
         forEx.notes = json.dumps(notes)
-        office.counter = office.counter + 1 if office.counter else 1
 
         self.db.add(forEx)
-        self.db.add(office)
         return forEx
 
     @managed_tx_method(auto_commit=CommitMode.COMMIT)
     def approve(self, transaction: ForeignEx) -> ForeignEx:
         """approve the transaction"""
+        self.write_notes(transaction)
         # for buying the transaction this is payable so it goes pending first and wait for payment
-        transaction.state = pr.TransactionState.PENDING
-        transaction.reviwed_by = self.user.user_db_id
-        self.db.add(transaction)
-        return transaction
+        return self.mark_pending(transaction)
+
+    @async_managed_tx_method(auto_commit=CommitMode.COMMIT)
+    async def a_approve(self, transaction: ForeignEx) -> ForeignEx:
+        self.write_notes(transaction)
+        return self.mark_pending(transaction)
 
     async def a_accounts(self, customer_account=None) -> List[Account]:
         session = self.db
@@ -177,10 +210,15 @@ class ForExTransaction(PayableTransaction):
         """
         return self.db.scalar(select(ForeignEx).where(ForeignEx.code == code))
 
+    async def a_get_transaction(self, code: str) -> ForeignEx:
+        return await self.db.scalar(select(ForeignEx).where(ForeignEx.code == code))
+
     def cancel_payment_commit(self, payment: Payment):
+        return self.reverse_payment(payment, self.accounts(), self.has_started_activity().id)
+
+    def reverse_payment(self, payment: Payment, accounts: List[Account], activity_id) -> FundCommit:
         commits = list()
 
-        accounts = self.accounts()
         office: Account = next((x for x in accounts if x.type == pr.AccountType.OFFICE), None)
         sender: Account = next(
             (x for x in accounts if x.initials == self.transaction.customer_account), None
@@ -196,12 +234,10 @@ class ForExTransaction(PayableTransaction):
         if self.transaction.forex_result > 0:
             commits.append(office.debit(self.transaction.forex_result))
 
-        activity = self.has_started_activity()
-
         fund_history = FundCommit(
             v_from=fund.balance,
             variation=payment.amount,
-            activity_id=activity.id,
+            activity_id=activity_id,
             account=self.transaction.customer_account,
             description=f"Cancelling Forex {self.transaction.code}",
             is_out=False,
@@ -1,16 +1,20 @@
 """Internal Transaction Repository"""
 
 from datetime import datetime
-from typing import List
+from typing import Dict, List, Tuple
 from mkdi_backend.models.Account import Account
 from mkdi_backend.models.models import KcUser
 from mkdi_backend.models.transactions.transactions import Internal
 from mkdi_backend.repositories.transaction_repos.abstract_transaction import AbstractTransaction
-from mkdi_backend.repositories.transaction_repos.invariant import managed_invariant_tx_method
+from mkdi_backend.repositories.transaction_repos.invariant import (
+    async_managed_invariant_tx_method,
+    managed_invariant_tx_method,
+)
 from mkdi_backend.utils.database import CommitMode
 from mkdi_shared.exceptions.mkdi_api_error import MkdiError, MkdiErrorCode
 from mkdi_shared.schemas import protocol as pr
 from sqlalchemy import or_, select
+from sqlalchemy.ext.asyncio.session import AsyncSession
 
 import json
 
@@ -41,10 +45,23 @@ class InternalTransaction(AbstractTransaction):
         """
         if not hasattr(transaction, "amount") or not hasattr(transaction, "charges"):
             raise ValueError("Transaction must have 'amount' and 'charges' attributes")
-        commits = []
 
         accounts = self.accounts(transaction.sender_initials, transaction.receiver_initials)
+        return self.transfer(transaction, accounts)
+
+    def transfer(
+        self, transaction: Internal, accounts: List[Account]
+    ) -> List[pr.TransactionCommit]:
+        """move the transaction amount and charges between its accounts
+
+        Args:
+            transaction (Internal): the approved transaction
+            accounts (List[Account]): the accounts of the transaction
 
+        Returns:
+            List[pr.TransactionCommit]: the balance variations
+        """
+        commits = []
         if len(accounts) < 2:
             raise MkdiError(
                 error_code=MkdiErrorCode.INVALID_INPUT, message="Insufficient accounts available"
@@ -86,23 +103,52 @@ class InternalTransaction(AbstractTransaction):
 
         return commits
 
-    def do_transaction(self) -> None:
-        user: KcUser = self.user
+    def validate_request(self) -> pr.InternalRequest:
+        """validate the request inputs"""
         user_input: pr.InternalRequest = self.get_inputs().data
 
         assert isinstance(user_input, pr.InternalRequest)
         assert user_input.receiver is not None
         assert user_input.sender is not None
         assert user_input.sender != user_input.receiver
+        return user_input
 
+    def do_transaction(self) -> None:
+        user_input = self.validate_request()
         accounts = self.accounts(sender=user_input.sender, receiver=user_input.receiver)
+        sender = next((a for a in accounts if a.initials == user_input.sender), None)
+        return self.create_transaction(accounts, self.next_code(sender))
+
+    async def a_do_transaction(self) -> Internal:
+        user_input = self.validate_request()
+        accounts = await self.a_accounts(sender=user_input.sender, receiver=user_input.receiver)
+        sender = next((a for a in accounts if a.initials == user_input.sender), None)
+        return self.create_transaction(accounts, await self.a_next_code(sender))
+
+    def request_initials(self) -> List[str]:
+        user_input = self.validate_request()
+        return [user_input.sender, user_input.receiver]
+
+    def validate_accounts(self, accounts: Dict[str, Account], office: Account) -> Account:
+        sender, receiver = self.request_initials()
+        # checks the charges of a transfer from the office
+        self.needs_office([accounts[sender], accounts[receiver]], sender, receiver)
+        return accounts[sender]
+
+    def create_requested(self, accounts: Dict[str, Account], code: str) -> Internal:
+        return self.create_transaction([accounts[x] for x in self.request_initials()], code)
+
+    def create_transaction(self, accounts: List[Account], code: str) -> Internal:
+        """create the requested transaction, numbered by the sender account"""
+        user: KcUser = self.user
+        user_input: pr.InternalRequest = self.get_inputs().data
 
         sender = next((a for a in accounts if a.initials == user_input.sender), None)
         receiver = next((a for a in accounts if a.initials == user_input.receiver), None)
 
         internal = Internal(
             amount=self.get_amount(),
-            code=self.generate_code(sender.initials, sender.counter if sender.counter else 0),
+            code=code,
             office_id=user.office_id,
             org_id=user.organization_id,
             type=pr.TransactionType.INTERNAL,
@@ -124,9 +170,7 @@ class InternalTransaction(AbstractTransaction):
         notes = self.update_notes(notes, "REQUEST", self.get_inputs().message, tags)
         internal.notes = json.dumps(notes)
 
-        sender.counter = sender.counter + 1 if sender.counter else 1
         self.db.add(internal)
-        self.db.add(sender)  # update the counter
         return internal
 
     @managed_invariant_tx_method(auto_commit=CommitMode.COMMIT)
@@ -134,6 +178,7 @@ class InternalTransaction(AbstractTransaction):
         """
         Approve internal transaction
         """
+        self.write_notes(transaction)
         # start the commit
         commits = self.commit(transaction)
         transaction.save_commit(commits)
@@ -141,12 +186,17 @@ class InternalTransaction(AbstractTransaction):
         transaction.state = pr.TransactionState.PAID
         return transaction
 
-    def accounts(self, sender=None, receiver=None) -> List[Account]:
-        """return the linked accounts for the transaction
+    @async_managed_invariant_tx_method(auto_commit=CommitMode.COMMIT)
+    async def a_approve(self, transaction: Internal) -> Internal:
+        self.write_notes(transaction)
+        accounts = await self.a_accounts(transaction.sender_initials, transaction.receiver_initials)
+        transaction.save_commit(self.transfer(transaction, accounts))
 
-        Returns:
-            List[Account]: _description_
-        """
+        transaction.state = pr.TransactionState.PAID
+        return transaction
+
+    def parties(self, sender=None, receiver=None) -> Tuple[str, str]:
+        """initials of the sender and the receiver, read from the transaction when reviewing"""
         usr_input = self.get_inputs()
         request: pr.InternalRequest = usr_input.data if hasattr(usr_input, "data") else None
         if request is None and sender is None and receiver is None:
@@ -154,13 +204,22 @@ class InternalTransaction(AbstractTransaction):
             tr: Internal = self.transaction
             sender = tr.sender_initials
             receiver = tr.receiver_initials
+        return sender, receiver
 
-        accounts = self.db.scalars(
+    def parties_query(self, sender: str, receiver: str):
+        return (
             select(Account)
             .where(or_(Account.initials == sender, Account.initials == receiver))
             .filter(Account.office_id == self.user.office_id)
-        ).all()
+        )
 
+    def office_query(self):
+        return select(Account).where(
+            Account.type == pr.AccountType.OFFICE, Account.office_id == self.user.office_id
+        )
+
+    def needs_office(self, accounts: List[Account], sender: str, receiver: str) -> bool:
+        """whether the office account collects charges of the transfer"""
         # if the office is the sender then no charges will be applied
         sender = next((a for a in accounts if a.initials == sender), None)
         receiver = next((a for a in accounts if a.initials == receiver), None)
@@ -168,15 +227,31 @@ class InternalTransaction(AbstractTransaction):
 
         if sender.type == pr.AccountType.OFFICE:
             assert self.get_charges() == 0
-        elif receiver.type != pr.AccountType.OFFICE and self.get_charges() > 0:
-            office = self.db.scalars(
-                select(Account).where(
-                    Account.type == pr.AccountType.OFFICE, Account.office_id == self.user.office_id
-                )
-            ).one()
-            accounts.append(office)
+            return False
+        return receiver.type != pr.AccountType.OFFICE and self.get_charges() > 0
+
+    def accounts(self, sender=None, receiver=None) -> List[Account]:
+        """return the linked accounts for the transaction
+
+        Returns:
+            List[Account]: _description_
+        """
+        sender, receiver = self.parties(sender, receiver)
+        accounts = self.db.scalars(self.parties_query(sender, receiver)).all()
 
         # if there are charges, add the office account
+        if self.needs_office(accounts, sender, receiver):
+            accounts.append(self.db.scalars(self.office_query()).one())
+
+        return accounts
+
+    async def a_accounts(self, sender=None, receiver=None) -> List[Account]:
+        session: AsyncSession = self.db
+        sender, receiver = self.parties(sender, receiver)
+        accounts = (await session.scalars(self.parties_query(sender, receiver))).all()
+
+        if self.needs_office(accounts, sender, receiver):
+            accounts.append((await session.scalars(self.office_query())).one())
 
         return accounts
 
@@ -184,7 +259,11 @@ class InternalTransaction(AbstractTransaction):
         """
         get internal transaction
         """
-        return self.db.query(Internal).filter(Internal.code == code).one()
+        return self.db.scalars(select(Internal).where(Internal.code == code)).one_or_none()
+
+    async def a_get_transaction(self, code: str) -> Internal:
+        session: AsyncSession = self.db
+        return await session.scalar(select(Internal).where(Internal.code == code))
 
     def add_payment(self, code: str) -> pr.PaymentResponse:
         raise MkdiError(
@@ -194,7 +273,15 @@ class InternalTransaction(AbstractTransaction):
     @managed_invariant_tx_method(auto_commit=CommitMode.COMMIT)
     def rollback_commit(self, transaction: Internal) -> Internal:
         accounts = self.accounts(transaction.sender_initials, transaction.receiver_initials)
+        return self.reverse_transfer(transaction, accounts)
 
+    @async_managed_invariant_tx_method(auto_commit=CommitMode.COMMIT)
+    async def a_rollback_commit(self, transaction: Internal) -> Internal:
+        accounts = await self.a_accounts(transaction.sender_initials, transaction.receiver_initials)
+        return self.reverse_transfer(transaction, accounts)
+
+    def reverse_transfer(self, transaction: Internal, accounts: List[Account]) -> Internal:
+        """undo the transfer of a paid transaction and put it back in review"""
         office = next((a for a in accounts if a.type == pr.AccountType.OFFICE), None)
         sender = next((a for a in accounts if a.initials == transaction.sender_initials), None)
         receiver = next((a for a in accounts if a.initials == transaction.receiver_initials), None)
@@ -220,3 +307,7 @@ class InternalTransaction(AbstractTransaction):
         """roll back and cancel transaction"""
         transaction = self.rollback_commit(transaction)
         return transaction
+
+    async def a_rollback(self, transaction: Internal) -> Internal:
+        """roll back and cancel transaction on an async session"""
+        return await self.a_rollback_commit(transaction)
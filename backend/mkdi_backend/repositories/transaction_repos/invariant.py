@@ -5,23 +5,39 @@ from http import HTTPStatus
 from typing import List
 import asyncio
 from loguru import logger
-from mkdi_backend.models.Account import Account
 from mkdi_backend.repositories.account import AccountRepository
 from mkdi_backend.repositories.activity import ActivityRepo
-from mkdi_backend.utils.database import CommitMode
+from mkdi_backend.utils.database import CommitMode, check_unchanged, mapped_arguments
+from mkdi_backend.utils.retry import RetryableError, a_with_retries, classify, with_retries
 from mkdi_shared.exceptions.mkdi_api_error import MkdiError, MkdiErrorCode
-from psycopg2.errors import (
-    DeadlockDetected,
-    ExclusionViolation,
-    SerializationFailure,
-    UniqueViolation,
-)
-from sqlalchemy.exc import OperationalError, PendingRollbackError, NoResultFound
+from sqlalchemy.exc import NoResultFound
 from sqlmodel import SQLModel
 
+# reason of the retries of an operation that left the invariant unhealthy
+UNHEALTHY = "unhealthy_invariant"
+
+
+def unhealthy_invariant() -> MkdiError:
+    return MkdiError(
+        "UNHEALTHY_INVARIANT",
+        error_code=MkdiErrorCode.UNHEALTHY_INVARIANT,
+        http_status_code=HTTPStatus.NOT_ACCEPTABLE,
+    )
+
+
+def invariant_exhausted(error: Exception) -> MkdiError:
+    """error raised once the attempts of a decorated method are exhausted"""
+    if classify(error) == UNHEALTHY:
+        return unhealthy_invariant()
+    return MkdiError(
+        "ACCOUNT_VERSION_MISMATCH",
+        error_code=MkdiErrorCode.ACCOUNT_VERSION_MISMATCH,
+        http_status_code=HTTPStatus.NOT_ACCEPTABLE,
+    )
+
 
 def async_managed_invariant_tx_method(
-    auto_commit: CommitMode = CommitMode.COMMIT, num_retries: int = 3
+    auto_commit: CommitMode = CommitMode.COMMIT, num_retries: int = 3, retry_on=()
 ):
     """Invariant checker decorator for async methods"""
 
@@ -44,107 +60,56 @@ def async_managed_invariant_tx_method(
         async def wrapped_f(self, *args, **kwargs):
             logger.info(f"Checking Sys Invariant for {f.__name__}")
             logger.info(f"Auto Commit Mode: {auto_commit}")
-            invariant_exception = MkdiError(
-                "UNHEALTHY_INVARIANT",
-                error_code=MkdiErrorCode.UNHEALTHY_INVARIANT,
-                http_status_code=HTTPStatus.NOT_ACCEPTABLE,
-            )
-            result: SQLModel | List[SQLModel] = None
-            retry_exhausted = True
-            healthy = True
-            for attempt in range(num_retries):
-                try:
-                    # Assuming check_invariant is an async function
-                    healthy = await check_invariant(self)
-                    if not healthy:
-                        raise MkdiError(
-                            "UNHEALTHY_INVARIANT",
-                            error_code=MkdiErrorCode.UNHEALTHY_INVARIANT,
-                            http_status_code=HTTPStatus.NOT_ACCEPTABLE,
-                        )
-
-                    logger.info(f"Sys Invariant is Healthy before {f.__name__}")
-                    start_accounts: List[Account] = await self.a_accounts()
-                    # increment accounts versions
-                    for account in start_accounts:
-                        if account:
-                            account.version += 1
-                            self.db.add(account)
-
-                    result = await f(self, *args, **kwargs)
-
-                    if isinstance(result, List):
-                        for item in result:
-                            self.db.add(item)
-                    elif isinstance(result, SQLModel):
-                        self.db.add(result)
-
-                    end_accounts: List[Account] = await self.a_accounts()
-                    mismatch = False
-                    for index, account in enumerate(end_accounts):
-                        if not account:
-                            continue
-                        logger.info(f"Checking Account {account}")
-                        # find the associated account in the start_accounts list
-                        other = next((x for x in start_accounts if x.id == account.id), None)
-
-                        if other is None or account.version != other.version:
-                            logger.info("Version Mismatch Detected")
-                            logger.info(f"Before version : {start_accounts[index].version}")
-                            logger.info(f"After version : {account.version}")
-                            mismatch = True
-                            break
-
-                    if mismatch:
-                        await self.db.rollback()
-                        retry_exhausted = False
-                        continue
-
-                    healthy = await check_invariant(self)
-                    if not healthy:
-                        logger.info(f"Sys Invariant is Unhealthy after {f.__name__}")
-                        await self.db.rollback()
-                        continue
-
-                    await self.db.commit()
-
-                    if isinstance(result, SQLModel):
-                        logger.info("Refreshing DB")
-                        await self.db.refresh(result)
-                    retry_exhausted = False
-                    logger.info(f"Sys Invariant is Healthy after {f.__name__}")
-
-                    break
-                except (
-                    DeadlockDetected,
-                    ExclusionViolation,
-                    SerializationFailure,
-                    UniqueViolation,
-                    OperationalError,
-                    PendingRollbackError,
-                ) as e:
-                    logger.error(f"Transaction error: {e}. Retrying...")
-                    if auto_commit == CommitMode.ROLLBACK:
-                        # Assuming self.db.rollback() is an async operation
-                        await self.db.rollback()
-                    await asyncio.sleep(
-                        0.1 * attempt
-                    )  # Exponential back-off could be a better strategy
-                except MkdiError as e:
-                    if auto_commit == CommitMode.ROLLBACK:
-                        await self.db.rollback()
-                    raise e
-
-            if retry_exhausted and not healthy:
-                raise invariant_exception
-            elif retry_exhausted:
-                logger.error("Retry attempts exhausted.")
-                raise MkdiError(
-                    "ACCOUNT_VERSION_MISMATCH",
-                    error_code=MkdiErrorCode.ACCOUNT_VERSION_MISMATCH,
-                    http_status_code=HTTPStatus.NOT_ACCEPTABLE,
+            entities = mapped_arguments(self.db, args)
+            states = [getattr(entity, "state", None) for entity in entities]
+
+            async def attempt():
+                if not await check_invariant(self):
+                    raise unhealthy_invariant()
+
+                logger.info(f"Sys Invariant is Healthy before {f.__name__}")
+                result = await f(self, *args, **kwargs)
+
+                if isinstance(result, List):
+                    for item in result:
+                        self.db.add(item)
+                elif isinstance(result, SQLModel):
+                    self.db.add(result)
+
+                # surface a concurrent update here, the invariant check swallows errors
+                await self.db.flush()
+                if not await check_invariant(self):
+                    logger.info(f"Sys Invariant is Unhealthy after {f.__name__}")
+                    raise RetryableError(UNHEALTHY)
+
+                await self.db.commit()
+
+                if isinstance(result, SQLModel):
+                    logger.info("Refreshing DB")
+                    await self.db.refresh(result)
+                logger.info(f"Sys Invariant is Healthy after {f.__name__}")
+                return result
+
+            async def reload():
+                # expired by the rollback, async sessions do not lazy load
+                for entity in entities:
+                    await self.db.refresh(entity)
+                check_unchanged(entities, states)
+
+            try:
+                return await a_with_retries(
+                    f.__qualname__,
+                    attempt,
+                    self.db.rollback,
+                    on_retry=reload,
+                    exhausted=invariant_exhausted,
+                    attempts=num_retries,
+                    retry_on=retry_on,
                 )
-            return result
+            except MkdiError as e:
+                if auto_commit == CommitMode.ROLLBACK:
+                    await self.db.rollback()
+                raise e
 
         return wrapped_f
 
@@ -154,6 +119,7 @@ def async_managed_invariant_tx_method(
 def managed_invariant_tx_method(
     auto_commit: CommitMode = CommitMode.COMMIT,
     num_retries: int = 3,
+    retry_on=(),
 ):
     """Invariant checker decorator"""
 
@@ -184,122 +150,68 @@ def managed_invariant_tx_method(
             if not session and hasattr(self, "session"):
                 session = self.session.db
 
-            try:
-                result: SQLModel | List[SQLModel] = None
-                retry_exhausted = True
-                healthy = True
+            entities = mapped_arguments(session, args)
+            states = [getattr(entity, "state", None) for entity in entities]
 
-                invariant_exception = MkdiError(
-                    "UNHEALTHY_INVARIANT",
-                    error_code=MkdiErrorCode.UNHEALTHY_INVARIANT,
-                    http_status_code=HTTPStatus.NOT_ACCEPTABLE,
-                )
+            def attempt():
+                if not check_invariant(self):
+                    raise unhealthy_invariant()
+
+                logger.info(f"Sys Invariant is Healthy before {f.__name__}")
 
-                for _ in range(num_retries):
-                    try:
-                        healthy = check_invariant(self)
-                        if not healthy:
-                            continue
-
-                        start_accounts: List[Account] = self.accounts()
-
-                        # increment accounts versions
-                        for account in start_accounts:
-                            if account:
-                                account.version += 1
-                                session.add(account)
-
-                        logger.info(f"Sys Invariant is Healthy before {f.__name__}")
-
-                        # api call
-                        result = f(self, *args, **kwargs)
-
-                        # check if the version of the accounts have been updated by someoneelse
-                        # to avoid concurrent updates
-                        end_accounts: List[Account] = self.accounts()
-                        mismatch = False
-                        for index, account in enumerate(end_accounts):
-                            if not account:
-                                continue
-
-                            logger.info(f"Checking Account {account}")
-                            other = next((x for x in start_accounts if x.id == account.id), None)
-                            if account.version != other.version:
-                                # cancel version update
-                                logger.info("Version Mismatch Detected")
-                                logger.info(f"Before version : {start_accounts[index].version}")
-                                logger.info(f"After version : {account.version}")
-                                mismatch = True
-                                break
-
-                        if mismatch:
-                            session.rollback()
-                            retry_exhausted = False
-                            continue
-
-                        if isinstance(result, List):
-                            for item in result:
-                                session.add(item)
-                        elif isinstance(result, SQLModel):
-                            session.add(result)
-
-                        # commit the transaction
-
-                        # check if the system invariant is still healthy
-                        healthy = check_invariant(self)
-                        if not healthy:
-                            logger.info(f"Sys Invariant is Unhealthy after {f.__name__}")
-                            session.rollback()
-                            continue
-
-                        session.commit()
-                        if isinstance(result, SQLModel):
-                            logger.info("Refreshing DB")
-                            session.refresh(result)
-                        retry_exhausted = False
-                        logger.info(f"Sys Invariant is Healthy after {f.__name__}")
-                        break
-
-                    except PendingRollbackError as error:
-                        logger.info(str(error))
-                        session.rollback()
-                    except OperationalError as error:
-                        if error.orig is not None and isinstance(
-                            error.orig,
-                            (
-                                SerializationFailure,
-                                DeadlockDetected,
-                                UniqueViolation,
-                                ExclusionViolation,
-                            ),
-                        ):
-                            logger.info(
-                                f"{type(error.orig)} Inner {error.orig.pgcode} {type(error.orig.pgcode)}"
-                            )
-                            session.rollback()
-                        else:
-                            raise error
-
-                # if the system invariant is unhealthy after all retries
-                if retry_exhausted and not healthy:
-                    raise invariant_exception
-                elif retry_exhausted:
-                    raise MkdiError(
-                        "ACCOUNT_VERSION_MISMATCH",
-                        error_code=MkdiErrorCode.ACCOUNT_VERSION_MISMATCH,
-                        http_status_code=HTTPStatus.NOT_ACCEPTABLE,
-                    )
+                # api call, a concurrent update of its accounts or wallets raises
+                # StaleDataError when flushed
+                result = f(self, *args, **kwargs)
 
+                if isinstance(result, List):
+                    for item in result:
+                        session.add(item)
+                elif isinstance(result, SQLModel):
+                    session.add(result)
+
+                # surface a concurrent update here, the invariant check swallows errors
+                session.flush()
+
+                # check if the system invariant is still healthy
+                if not check_invariant(self):
+                    logger.info(f"Sys Invariant is Unhealthy after {f.__name__}")
+                    raise RetryableError(UNHEALTHY)
+
+                session.commit()
+                if isinstance(result, SQLModel):
+                    logger.info("Refreshing DB")
+                    session.refresh(result)
+                logger.info(f"Sys Invariant is Healthy after {f.__name__}")
+                return result
+
+            try:
+                return with_retries(
+                    f.__qualname__,
+                    attempt,
+                    session.rollback,
+                    # expired by the rollback, reloaded on access
+                    on_retry=lambda: check_unchanged(entities, states),
+                    exhausted=invariant_exhausted,
+                    attempts=num_retries,
+                    retry_on=retry_on,
+                )
             except Exception as error:
                 logger.info(f"Unexpected Error {error}")
                 raise error
-            return result
 
         return wrapped_f
 
     return decorator
 
 
+def no_activity() -> MkdiError:
+    return MkdiError(
+        error_code=MkdiErrorCode.NO_ACTIVITY,
+        http_status_code=HTTPStatus.NOT_ACCEPTABLE,
+        message="No activity found",
+    )
+
+
 # a decorator to check if there's an ongoing activity for the user
 def has_activity_started(f):
     """decorator to verify that there's an ongoing activity for the user"""
@@ -323,3 +235,15 @@ def has_activity_started(f):
         return f(self, *args, **kwargs)
 
     return wrapped_f
+
+
+def async_has_activity_started(f):
+    """decorator to verify that there's an ongoing activity for the user, for async methods"""
+
+    @wraps(f)
+    async def wrapped_f(self, *args, **kwargs):
+        if not await self.a_has_started_activity():
+            raise no_activity()
+        return await f(self, *args, **kwargs)
+
+    return wrapped_f
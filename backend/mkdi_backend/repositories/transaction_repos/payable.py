@@ -1,19 +1,25 @@
 from abc import abstractmethod
 import datetime
+from http import HTTPStatus
+from typing import List, Optional
 from sqlalchemy.ext.asyncio.session import AsyncSession
 from mkdi_backend.repositories.transaction_repos.invariant import (
     async_managed_invariant_tx_method,
     managed_invariant_tx_method,
 )
-from mkdi_backend.utils.database import CommitMode, managed_tx_method
+from mkdi_backend.utils.database import CommitMode, async_managed_tx_method, managed_tx_method
 from mkdi_backend.repositories.transaction_repos.abstract_transaction import AbstractTransaction
+from mkdi_backend.models.Account import Account
+from mkdi_backend.models.Activity import FundCommit
 from mkdi_backend.models.transactions.transactions import Payment
 from mkdi_shared.exceptions.mkdi_api_error import MkdiError, MkdiErrorCode
 from mkdi_shared.schemas import protocol as pr
-from sqlmodel import func, select
+from sqlmodel import and_, func, or_, select
 
 
 class PayableTransaction(AbstractTransaction):
+    # accounts loaded once for all the payments of a group, see add_payments
+    group_accounts: Optional[List[Account]] = None
 
     @abstractmethod
     async def a_commit(
@@ -21,10 +27,51 @@ class PayableTransaction(AbstractTransaction):
     ) -> list:
         """commit payment"""
 
+    @abstractmethod
+    def payment_initials(self, transaction: pr.TransactionDB) -> str:
+        """initials of the account a payment of the transaction is committed on"""
+
+    async def payment_accounts(self) -> List[Account]:
+        """accounts of the payment being committed, those of the group when paying a group"""
+        if self.group_accounts is not None:
+            return self.group_accounts
+        return await self.a_accounts()
+
     @abstractmethod
     def cancel_payment_commit(self, payment: Payment):
         """cancel payment commit"""
 
+    @abstractmethod
+    def reverse_payment(self, payment: Payment, accounts: list, activity_id) -> FundCommit:
+        """revert the balance variations of a payment
+
+        Args:
+            payment (Payment): the cancelled payment
+            accounts (list): the accounts of the transaction
+            activity_id: the open activity of the office
+
+        Returns:
+            FundCommit: the fund history entry of the cancellation
+        """
+
+    async def a_cancel_payment_commit(self, payment: Payment) -> FundCommit:
+        """cancel payment commit on an async session"""
+        accounts = await self.a_accounts()
+        activity = await self.a_has_started_activity()
+        return self.reverse_payment(payment, accounts, activity["id"])
+
+    def mark_pending(self, transaction: pr.TransactionDB) -> pr.TransactionDB:
+        """approved payable transactions wait for their payments"""
+        transaction.state = pr.TransactionState.PENDING
+        transaction.reviwed_by = self.user.user_db_id
+        self.db.add(transaction)
+        return transaction
+
+    @async_managed_invariant_tx_method(auto_commit=CommitMode.COMMIT)
+    async def a_approve(self, transaction: pr.TransactionDB) -> pr.TransactionDB:
+        self.write_notes(transaction)
+        return self.mark_pending(transaction)
+
     def get_payments(self) -> int:
         """get payments made on the transaction"""
         assert self.transaction is not None  # make sure a transactin is mapped
@@ -74,9 +121,88 @@ class PayableTransaction(AbstractTransaction):
         transaction = await self.get_a_transaction(code=code, tr_type=payment.payment_type)
         self.set_transaction(transaction)
 
-        # the transaction should not have a paid amount greather than the amount
         # get the total amount paid on the transaction
         paid = await self.get_paid_amount(transaction.id)
+        return await self.record_payment(payment, transaction, paid)
+
+    @async_managed_invariant_tx_method(auto_commit=CommitMode.COMMIT)
+    async def add_payments(self, items: List[pr.GroupedPaymentItem]) -> pr.GroupPayResponse:
+        """Pay a group of transactions of the same type in one database transaction.
+
+        The transactions, their paid amounts and the accounts of the payments are loaded once
+        for the whole group, the payments are then committed one after the other on the loaded
+        accounts. The invariant is checked once and a failing payment fails the whole group.
+
+        Args:
+            items (List[pr.GroupedPaymentItem]): the payments, a transaction may appear twice
+
+        Returns:
+            pr.GroupPayResponse: the state of every payment, in the order of the items
+        """
+        transactions, paid, self.group_accounts = await self.load_group(
+            [item.code for item in items], items[0].request.payment_type
+        )
+        states = []
+        try:
+            for item in items:
+                transaction = transactions[item.code]
+                self.set_transaction(transaction)
+                payment = await self.record_payment(
+                    item.request, transaction, paid.get(transaction.id, 0)
+                )
+                paid[transaction.id] = paid.get(transaction.id, 0) + payment.amount
+                states.append(pr.GroupPayResponseItem(code=item.code, state=payment.state))
+        finally:
+            self.group_accounts = None
+
+        return pr.GroupPayResponse(states=states)
+
+    async def load_group(self, codes: List[str], tr_type: pr.TransactionType) -> tuple:
+        """load the transactions of a group payment, their paid amounts and their accounts
+
+        Returns:
+            tuple: the transactions by code, the paid amounts by transaction id, the accounts
+        """
+        session: AsyncSession = self.db
+        model = self.get_model(tr_type)
+        transactions = {
+            transaction.code: transaction
+            for transaction in await session.scalars(select(model).where(model.code.in_(codes)))
+        }
+        missing = set(codes) - transactions.keys()
+        if missing:
+            raise MkdiError(
+                f"Transactions not found: {', '.join(sorted(missing))}",
+                error_code=MkdiErrorCode.NOT_FOUND,
+                http_status_code=HTTPStatus.NOT_FOUND,
+            )
+
+        ids = [transaction.id for transaction in transactions.values()]
+        paid = await session.execute(
+            select(Payment.transaction_id, func.sum(Payment.amount))
+            .where(Payment.transaction_id.in_(ids), Payment.state == pr.PaymentState.PAID)
+            .group_by(Payment.transaction_id)
+        )
+
+        initials = {self.payment_initials(transaction) for transaction in transactions.values()}
+        accounts = await session.scalars(
+            select(Account).where(
+                or_(
+                    Account.initials.in_(initials),
+                    and_(
+                        Account.office_id == self.user.office_id,
+                        Account.type.in_([pr.AccountType.FUND, pr.AccountType.OFFICE]),
+                    ),
+                )
+            )
+        )
+        return transactions, dict(paid.all()), accounts.all()
+
+    async def record_payment(
+        self, payment: pr.PaymentRequest, transaction: pr.TransactionDB, paid
+    ) -> Payment:
+        """pay the loaded transaction, ``paid`` is the amount already paid on it"""
+        # the transaction should not have a paid amount greather than the amount
         if (paid + payment.amount) > transaction.amount and transaction.tag != "BANKTT":
             raise MkdiError(
                 error_code=MkdiErrorCode.INVALID_STATE,
@@ -116,6 +242,7 @@ class PayableTransaction(AbstractTransaction):
         # create fund history
         self.db.add(transaction)
         self.db.add(fund_history)
+        self.db.add(payment_db)
 
         return payment_db
 
@@ -140,8 +267,29 @@ class PayableTransaction(AbstractTransaction):
         payment.state = pr.PaymentState.CANCELLED
         return payment
 
-    @managed_tx_method(auto_commit=CommitMode.COMMIT)
-    def rollback(self, transaction: pr.TransactionDB) -> pr.TransactionResponse:
+    async def a_get_payment(self, payment_id: str):
+        session: AsyncSession = self.db
+        return await session.scalar(select(Payment).where(Payment.id == payment_id))
+
+    @async_managed_invariant_tx_method(auto_commit=CommitMode.COMMIT)
+    async def a_cancel_payment(self, payment_id: str) -> Payment:
+        """cancel a payment of the transaction on an async session"""
+        payment = await self.a_get_payment(payment_id)
+        assert self.transaction is not None
+        assert payment.transaction_id == self.transaction.id
+
+        fund_history = await self.a_cancel_payment_commit(payment)
+
+        self.transaction.state = pr.TransactionState.REVIEW
+
+        self.db.add(self.transaction)
+        self.db.add(fund_history)
+
+        payment.state = pr.PaymentState.CANCELLED
+        return payment
+
+    def cancel_state(self, transaction: pr.TransactionDB) -> pr.TransactionDB:
+        """move a transaction that was not paid to the cancelled state"""
         # this will rollback the transaction to it's previous state
         assert (
             transaction.state != pr.TransactionState.PAID
@@ -151,3 +299,11 @@ class PayableTransaction(AbstractTransaction):
         ), "Transaction must not be cancelled to rollback"
         transaction.state = pr.TransactionState.CANCELLED
         return transaction
+
+    @managed_tx_method(auto_commit=CommitMode.COMMIT)
+    def rollback(self, transaction: pr.TransactionDB) -> pr.TransactionResponse:
+        return self.cancel_state(transaction)
+
+    @async_managed_tx_method(auto_commit=CommitMode.COMMIT)
+    async def a_rollback(self, transaction: pr.TransactionDB) -> pr.TransactionDB:
+        return self.cancel_state(transaction)
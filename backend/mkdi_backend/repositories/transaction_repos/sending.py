@@ -1,6 +1,6 @@
 """Internal Transaction Repository"""
 
-from typing import List
+from typing import Dict, List
 import random
 import string
 from datetime import datetime
@@ -24,11 +24,14 @@ class SendingTransaction(PayableTransaction):
     Sending Transaction
     """
 
+    def payment_initials(self, transaction: Sending) -> str:
+        return transaction.receiver_initials
+
     async def a_commit(
         self, commited_amount, transaction: Sending, has_complete=False
     ) -> List[pr.TransactionCommit]:
         commits = []
-        accounts: List[Account] = await self.a_accounts()
+        accounts: List[Account] = await self.payment_accounts()
 
         office: Account = next((x for x in accounts if x.type == pr.AccountType.OFFICE), None)
         receiver: Account = next(
@@ -86,22 +89,52 @@ class SendingTransaction(PayableTransaction):
         return accounts
 
     def get_transaction(self, code: str) -> pr.TransactionDB:
-        return self.db.scalars(select(Sending).where(Sending.code == code)).one()
+        return self.db.scalars(select(Sending).where(Sending.code == code)).one_or_none()
 
-    def do_transaction(self) -> None:
-        user: KcUser = self.user
+    async def a_get_transaction(self, code: str) -> Sending:
+        return await self.db.scalar(select(Sending).where(Sending.code == code))
+
+    def validate_request(self) -> pr.SendingRequest:
+        """validate the request inputs"""
         user_input: pr.SendingRequest = self.get_inputs().data
 
         assert isinstance(user_input, pr.SendingRequest)
         assert user_input.receiver_initials is not None
+        return user_input
+
+    def office_query(self):
+        return select(Account).where(
+            Account.type == pr.AccountType.OFFICE, Account.owner_id == self.user.office_id
+        )
 
+    def do_transaction(self) -> None:
+        self.validate_request()
         accounts = self.accounts()
+        office = self.db.scalar(self.office_query())
+        return self.create_transaction(accounts, self.next_code(office))
+
+    async def a_do_transaction(self) -> Sending:
+        session: AsyncSession = self.db
+        self.validate_request()
+        accounts = await self.a_accounts()
+        office = await session.scalar(self.office_query())
+        return self.create_transaction(accounts, await self.a_next_code(office))
+
+    def request_initials(self) -> List[str]:
+        return [self.validate_request().receiver_initials]
+
+    def validate_accounts(self, accounts: Dict[str, Account], office: Account) -> Account:
+        assert office is not None
+        return office
+
+    def create_requested(self, accounts: Dict[str, Account], code: str) -> Sending:
+        return self.create_transaction([accounts[self.request_initials()[0]]], code)
+
+    def create_transaction(self, accounts: List[Account], code: str) -> Sending:
+        """create the requested transaction, numbered by the office account"""
+        user: KcUser = self.user
+        user_input: pr.SendingRequest = self.get_inputs().data
         payer = next((x for x in accounts if x.initials == user_input.receiver_initials), None)
-        office = self.db.scalar(
-            select(Account).where(
-                Account.type == pr.AccountType.OFFICE, Account.owner_id == user.office_id
-            )
-        )
 
         if payer is None:
             raise MkdiError(
@@ -111,7 +144,7 @@ class SendingTransaction(PayableTransaction):
 
         sending = Sending(
             amount=self.get_amount(),
-            code=self.generate_code(office.initials, office.counter if office.counter else 0),
+            code=code,
             office_id=user.office_id,
             org_id=user.organization_id,
             type=pr.TransactionType.SENDING,
@@ -130,9 +163,7 @@ class SendingTransaction(PayableTransaction):
         notes = self.update_notes(notes, "REQUEST", self.get_inputs().message)
         sending.notes = json.dumps(notes)
 
-        office.counter = office.counter + 1 if office.counter else 1
         self.db.add(sending)
-        self.db.add(office)
 
         return sending
 
@@ -141,18 +172,17 @@ class SendingTransaction(PayableTransaction):
         """
         Approve internal transaction
         """
-        transaction.state = pr.TransactionState.PENDING
-        transaction.reviwed_by = self.user.user_db_id
-        self.db.add(transaction)
-        return transaction
+        self.write_notes(transaction)
+        return self.mark_pending(transaction)
 
     async def a_accounts(self, receiver=None) -> List[Account]:
         session: AsyncSession = self.db
         request = self.get_inputs()
         charges = 0
-        if hasattr(request, "data") and isinstance(request.data, pr.ExternalRequest):
+        if hasattr(request, "data") and isinstance(request.data, pr.SendingRequest):
             data: pr.SendingRequest = request.data
             receiver = data.receiver_initials
+            charges = request.charges.amount if request.charges else 0
         elif receiver is None:
             tr: Sending = self.transaction
             receiver = tr.receiver_initials
@@ -178,8 +208,10 @@ class SendingTransaction(PayableTransaction):
     @managed_invariant_tx_method(auto_commit=CommitMode.COMMIT)
     def cancel_payment_commit(self, payment: Payment) -> None:
         """cancel payment on the transaction"""
+        return self.reverse_payment(payment, self.accounts(), self.has_started_activity().id)
+
+    def reverse_payment(self, payment: Payment, accounts: List[Account], activity_id) -> FundCommit:
         commits = list()
-        accounts = self.accounts()
 
         office: Account = next((x for x in accounts if x.type == pr.AccountType.OFFICE), None)
         receiver: Account = next(
@@ -197,13 +229,11 @@ class SendingTransaction(PayableTransaction):
             commits.append(fund.debit(self.transaction.charges))
             commits.append(office.debit(self.transaction.charges))
 
-        activity = self.has_started_activity()
-
         fund_history = FundCommit(
             v_from=(fund.balance),
             variation=payment.amount,
             account=self.transaction.receiver_initials,
-            activity_id=activity.id,
+            activity_id=activity_id,
             description=f"Cancelling Sending {self.transaction.code}",
             is_out=True,
             date=datetime.now(),
@@ -212,6 +242,3 @@ class SendingTransaction(PayableTransaction):
         self.transaction.save_commit(commits)
 
         return fund_history
-
-    def rollback(self, transaction: Sending) -> pr.TransactionResponse:
-        pass
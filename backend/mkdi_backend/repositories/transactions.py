@@ -1,15 +1,18 @@
-from typing import List
+from collections import Counter, defaultdict
+from typing import AsyncIterator, List, Mapping, Tuple
 
-from sqlalchemy import union_all
+from sqlalchemy import tuple_, union_all
 from sqlalchemy.ext.asyncio.session import AsyncSession
 from asyncio import TaskGroup
 from mkdi_backend.models.Account import Account
+from mkdi_backend.models.Activity import Activity
+from mkdi_backend.models.codes import account_code_sequence, format_code, next_code_numbers
 from mkdi_backend.models.Agent import Agent
 from mkdi_backend.models.office import OfficeWallet
 from mkdi_backend.models.models import KcUser
 from mkdi_backend.models.transactions.transaction_item import TransactionItem, AllTransactions
+from mkdi_backend.config import settings
 from mkdi_backend.dbmanager import sessionmanager
-import json
 from mkdi_backend.models.transactions.transactions import (
     Deposit,
     Internal,
@@ -28,14 +31,38 @@ from mkdi_backend.repositories.transaction_repos import (
     forex,
 )
 from mkdi_backend.repositories.transaction_repos.abstract_transaction import AbstractTransaction
+from mkdi_backend.repositories.transaction_repos.invariant import no_activity
 from mkdi_shared.exceptions.mkdi_api_error import MkdiError, MkdiErrorCode
 from mkdi_shared.schemas import protocol as pr
-from mkdi_backend.utils.database import CommitMode, managed_tx_method
+from mkdi_backend.utils.database import CommitMode, async_managed_tx_method, managed_tx_method
+from mkdi_backend.utils.pagination import (
+    a_newest_first,
+    decode_cursor,
+    encode_cursor,
+    newest_first,
+)
 from pydantic import ValidationError
 from sqlmodel import Session, or_, select
 from datetime import datetime, timedelta
 
 
+TRANSACTION_MODELS = {
+    pr.TransactionType.DEPOSIT: Deposit,
+    pr.TransactionType.EXTERNAL: External,
+    pr.TransactionType.SENDING: Sending,
+    pr.TransactionType.INTERNAL: Internal,
+    pr.TransactionType.FOREX: ForEx,
+}
+
+
+# every column of the transaction tables, in a stable order for the exports
+EXPORT_COLUMNS = list(
+    dict.fromkeys(
+        column.name for model in TRANSACTION_MODELS.values() for column in model.__table__.columns
+    )
+)
+
+
 class TransactionRepository:
     """transaction repository"""
 
@@ -53,6 +80,172 @@ class TransactionRepository:
 
         return response
 
+    async def a_request_for_approval(self, user: KcUser, user_input: pr.TransactionRequest):
+        """async version of request_for_approval"""
+        requester = self.get_concrete_type(user_input.data.type)(self.db, user, user_input)
+        return await requester.a_request()
+
+    def _requesters(self, user: KcUser, requests: List[pr.TransactionRequest]) -> tuple:
+        """the requester of every request, the initials of their accounts and the failures"""
+        if len(requests) > settings.TRANSACTIONS_BATCH_MAX_SIZE:
+            raise MkdiError(
+                error_code=MkdiErrorCode.INVALID_INPUT,
+                message=f"At most {settings.TRANSACTIONS_BATCH_MAX_SIZE} requests per batch",
+            )
+        requesters, initials, failures = [], set(), []
+        for index, request in enumerate(requests):
+            requester = None
+            try:
+                if request.data is None:
+                    raise MkdiError(
+                        error_code=MkdiErrorCode.INVALID_INPUT, message="missing request data"
+                    )
+                requester = self.get_concrete_type(request.data.type)(self.db, user, request)
+                initials.update(requester.request_initials())
+            except (AssertionError, MkdiError) as error:
+                failures.append((index, getattr(error, "message", None) or "invalid request"))
+                requester = None
+            requesters.append(requester)
+        return requesters, initials, failures
+
+    def _numbering_accounts(self, requesters: list, accounts: List[Account], failures: list):
+        """validate the accounts of every request, returns the accounts numbering their codes"""
+        by_initials = {account.initials: account for account in accounts}
+        office = next((x for x in accounts if x.type == pr.AccountType.OFFICE), None)
+        numbering = []
+        for index, requester in enumerate(requesters):
+            if requester is None:
+                continue
+            try:
+                missing = [x for x in requester.request_initials() if x not in by_initials]
+                if missing:
+                    raise MkdiError(
+                        error_code=MkdiErrorCode.NOT_FOUND,
+                        message=f"account {', '.join(missing)} not found",
+                    )
+                numbering.append(requester.validate_accounts(by_initials, office))
+            except (AssertionError, MkdiError) as error:
+                failures.append((index, getattr(error, "message", None) or "invalid request"))
+
+        if failures:
+            raise MkdiError(
+                error_code=MkdiErrorCode.INVALID_INPUT,
+                message="Transactions not requested, "
+                + "; ".join(f"{index}: {reason}" for index, reason in sorted(failures)),
+            )
+        return by_initials, numbering
+
+    def _create_requested(
+        self, requesters: list, accounts: dict, numbering: List[Account], numbers
+    ) -> List[Tuple[type, str]]:
+        """create the requested transactions, returns their models and codes"""
+        sequences = defaultdict(list)
+        for row in numbers:
+            sequences[row.sequence].append(row.number)
+        for allocated in sequences.values():
+            allocated.sort(reverse=True)
+
+        created = []
+        for requester, account in zip(requesters, numbering):
+            number = sequences[account_code_sequence(account.id)].pop()
+            transaction = requester.create_requested(
+                accounts, format_code(account.initials, number)
+            )
+            created.append((type(transaction), transaction.code))
+        return created
+
+    def _activity_query(self, user: KcUser):
+        return select(Activity.id).where(
+            Activity.office_id == user.office_id, Activity.state == pr.ActivityState.OPEN
+        )
+
+    def _batch_accounts_query(self, user: KcUser, initials: set):
+        """the accounts of the office referenced by a batch of requests and the office account"""
+        return select(Account).where(
+            Account.office_id == user.office_id,
+            or_(Account.initials.in_(initials), Account.type == pr.AccountType.OFFICE),
+        )
+
+    def _requested_queries(self, created: List[Tuple[type, str]]) -> list:
+        codes = defaultdict(list)
+        for model, code in created:
+            codes[model].append(code)
+        return [select(model).where(model.code.in_(codes)) for model, codes in codes.items()]
+
+    def _in_request_order(self, created: List[Tuple[type, str]], transactions: list) -> list:
+        by_code = {
+            (type(transaction), transaction.code): transaction for transaction in transactions
+        }
+        return [by_code[key] for key in created]
+
+    @managed_tx_method(auto_commit=CommitMode.COMMIT)
+    def _request_batch(self, user: KcUser, requests: List[pr.TransactionRequest]) -> list:
+        if self.db.scalar(self._activity_query(user)) is None:
+            raise no_activity()
+
+        requesters, initials, failures = self._requesters(user, requests)
+        accounts = self.db.scalars(self._batch_accounts_query(user, initials)).all()
+        accounts, numbering = self._numbering_accounts(requesters, accounts, failures)
+
+        counts = Counter(account_code_sequence(account.id) for account in numbering)
+        numbers = self.db.execute(next_code_numbers(counts)).all()
+        return self._create_requested(requesters, accounts, numbering, numbers)
+
+    def request_batch(
+        self, user: KcUser, requests: List[pr.TransactionRequest]
+    ) -> List[pr.TransactionDB]:
+        """Request a batch of transactions for approval, all of them or none.
+
+        The requests are validated first, their accounts are loaded in a single query and
+        their codes allocated in another one. The transactions are then inserted in one
+        database transaction. Nothing is inserted when a request is invalid.
+
+        Args:
+            user (KcUser): the requesting user
+            requests (List[pr.TransactionRequest]): the requests, of any transaction type
+
+        Raises:
+            MkdiError: INVALID_INPUT, listing every invalid request by its index
+
+        Returns:
+            List[pr.TransactionDB]: the created transactions, in the order of the requests
+        """
+        if not requests:
+            return []
+        created = self._request_batch(user, requests)
+        # expired by the commit, reloaded by type
+        transactions = [
+            x for query in self._requested_queries(created) for x in self.db.scalars(query)
+        ]
+        return self._in_request_order(created, transactions)
+
+    @async_managed_tx_method(auto_commit=CommitMode.COMMIT)
+    async def _a_request_batch(self, user: KcUser, requests: List[pr.TransactionRequest]) -> list:
+        session: AsyncSession = self.db
+        if await session.scalar(self._activity_query(user)) is None:
+            raise no_activity()
+
+        requesters, initials, failures = self._requesters(user, requests)
+        accounts = (await session.scalars(self._batch_accounts_query(user, initials))).all()
+        accounts, numbering = self._numbering_accounts(requesters, accounts, failures)
+
+        counts = Counter(account_code_sequence(account.id) for account in numbering)
+        numbers = (await session.execute(next_code_numbers(counts))).all()
+        return self._create_requested(requesters, accounts, numbering, numbers)
+
+    async def a_request_batch(
+        self, user: KcUser, requests: List[pr.TransactionRequest]
+    ) -> List[pr.TransactionDB]:
+        """async version of request_batch"""
+        if not requests:
+            return []
+        session: AsyncSession = self.db
+        created = await self._a_request_batch(user, requests)
+        transactions = [
+            x for query in self._requested_queries(created) for x in await session.scalars(query)
+        ]
+        return self._in_request_order(created, transactions)
+
     def _get_month_range(self, start: str | None, end: str | None):
         today = datetime.now()
         date_format = "%Y-%m-%dT%H:%M:%S.%fZ"
@@ -70,9 +263,14 @@ class TransactionRepository:
         return start_date, end_date
 
     def get_agent_transactions(
-        self, office_id: str, initials: str, start_date_str: str, end_date_str: None
+        self,
+        office_id: str,
+        initials: str,
+        start_date_str: str,
+        end_date_str: None,
+        limit: int | None = None,
     ) -> List[AllTransactions]:
-        """get all transactions for an agent"""
+        """get all transactions for an agent, newest first"""
 
         start_date, end_date = self._get_month_range(start_date_str, end_date_str)
 
@@ -85,54 +283,27 @@ class TransactionRepository:
 
         initials_str = list(map(lambda x: x.initials, accounts))
 
-        deposits = self.db.scalars(
-            select(Deposit)
-            .where(Deposit.office_id == office_id)
-            .where(Deposit.owner_initials.in_(initials_str))
-            .where(Deposit.created_at >= start_date)
-            .where(Deposit.created_at <= end_date)
-            .order_by(Deposit.created_at.desc())
-        ).all()
-        externals = self.db.scalars(
-            select(External)
-            .where(External.office_id == office_id)
-            .where(External.sender_initials.in_(initials_str))
-            .where(External.created_at >= start_date)
-            .where(External.created_at <= end_date)
-            .order_by(External.created_at.desc())
-        ).all()
-        sendings = self.db.scalars(
-            select(Sending)
-            .where(Sending.office_id == office_id)
-            .where(Sending.receiver_initials.in_(initials_str))
-            .where(Sending.created_at >= start_date)
-            .where(Sending.created_at <= end_date)
-            .order_by(Sending.created_at.desc())
-        ).all()
-
-        forexs = self.db.scalars(
-            select(ForEx)
-            .where(ForEx.office_id == office_id)
-            .where(ForEx.customer_account.in_(initials_str))
-            .where(ForEx.created_at >= start_date)
-            .where(ForEx.created_at <= end_date)
-            .order_by(ForEx.created_at.desc())
-        ).all()
-
-        internals = self.db.scalars(
-            select(Internal)
-            .where(Internal.office_id == office_id)
-            .where(Internal.created_at >= start_date)
-            .where(Internal.created_at <= end_date)
-            .where(
-                or_(
-                    Internal.sender_initials.in_(initials_str),
-                    Internal.receiver_initials.in_(initials_str),
-                )
-            )
-        ).all()
-
-        return forexs + internals + sendings + deposits + externals
+        conditions = {
+            Deposit: Deposit.owner_initials.in_(initials_str),
+            External: External.sender_initials.in_(initials_str),
+            Sending: Sending.receiver_initials.in_(initials_str),
+            ForEx: ForEx.customer_account.in_(initials_str),
+            Internal: or_(
+                Internal.sender_initials.in_(initials_str),
+                Internal.receiver_initials.in_(initials_str),
+            ),
+        }
+        return self._latest(
+            [
+                select(model)
+                .where(model.office_id == office_id)
+                .where(condition)
+                .where(model.created_at >= start_date)
+                .where(model.created_at <= end_date)
+                for model, condition in conditions.items()
+            ],
+            limit,
+        )
 
     def get_concrete_type(self, transaction_type: str) -> AbstractTransaction:
         """return the concrete type for the transaction"""
@@ -168,6 +339,13 @@ class TransactionRepository:
         transaction = reviewer.review(code)
         return transaction
 
+    async def a_review_transaction(
+        self, code: str, user: KcUser, user_input: pr.TransactionReviewReq
+    ) -> pr.TransactionResponse:
+        """async version of review_transaction"""
+        reviewer = self.get_concrete_type(user_input.type)(self.db, user, user_input)
+        return await reviewer.a_review(code)
+
     def get_transaction(self, user: KcUser, code: str) -> pr.TransactionResponse:
         """get a transaction"""
         # use select and join to get the transaction by code from Internal Deposit and ...
@@ -234,6 +412,30 @@ class TransactionRepository:
         self.db.add(transaction)
         return transaction
 
+    @async_managed_tx_method(auto_commit=CommitMode.COMMIT)
+    async def a_update_transaction(
+        self, user: KcUser, code: str, usr_input: pr.TransactionRequest
+    ) -> pr.TransactionDB:
+        """async version of update_transaction"""
+        if not usr_input.data and not usr_input.transaction_type:
+            raise MkdiError(
+                error_code=MkdiErrorCode.INVALID_INPUT,
+                message="You should provide a transaction type",
+            )
+        tr_type = usr_input.data.type if usr_input.data else usr_input.transaction_type
+        transactionImpl = self.get_concrete_type(tr_type)(self.db, user, usr_input)
+
+        transaction: pr.TransactionDB = await transactionImpl.a_get_transaction(code)
+        if not transaction:
+            raise MkdiError(
+                error_code=MkdiErrorCode.NOT_FOUND,
+                message=f"Transaction code {code} not found",
+            )
+
+        transaction.update(usr_input)
+        self.db.add(transaction)
+        return transaction
+
     async def add_payment(
         self, user: KcUser, code: str, usr_input: pr.PaymentRequest
     ) -> pr.PaymentResponse:
@@ -255,111 +457,165 @@ class TransactionRepository:
         payment = await transactionImpl.add_payment(payment=usr_input, code=code)
         return payment
 
-    def _collect_transactions(self, *items) -> List[TransactionItem]:
-        result = []
-        for collection in items:
-            for item in collection.scalars().all():
-                notes = json.loads(item.notes) if len(item.notes) > 0 else []
-                result.append(TransactionItem(item=item, notes=notes))
+    def _collect_transactions(self, items) -> List[TransactionItem]:
+        # the notes are not decoded per row, clients parse item.notes
+        return [TransactionItem(item=item) for item in items]
 
-        return result
+    def _latest(self, statements: list, limit: int | None = None) -> List[AllTransactions]:
+        """
+        Run one query per transaction type and merge the rows newest first.
 
-    def get_offcie_transactions(
-        self, user: KcUser, start_date: str | None, end_date: str | None
-    ) -> List[AllTransactions]:
-        """Get Office Transactions by interval date"""
-        start_date, end_date = self._get_month_range(start_date, end_date)
-        internals = self.db.scalars(
-            select(Internal)
-            .where(Internal.office_id == user.office_id)
-            .where(Internal.created_at >= start_date)
-            .where(Internal.created_at <= end_date)
-            .order_by(Internal.created_at.desc())
-        ).all()
+        Args:
+            statements (list): select statements of the transaction models, unordered.
+            limit (int, optional): The maximum number of transactions to return, pushed down
+                to every query so no type reads more rows than the window.
 
-        deposits = self.db.scalars(
-            select(Deposit)
-            .where(Deposit.office_id == user.office_id)
-            .where(Deposit.created_at >= start_date)
-            .where(Deposit.created_at <= end_date)
-            .order_by(Deposit.created_at.desc())
-        ).all()
+        Returns:
+            List[AllTransactions]: The transactions of every type, newest first.
+        """
+        results = []
+        for stmt in statements:
+            model = stmt.column_descriptions[0]["entity"]
+            stmt = stmt.order_by(model.created_at.desc(), model.id.desc())
+            if limit:
+                stmt = stmt.limit(limit)
+            results.append(self.db.scalars(stmt))
 
-        externals = self.db.scalars(
-            select(External)
-            .where(External.office_id == user.office_id)
-            .where(External.created_at >= start_date)
-            .where(External.created_at <= end_date)
-            .order_by(External.created_at.desc())
-        ).all()
+        return newest_first(*results, limit=limit)
 
-        sendings = self.db.scalars(
-            select(Sending)
-            .where(Sending.office_id == user.office_id)
-            .where(Sending.created_at >= start_date)
-            .where(Sending.created_at <= end_date)
-            .order_by(Sending.created_at.desc())
-        ).all()
-
-        forexs = self.db.scalars(
-            select(ForEx)
-            .where(ForEx.office_id == user.office_id)
-            .where(ForEx.created_at >= start_date)
-            .where(ForEx.created_at <= end_date)
-            .order_by(ForEx.created_at.desc())
-        ).all()
+    def get_offcie_transactions(
+        self,
+        user: KcUser,
+        start_date: str | None,
+        end_date: str | None,
+        limit: int | None = None,
+    ) -> List[AllTransactions]:
+        """Get Office Transactions by interval date, newest first"""
+        start_date, end_date = self._get_month_range(start_date, end_date)
+        return self._latest(
+            [
+                select(model)
+                .where(model.office_id == user.office_id)
+                .where(model.created_at >= start_date)
+                .where(model.created_at <= end_date)
+                for model in TRANSACTION_MODELS.values()
+            ],
+            limit,
+        )
 
-        return forexs + internals + sendings + deposits + externals
-
-    async def get_offcie_transactions_items(self, user: KcUser) -> List[TransactionItem]:
-
-        async with (
-            sessionmanager.session() as session1,
-            sessionmanager.session() as session2,
-            sessionmanager.session() as session3,
-            sessionmanager.session() as session4,
-            sessionmanager.session() as session5,
-        ):
-            office_id = user.office_id
-            deposit_stm = (
-                select(Deposit)
-                .where(Deposit.office_id == office_id)
-                .order_by(Deposit.created_at.desc())
-            )
-            external_stm = (
-                select(External)
-                .where(External.office_id == office_id)
-                .order_by(External.created_at.desc())
-            )
-            sending_stm = (
-                select(Sending)
-                .where(Sending.office_id == office_id)
-                .order_by(Sending.created_at.desc())
-            )
-            internal_stm = (
-                select(Internal)
-                .where(Internal.office_id == office_id)
-                .order_by(Internal.created_at.desc())
-            )
-            forex_stm = (
-                select(ForEx).where(ForEx.office_id == office_id).order_by(ForEx.created_at.desc())
+    async def _fetch_all(self, stmt) -> list:
+        async with sessionmanager.session() as session:
+            return (await session.scalars(stmt)).all()
+
+    async def get_offcie_transactions_items(
+        self,
+        user: KcUser,
+        cursor: str | None = None,
+        limit: int = settings.TRANSACTIONS_PAGE_SIZE,
+        types: List[pr.TransactionType] | None = None,
+        states: List[pr.TransactionState] | None = None,
+        start_date: datetime | None = None,
+        end_date: datetime | None = None,
+    ) -> Tuple[List[TransactionItem], str | None]:
+        """
+        Get a page of the office transactions, newest first across every transaction type.
+
+        Args:
+            user (KcUser): The authenticated user.
+            cursor (str, optional): The cursor returned with the previous page.
+            limit (int): The page size.
+            types (List[pr.TransactionType], optional): Only return these transaction types.
+            states (List[pr.TransactionState], optional): Only return these states.
+            start_date (datetime, optional): Only return transactions created after this date.
+            end_date (datetime, optional): Only return transactions created before this date.
+
+        Returns:
+            Tuple[List[TransactionItem], str | None]: The page and the cursor of the next one,
+            None when this is the last page.
+        """
+        after = decode_cursor(cursor) if cursor else None
+        types = types or list(TRANSACTION_MODELS)
+        models = [model for tr_type, model in TRANSACTION_MODELS.items() if tr_type in types]
+
+        statements = []
+        for model in models:
+            stmt = select(model).where(model.office_id == user.office_id)
+            if states:
+                stmt = stmt.where(model.state.in_(states))
+            if start_date:
+                stmt = stmt.where(model.created_at >= start_date)
+            if end_date:
+                stmt = stmt.where(model.created_at <= end_date)
+            if after:
+                stmt = stmt.where(tuple_(model.created_at, model.id) < after)
+            # one extra row tells whether there is a next page
+            statements.append(
+                stmt.order_by(model.created_at.desc(), model.id.desc()).limit(limit + 1)
             )
 
-            async with TaskGroup() as tg:
-                deposit_task = tg.create_task(session1.execute(deposit_stm))
-                external_task = tg.create_task(session2.execute(external_stm))
-                sending_task = tg.create_task(session3.execute(sending_stm))
-                internal_task = tg.create_task(session4.execute(internal_stm))
-                forex_task = tg.create_task(session5.execute(forex_stm))
-                deposits, externals, sendings, internals, forexs = (
-                    await deposit_task,
-                    await external_task,
-                    await sending_task,
-                    await internal_task,
-                    await forex_task,
+        async with TaskGroup() as tg:
+            tasks = [tg.create_task(self._fetch_all(stmt)) for stmt in statements]
+
+        page = newest_first(*(task.result() for task in tasks), limit=limit + 1)
+        next_cursor = None
+        if len(page) > limit:
+            page = page[:limit]
+            next_cursor = encode_cursor(page[-1].created_at, page[-1].id)
+
+        return self._collect_transactions(page), next_cursor
+
+    async def stream_office_transactions(
+        self,
+        user: KcUser,
+        start_date: str | None,
+        end_date: str | None,
+        types: List[pr.TransactionType] | None = None,
+        states: List[pr.TransactionState] | None = None,
+    ) -> AsyncIterator[Mapping]:
+        """
+        Stream the office transactions of a date range, newest first, as column mappings.
+
+        Every transaction type is read through a server side cursor and the cursors are
+        merged lazily, memory stays constant whatever the size of the range.
+
+        Args:
+            user (KcUser): The authenticated user.
+            start_date (str, optional): Start of the range, the current month by default.
+            end_date (str, optional): End of the range.
+            types (List[pr.TransactionType], optional): Only export these transaction types.
+            states (List[pr.TransactionState], optional): Only export these states.
+
+        Returns:
+            AsyncIterator[Mapping]: The transactions, one mapping of column values each.
+        """
+        start_date, end_date = self._get_month_range(start_date, end_date)
+        types = types or list(TRANSACTION_MODELS)
+
+        # the request session is closed before the response is streamed, use our own
+        async with sessionmanager.connect() as connection:
+            streams = []
+            for tr_type, model in TRANSACTION_MODELS.items():
+                if tr_type not in types:
+                    continue
+                table = model.__table__
+                stmt = (
+                    select(table)
+                    .where(table.c.office_id == user.office_id)
+                    .where(table.c.created_at >= start_date)
+                    .where(table.c.created_at <= end_date)
+                )
+                if states:
+                    stmt = stmt.where(table.c.state.in_(states))
+                stmt = stmt.order_by(table.c.created_at.desc(), table.c.id.desc())
+                result = await connection.stream(
+                    stmt.execution_options(yield_per=settings.EXPORT_BATCH_SIZE)
                 )
+                streams.append(result.mappings())
 
-                return self._collect_transactions(deposits, externals, sendings, forexs, internals)
+            async for row in a_newest_first(
+                *streams, key=lambda row: (row["created_at"], row["id"])
+            ):
+                yield row
 
     async def get_office_transactions(self, user: KcUser) -> List[pr.TransactionResponse]:
         fields = list(pr.TransactionDB.__fields__.keys())
@@ -426,15 +682,26 @@ class TransactionRepository:
 
         transaction = reviewer.rollback(transaction)
 
-        notes = json.loads(transaction.notes if hasattr(transaction, "notes") else "[]")
-
-        reviewer.update_notes(notes, "CANCEL", usr_input.description, tags=usr_input.reason)
-        transaction.notes = json.dumps(notes)
-
+        # written by cancel, inside its managed transaction
+        reviewer.add_note("CANCEL", usr_input.description, tags=usr_input.reason)
         transaction = reviewer.cancel(transaction)
 
         return transaction
 
+    async def a_cancel_transaction(
+        self, user: KcUser, code: str, usr_input: pr.CancelTransaction
+    ) -> pr.TransactionDB:
+        """async version of cancel_transaction"""
+        reviewer = self.get_concrete_type(usr_input.type)(self.db, user, usr_input)
+
+        transaction = await reviewer.a_get_transaction(code)
+        reviewer.transaction = transaction
+
+        transaction = await reviewer.a_rollback(transaction)
+
+        reviewer.add_note("CANCEL", usr_input.description, tags=usr_input.reason)
+        return await reviewer.a_cancel(transaction)
+
     def cancel_payment(self, user: KcUser, id: str, request) -> pr.PaymentResponse:
 
         reviewer: AbstractTransaction = None
@@ -449,6 +716,13 @@ class TransactionRepository:
         payment = reviewer.cancel_payment(id)
         return payment
 
+    async def a_cancel_payment(self, user: KcUser, id: str, request) -> pr.PaymentResponse:
+        """async version of cancel_payment"""
+        reviewer = self.get_concrete_type(request.type)(self.db, user, request)
+
+        reviewer.transaction = await reviewer.a_get_transaction(request.code)
+        return await reviewer.a_cancel_payment(id)
+
     async def _collect_payment(
         self, user: KcUser, results: List[pr.GroupPayResponseItem], request: pr.GroupedPaymentItem
     ):
@@ -456,6 +730,19 @@ class TransactionRepository:
         results.append(pr.GroupPayResponseItem(code=request.code, state=result.state))
 
     async def group_pay(self, user: KcUser, request: pr.GroupPayRequest) -> pr.GroupPayResponse:
+        """pay a group of transactions, at once when they all have the same type"""
+        payment_types = {payment.request.payment_type for payment in request.payments}
+        if settings.GROUP_PAY_BATCHED and len(payment_types) == 1:
+            transactionImpl = self.get_concrete_type(payment_types.pop())(
+                self.db, user, request.payments[0].request
+            )
+            if not isinstance(transactionImpl, payable.PayableTransaction):
+                raise MkdiError(
+                    error_code=MkdiErrorCode.INVALID_STATE,
+                    message="Transaction is not payable",
+                )
+            return await transactionImpl.add_payments(request.payments)
+
         results: List[pr.GroupPayResponseItem] = []
 
         for payment in request.payments:
@@ -1,7 +1,9 @@
 """Trade State Manager"""
 
 from typing import Dict, Callable
+from sqlmodel import select
 from mkdi_shared.schemas import protocol as pr
+from mkdi_backend.models.transactions.transactions import WalletTrading
 from mkdi_backend.repositories.wallet_state import (
     InitState,
     CancelledState,
@@ -10,6 +12,7 @@ from mkdi_backend.repositories.wallet_state import (
     PaidState,
     TradeState,
 )
+from mkdi_backend.repositories.trades.trade_builder import TradeBuilder
 from mkdi_backend.utils.database import managed_tx_method, CommitMode
 from mkdi_backend.api.deps import UserDBSession
 
@@ -150,16 +153,17 @@ class TradeStateManager:
     def grouped_commit(
         self, session: UserDBSession, group: list[pr.CommitTradeRequest]
     ) -> list[pr.WalletTradingResponse]:
-        """Commit grouped trades"""
-        trades = []
-        for commit in group:
-            # find the trade by code
-            try:
-
-                trades.append(self.commit(session, commit.code, commit))
-            except Exception as e:
-                # log the error and continue
-                print(f"Error committing trade {commit.code}: {e}")
-                continue
-
-        return trades
+        """Commit grouped trades, all of them or none"""
+        if not group:
+            return []
+        TradeBuilder(session).commit_group(group)
+
+        # expired by the commit, reloaded in a single query
+        codes = [commit.code for commit in group]
+        trades = {
+            trade.code: trade
+            for trade in session.get_db().scalars(
+                select(WalletTrading).where(WalletTrading.code.in_(codes))
+            )
+        }
+        return [trades[code] for code in codes]
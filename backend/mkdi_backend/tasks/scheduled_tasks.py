@@ -1,12 +1,90 @@
+"""Periodic report jobs, fanned out to one task per office so several workers share them."""
+
+import time
+from datetime import datetime
+
+import mkdi_backend.api.deps  # noqa: F401, resolves the repositories import cycle
+from celery.signals import task_postrun, task_prerun
 from loguru import logger
+from mkdi_backend.config import settings
+from mkdi_backend.database import engine
+from mkdi_backend.models.office import Office
+from mkdi_backend.repositories.report_repo import ReportRepository
 from mkdi_backend.tasks.worker import app
+from sqlmodel import Session, func, select
+
+# start time of the tasks running in this worker process
+_started: dict = {}
+
+
+@task_prerun.connect
+def _task_started(task_id=None, **kwargs):
+    _started[task_id] = time.perf_counter()
+
+
+@task_postrun.connect
+def _task_done(task_id=None, task=None, state=None, **kwargs):
+    started = _started.pop(task_id, None)
+    if started is not None:
+        duration = (time.perf_counter() - started) * 1000
+        logger.info(f"task {task.name}[{task_id}] {state} in {duration:.0f}ms")
+
+
+def _office_ids() -> list:
+    with Session(engine) as db:
+        return [str(office_id) for office_id in db.scalars(select(Office.id)).all()]
+
+
+def _lock_office(db: Session, office_id: str) -> bool:
+    """Take the report lock of an office for the current transaction.
+
+    The lock is a postgres advisory lock, released by the commit or the rollback, so a
+    crashed worker never leaves an office locked.
+    """
+    return db.scalar(select(func.pg_try_advisory_xact_lock(func.hashtext(f"reports:{office_id}"))))
+
+
+@app.task(name="reports.start")
+def start_reports():
+    """open the reports of the current month, one task per office"""
+    current_month = datetime.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    office_ids = _office_ids()
+    for office_id in office_ids:
+        start_office_reports.delay(office_id, current_month.isoformat())
+    return len(office_ids)
+
+
+@app.task(name="reports.start_office", bind=True, max_retries=10)
+def start_office_reports(self, office_id: str, current_month: str):
+    with Session(engine) as db:
+        if not _lock_office(db, office_id):
+            # the rollover must happen, wait for the running job of this office
+            raise self.retry(countdown=30)
+        closed, created = ReportRepository(db).start_office_reports(
+            office_id, datetime.fromisoformat(current_month)
+        )
+        db.commit()
+    logger.info(f"Office {office_id}: {created} reports opened, {closed} closed")
+    return {"office_id": office_id, "closed": closed, "created": created}
 
 
-@app.task(name="first_task")
-def first_taks():
-    logger.info("first task")
+@app.task(name="reports.update")
+def update_reports():
+    """reconcile the open reports, one task per office"""
+    office_ids = _office_ids()
+    for office_id in office_ids:
+        # a task still queued at the next run is superseded by the new one
+        update_office_reports.apply_async(
+            (office_id,), expires=settings.TASK_UPDATE_REPORTS_INTERVAL * 60
+        )
+    return len(office_ids)
 
 
-@app.task(name="second_task")
-def second_task():
-    logger.info("second task")
+@app.task(name="reports.update_office")
+def update_office_reports(office_id: str):
+    with Session(engine) as db:
+        if not _lock_office(db, office_id):
+            logger.info(f"Reports of office {office_id} are already being updated, skipped")
+            return None
+        updated = ReportRepository(db).update_reports(office_id)
+    return {"office_id": office_id, "updated": updated}
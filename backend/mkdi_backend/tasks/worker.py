@@ -2,6 +2,7 @@ import os
 
 from celery import Celery
 from loguru import logger
+from mkdi_backend.config import settings
 
 """
 To run the worker run `celery run -A mkdi_backend.taks.worker worker -l INFO`
@@ -21,9 +22,13 @@ logger.info(
 
 # see https://docs.celeryq.dev/en/stable/userguide/periodic-tasks.html
 app.conf.beat_schedule = {
-    "first-task": {
-        "task": "first_task",
-        "schedule": 10.0,  # seconds
+    "start-reports": {
+        "task": "reports.start",
+        "schedule": settings.TASK_CREATE_REPORTS_INTERVAL * 60,  # seconds
+    },
+    "update-reports": {
+        "task": "reports.update",
+        "schedule": settings.TASK_UPDATE_REPORTS_INTERVAL * 60,  # seconds
     },
 }
 app.conf.timezone = "UTC"
@@ -7,8 +7,9 @@ from loguru import logger
 from mkdi_backend.config import settings
 from mkdi_backend.database import engine
 from mkdi_shared.exceptions.mkdi_api_error import MkdiError, MkdiErrorCode
-from psycopg2.errors import DeadlockDetected, ExclusionViolation, SerializationFailure, UniqueViolation
-from sqlalchemy.exc import OperationalError, PendingRollbackError,NoResultFound
+from mkdi_backend.utils.retry import a_with_retries, with_retries
+from sqlalchemy import inspect
+from sqlalchemy.exc import NoResultFound
 from sqlmodel import Session, SQLModel
 
 
@@ -30,54 +31,59 @@ class CommitMode(IntEnum):
 """
 
 
+def mapped_arguments(session, args) -> list:
+    """the instances of the session passed to a decorated method, reloaded when it retries"""
+    return [
+        arg
+        for arg in args
+        if inspect(arg, raiseerr=False) is not None and arg in session and inspect(arg).persistent
+    ]
+
+
+def check_unchanged(entities: list, states: list) -> None:
+    """raise when a concurrent request changed the state of the transactions being worked on,
+    their operation must not be applied twice"""
+    if [getattr(entity, "state", None) for entity in entities] != states:
+        raise MkdiError(
+            "The transaction was changed by a concurrent request",
+            error_code=MkdiErrorCode.INVALID_STATE,
+            http_status_code=HTTPStatus.CONFLICT,
+        )
+
+
 def managed_tx_method(
-    auto_commit: CommitMode = CommitMode.COMMIT, num_retries=settings.DATABASE_MAX_TX_RETRY_COUNT
+    auto_commit: CommitMode = CommitMode.COMMIT,
+    num_retries=settings.DATABASE_MAX_TX_RETRY_COUNT,
+    retry_on=(),
 ):
     def decorator(f):
         @wraps(f)
         def wrapped_f(self, *args, **kwargs):
-            session = self.db if hasattr(self,"db") else None
-            if not session and hasattr(self,"session"):
+            session = self.db if hasattr(self, "db") else None
+            if not session and hasattr(self, "session"):
                 session = self.session.db
 
+            def attempt():
+                result = f(self, *args, **kwargs)
+                session.commit()
+                if isinstance(result, SQLModel):
+                    session.refresh(result)
+                return result
+
             try:
                 result = None
                 if auto_commit == CommitMode.COMMIT:
-                    retry_exhausted = True
-                    for i in range(num_retries):
-                        try:
-                            result = f(self, *args, **kwargs)
-                            session.commit()
-                            if isinstance(result, SQLModel):
-                                session.refresh(result)
-                            retry_exhausted = False
-                            break
-                        except PendingRollbackError as error:
-                            logger.info(str(error))
-                            session.rollback()
-                        except OperationalError as error:
-                            if error.orig is not None and isinstance(
-                                error.orig,
-                                (
-                                    SerializationFailure,
-                                    DeadlockDetected,
-                                    UniqueViolation,
-                                    ExclusionViolation,
-                                ),
-                            ):
-                                logger.info(
-                                    f"{type(error.orig)} Inner {error.orig.pgcode} {type(error.orig.pgcode)}"
-                                )
-                                session.rollback()
-                            else:
-                                raise error
-                        logger.info(f"Retry {i+1}/{num_retries}")
-                    if retry_exhausted:
-                        raise MkdiError(
-                            "DATABASE_MAX_RETIRES_EXHAUSTED",
-                            error_code=MkdiErrorCode.DATABASE_MAX_RETRIES_EXHAUSTED,
-                            http_status_code=HTTPStatus.SERVICE_UNAVAILABLE,
-                        )
+                    entities = mapped_arguments(session, args)
+                    states = [getattr(entity, "state", None) for entity in entities]
+                    result = with_retries(
+                        f.__qualname__,
+                        attempt,
+                        session.rollback,
+                        # the states are lazy loaded again after the rollback
+                        on_retry=lambda: check_unchanged(entities, states),
+                        attempts=num_retries,
+                        retry_on=retry_on,
+                    )
                 else:
                     result = f(self, *args, **kwargs)
                     if auto_commit == CommitMode.FLUSH:
@@ -103,53 +109,44 @@ def managed_tx_method(
 
 
 def async_managed_tx_method(
-    auto_commit: CommitMode = CommitMode.COMMIT, num_retries=settings.DATABASE_MAX_TX_RETRY_COUNT
+    auto_commit: CommitMode = CommitMode.COMMIT,
+    num_retries=settings.DATABASE_MAX_TX_RETRY_COUNT,
+    retry_on=(),
 ):
     def decorator(f):
         @wraps(f)
         async def wrapped_f(self, *args, **kwargs):
+            entities = mapped_arguments(self.db, args)
+            states = [getattr(entity, "state", None) for entity in entities]
+
+            async def attempt():
+                result = await f(self, *args, **kwargs)
+                await self.db.commit()
+                if isinstance(result, SQLModel):
+                    await self.db.refresh(result)
+                elif isinstance(result, list):
+                    for item in result:
+                        if isinstance(item, SQLModel):
+                            await self.db.refresh(item)
+                return result
+
+            async def reload():
+                # expired by the rollback, async sessions do not lazy load
+                for entity in entities:
+                    await self.db.refresh(entity)
+                check_unchanged(entities, states)
+
             try:
                 result = None
                 if auto_commit == CommitMode.COMMIT:
-                    retry_exhausted = True
-                    for i in range(num_retries):
-                        try:
-                            result = await f(self, *args, **kwargs)
-                            await self.db.commit()
-                            if isinstance(result, SQLModel):
-                                await self.db.refresh(result)
-                            elif isinstance(result, list):
-                                for item in result:
-                                    if isinstance(item, SQLModel):
-                                        await self.db.refresh(item)
-                            retry_exhausted = False
-                            break
-                        except PendingRollbackError as e:
-                            logger.info(str(e))
-                            await self.db.rollback()
-                        except OperationalError as e:
-                            if e.orig is not None and isinstance(
-                                e.orig,
-                                (
-                                    SerializationFailure,
-                                    DeadlockDetected,
-                                    UniqueViolation,
-                                    ExclusionViolation,
-                                ),
-                            ):
-                                logger.info(
-                                    f"{type(e.orig)} Inner {e.orig.pgcode} {type(e.orig.pgcode)}"
-                                )
-                                await self.db.rollback()
-                            else:
-                                raise e
-                        logger.info(f"Retry {i+1}/{num_retries}")
-                    if retry_exhausted:
-                        raise MkdiError(
-                            "DATABASE_MAX_RETIRES_EXHAUSTED",
-                            error_code=MkdiErrorCode.DATABASE_MAX_RETRIES_EXHAUSTED,
-                            http_status_code=HTTPStatus.SERVICE_UNAVAILABLE,
-                        )
+                    result = await a_with_retries(
+                        f.__qualname__,
+                        attempt,
+                        self.db.rollback,
+                        on_retry=reload,
+                        attempts=num_retries,
+                        retry_on=retry_on,
+                    )
                 else:
                     result = await f(self, *args, **kwargs)
                     if auto_commit == CommitMode.FLUSH:
@@ -159,6 +156,12 @@ def async_managed_tx_method(
                     elif auto_commit == CommitMode.ROLLBACK:
                         await self.db.rollback()
                 return result
+            except NoResultFound as error:
+                raise MkdiError(
+                    error_code=MkdiErrorCode.NOT_FOUND,
+                    message="Resource not found",
+                    http_status_code=HTTPStatus.NOT_FOUND,
+                ) from error
             except Exception as e:
                 logger.info("Something went wrong")
                 logger.info(str(e))
@@ -176,6 +179,7 @@ def default_session_factory() -> Session:
 def managed_tx_function(
     auto_commit: CommitMode = CommitMode.COMMIT,
     num_retries=settings.DATABASE_MAX_TX_RETRY_COUNT,
+    retry_on=(),
     session_factory: Callable[..., Session] = default_session_factory,
 ):
     """Passes Session object as first argument to wrapped function."""
@@ -183,45 +187,25 @@ def managed_tx_function(
     def decorator(f):
         @wraps(f)
         def wrapped_f(*args, **kwargs):
+            def attempt():
+                # a new session per attempt, closing it rolls a failed attempt back
+                with session_factory() as session:
+                    result = f(session, *args, **kwargs)
+                    session.commit()
+                    if isinstance(result, SQLModel):
+                        session.refresh(result)
+                    return result
+
             try:
                 result = None
                 if auto_commit == CommitMode.COMMIT:
-                    retry_exhausted = True
-                    for i in range(num_retries):
-                        with session_factory() as session:
-                            try:
-                                result = f(session, *args, **kwargs)
-                                session.commit()
-                                if isinstance(result, SQLModel):
-                                    session.refresh(result)
-                                retry_exhausted = False
-                                break
-                            except PendingRollbackError as e:
-                                logger.info(str(e))
-                                session.rollback()
-                            except OperationalError as e:
-                                if e.orig is not None and isinstance(
-                                    e.orig,
-                                    (
-                                        SerializationFailure,
-                                        DeadlockDetected,
-                                        UniqueViolation,
-                                        ExclusionViolation,
-                                    ),
-                                ):
-                                    logger.info(
-                                        f"{type(e.orig)} Inner {e.orig.pgcode} {type(e.orig.pgcode)}"
-                                    )
-                                    session.rollback()
-                                else:
-                                    raise e
-                        logger.info(f"Retry {i+1}/{num_retries}")
-                    if retry_exhausted:
-                        raise MkdiError(
-                            "DATABASE_MAX_RETIRES_EXHAUSTED",
-                            error_code=MkdiErrorCode.DATABASE_MAX_RETRIES_EXHAUSTED,
-                            http_status_code=HTTPStatus.SERVICE_UNAVAILABLE,
-                        )
+                    result = with_retries(
+                        f.__qualname__,
+                        attempt,
+                        lambda: None,
+                        attempts=num_retries,
+                        retry_on=retry_on,
+                    )
                 else:
                     with session_factory() as session:
                         result = f(session, *args, **kwargs)
@@ -244,6 +228,7 @@ def managed_tx_function(
 def async_managed_tx_function(
     auto_commit: CommitMode = CommitMode.COMMIT,
     num_retries=settings.DATABASE_MAX_TX_RETRY_COUNT,
+    retry_on=(),
     session_factory: Callable[..., Session] = default_session_factory,
 ):
     """Passes Session object as first argument to wrapped function."""
@@ -251,45 +236,24 @@ def async_managed_tx_function(
     def decorator(f):
         @wraps(f)
         async def wrapped_f(*args, **kwargs):
+            async def attempt():
+                # a new session per attempt, closing it rolls a failed attempt back
+                with session_factory() as session:
+                    result = await f(session, *args, **kwargs)
+                    session.commit()
+                    if isinstance(result, SQLModel):
+                        session.refresh(result)
+                    return result
+
+            async def rollback():
+                pass
+
             try:
                 result = None
                 if auto_commit == CommitMode.COMMIT:
-                    retry_exhausted = True
-                    for i in range(num_retries):
-                        with session_factory() as session:
-                            try:
-                                result = await f(session, *args, **kwargs)
-                                session.commit()
-                                if isinstance(result, SQLModel):
-                                    session.refresh(result)
-                                retry_exhausted = False
-                                break
-                            except PendingRollbackError as error:
-                                logger.info(str(error))
-                                session.rollback()
-                            except OperationalError as error:
-                                if error.orig is not None and isinstance(
-                                    error.orig,
-                                    (
-                                        SerializationFailure,
-                                        DeadlockDetected,
-                                        UniqueViolation,
-                                        ExclusionViolation,
-                                    ),
-                                ):
-                                    logger.info(
-                                        f"{type(error.orig)} Inner {error.orig.pgcode} {type(error.orig.pgcode)}"
-                                    )
-                                    session.rollback()
-                                else:
-                                    raise error
-                        logger.info(f"Retry {i+1}/{num_retries}")
-                    if retry_exhausted:
-                        raise MkdiError(
-                            "DATABASE_MAX_RETIRES_EXHAUSTED",
-                            error_code=MkdiErrorCode.DATABASE_MAX_RETRIES_EXHAUSTED,
-                            http_status_code=HTTPStatus.SERVICE_UNAVAILABLE,
-                        )
+                    result = await a_with_retries(
+                        f.__qualname__, attempt, rollback, attempts=num_retries, retry_on=retry_on
+                    )
                 else:
                     with session_factory() as session:
                         result = await f(session, *args, **kwargs)
@@ -0,0 +1,83 @@
+import csv
+import io
+import json
+import zlib
+from datetime import date, datetime
+from enum import Enum
+from typing import Any, AsyncIterable, AsyncIterator, List, Mapping
+
+
+class ExportFormat(str, Enum):
+    NDJSON = "ndjson"
+    CSV = "csv"
+
+
+MEDIA_TYPES = {ExportFormat.NDJSON: "application/x-ndjson", ExportFormat.CSV: "text/csv"}
+
+
+def to_text(value: Any) -> Any:
+    """json friendly representation of a column value"""
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if value is None or isinstance(value, (str, int, float, bool, list, dict)):
+        return value
+    # Decimal, UUID
+    return str(value)
+
+
+async def ndjson_lines(rows: AsyncIterable[Mapping]) -> AsyncIterator[str]:
+    async for row in rows:
+        yield json.dumps({key: to_text(value) for key, value in row.items()}) + "\n"
+
+
+async def csv_lines(rows: AsyncIterable[Mapping], columns: List[str]) -> AsyncIterator[str]:
+    """one csv line per row, columns missing from a row are left empty"""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=columns, extrasaction="ignore")
+
+    def flush() -> str:
+        line = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return line
+
+    writer.writeheader()
+    yield flush()
+    async for row in rows:
+        values = {key: to_text(value) for key, value in row.items()}
+        writer.writerow(
+            {
+                key: json.dumps(value) if isinstance(value, (list, dict)) else value
+                for key, value in values.items()
+            }
+        )
+        yield flush()
+
+
+async def encode(
+    lines: AsyncIterable[str], gzip: bool = False, chunk_size: int = 64 * 1024
+) -> AsyncIterator[bytes]:
+    """Encode lines to chunks of about ``chunk_size`` bytes, optionally gzip compressed.
+
+    Args:
+        lines (AsyncIterable[str]): the lines to send
+        gzip (bool): compress the stream, the result is a valid .gz file
+        chunk_size (int): number of bytes buffered before a chunk is sent
+
+    Returns:
+        AsyncIterator[bytes]: the response body chunks
+    """
+    compressor = zlib.compressobj(wbits=31) if gzip else None
+    chunk = bytearray()
+    async for line in lines:
+        data = line.encode()
+        chunk += compressor.compress(data) if compressor else data
+        if len(chunk) >= chunk_size:
+            yield bytes(chunk)
+            chunk.clear()
+    if compressor:
+        chunk += compressor.flush()
+    if chunk:
+        yield bytes(chunk)
@@ -0,0 +1,97 @@
+import asyncio
+import time
+from typing import Optional
+
+from jwcrypto import jwk, jwt
+from loguru import logger
+
+
+class JwksKeyCache:
+    """Process wide cache of the realm signing keys.
+
+    Tokens are verified locally against the cached key set. The set is refreshed in the
+    background once it is older than ``ttl`` seconds, and eagerly (at most once every
+    ``min_refresh_interval`` seconds) when a token is signed with a key we don't know yet,
+    which is what happens right after a key rotation on the identity provider.
+    """
+
+    def __init__(self, openid, ttl: int = 300, min_refresh_interval: int = 10):
+        self._openid = openid
+        self._ttl = ttl
+        self._min_refresh_interval = min_refresh_interval
+        self._keyset: Optional[jwk.JWKSet] = None
+        self._fetched_at = 0.0
+        self._lock = asyncio.Lock()
+        self._refresh_task: Optional[asyncio.Task] = None
+
+    def _is_stale(self) -> bool:
+        return time.monotonic() - self._fetched_at > self._ttl
+
+    async def _fetch(self) -> None:
+        certs = await self._openid.a_certs()
+        keyset = jwk.JWKSet()
+        for cert in certs["keys"]:
+            keyset.add(jwk.JWK(**cert))
+        self._keyset = keyset
+        self._fetched_at = time.monotonic()
+        logger.debug(f"Loaded {len(certs['keys'])} signing keys")
+
+    async def refresh(self, force: bool = False) -> None:
+        """Reload the key set.
+
+        Args:
+            force (bool): reload even if the cached set is still fresh, this is still
+                rate limited by ``min_refresh_interval``.
+        """
+        async with self._lock:
+            age = time.monotonic() - self._fetched_at
+            if self._keyset is not None:
+                if not force and age <= self._ttl:
+                    return
+                if force and age < self._min_refresh_interval:
+                    return
+            await self._fetch()
+
+    async def _background_refresh(self) -> None:
+        try:
+            await self.refresh()
+        except Exception as e:
+            # keep serving the previous keys, the next request will try again
+            logger.error(f"Failed to refresh signing keys {e}")
+
+    async def get_keyset(self) -> jwk.JWKSet:
+        """Return the cached key set, loading it on first use."""
+        if self._keyset is None:
+            await self.refresh()
+        elif self._is_stale() and (self._refresh_task is None or self._refresh_task.done()):
+            self._refresh_task = asyncio.create_task(self._background_refresh())
+        return self._keyset
+
+    async def decode_token(
+        self, token: str, check_claims: Optional[dict] = None, leeway: int = 60
+    ) -> dict:
+        """Verify the token signature and claims, then return its payload.
+
+        Args:
+            token (str): the encoded access token
+            check_claims (dict): claims values to enforce, ``exp`` is always checked
+            leeway (int): clock skew tolerance in seconds
+
+        Returns:
+            dict: the decoded claims
+        """
+        claims = {"exp": None, **(check_claims or {})}
+        keyset = await self.get_keyset()
+        try:
+            return self._verify(token, keyset, claims, leeway)
+        except jwt.JWTMissingKey:
+            # unknown kid, the keys have probably been rotated
+            await self.refresh(force=True)
+            return self._verify(token, self._keyset, claims, leeway)
+
+    @staticmethod
+    def _verify(token: str, keyset: jwk.JWKSet, claims: dict, leeway: int) -> dict:
+        full_jwt = jwt.JWT(jwt=token, check_claims=claims)
+        full_jwt.leeway = leeway
+        full_jwt.validate(keyset)
+        return jwt.json_decode(full_jwt.claims)
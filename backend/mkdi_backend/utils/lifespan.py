@@ -9,31 +9,6 @@ from loguru import logger
 from mkdi_backend.config import settings
 from mkdi_backend.database import engine
 from sqlmodel import Session
-import asyncio
-from datetime import datetime, timedelta
-from mkdi_backend.repositories.report_repo import ReportRepository
-
-
-async def update_account_report():
-    while True:
-        logger.debug("Running peridic task to update account reports")
-
-        with Session(engine) as session:
-            report_repo = ReportRepository(session)
-            report_repo.update_reports()
-
-        await asyncio.sleep(settings.TASK_UPDATE_REPORTS_INTERVAL * 60)
-
-
-async def create_account_report():
-    while True:
-        logger.info("Running periodic task")
-        # get the db session
-        with Session(engine) as session:
-            report_repo = ReportRepository(session)
-            report_repo.start_reports()
-
-        await asyncio.sleep(settings.TASK_CREATE_REPORTS_INTERVAL * 60)
 
 
 async def alembic_upgrade():
@@ -65,17 +40,8 @@ async def lifespan(app: FastAPI):
     save_schema(app)
     # seed database
 
-    # start the cron job
-    # task = asyncio.create_task(create_account_report())
-    # update_task = asyncio.create_task(update_account_report())
-
+    # the report jobs run on the celery worker, see mkdi_backend.tasks.scheduled_tasks
     yield
 
-    # task.cancel()
-    # update_task.cancel()
-    # # wait for the task to finish
-    # await task
-    # await update_task
-
     logger.info("Closing database connection")
     app.state.db.close()
@@ -0,0 +1,77 @@
+import base64
+import heapq
+from datetime import datetime
+from itertools import islice
+from typing import AsyncIterable, AsyncIterator, Iterable, List, Optional, Tuple
+from uuid import UUID
+
+from mkdi_shared.exceptions.mkdi_api_error import MkdiError, MkdiErrorCode
+
+
+def encode_cursor(created_at: datetime, id: UUID) -> str:
+    """opaque cursor pointing after the given row"""
+    raw = f"{created_at.isoformat()}|{id}".encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, UUID]:
+    """(created_at, id) of the last row of the previous page"""
+    try:
+        created_at, id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(created_at), UUID(id)
+    except ValueError as e:
+        raise MkdiError(f"Invalid cursor {cursor}", error_code=MkdiErrorCode.INVALID_INPUT) from e
+
+
+def newest_first(*collections: Iterable, limit: Optional[int] = None) -> List:
+    """Merge rows already sorted by (created_at, id) desc into a single newest first list.
+
+    The merge is lazy, the collections are only consumed until ``limit`` rows were taken.
+
+    Args:
+        collections (Iterable): rows of each transaction type, newest first
+        limit (int, optional): maximum number of rows to return
+
+    Returns:
+        List: the rows of every collection, newest first
+    """
+    merged = heapq.merge(*collections, key=lambda row: (row.created_at, row.id), reverse=True)
+    return list(islice(merged, limit))
+
+
+async def a_newest_first(*streams: AsyncIterable, key=lambda row: (row.created_at, row.id)):
+    """Lazy merge of async streams sorted by (created_at, id) desc, newest first.
+
+    Only one row of each stream is held at a time, so the merge runs in constant memory.
+    """
+    iterators: List[AsyncIterator] = [aiter(stream) for stream in streams]
+    heap = []
+    for index, iterator in enumerate(iterators):
+        row = await anext(iterator, None)
+        if row is not None:
+            heap.append((_Desc(key(row)), index, row))
+    heapq.heapify(heap)
+
+    while heap:
+        _, index, row = heap[0]
+        yield row
+        following = await anext(iterators[index], None)
+        if following is None:
+            heapq.heappop(heap)
+        else:
+            heapq.heapreplace(heap, (_Desc(key(following)), index, following))
+
+
+class _Desc:
+    """reverses the ordering of a key, heapq only provides a min heap"""
+
+    __slots__ = ("key",)
+
+    def __init__(self, key):
+        self.key = key
+
+    def __lt__(self, other: "_Desc") -> bool:
+        return other.key < self.key
+
+    def __eq__(self, other: "_Desc") -> bool:
+        return self.key == other.key
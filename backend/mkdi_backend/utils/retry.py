@@ -0,0 +1,228 @@
+"""Retry engine of the managed transaction decorators.
+
+A transaction that lost against a concurrent one is rolled back and run again after an
+exponential backoff with full jitter, so the requests that collided on the same accounts do
+not collide again in lockstep. The attempts of a call are bounded by a count and a deadline.
+"""
+
+import asyncio
+import random
+import threading
+import time
+from http import HTTPStatus
+from typing import Any, Awaitable, Callable, Collection, Optional
+
+from loguru import logger
+from mkdi_backend.config import settings
+from mkdi_shared.exceptions.mkdi_api_error import MkdiError, MkdiErrorCode
+from sqlalchemy.exc import DBAPIError, PendingRollbackError
+from sqlalchemy.orm.exc import StaleDataError
+
+# postgres error codes of a transaction that lost against a concurrent one
+RETRYABLE_PGCODES = {
+    "40001": "serialization_failure",
+    "40P01": "deadlock_detected",
+}
+
+# constraint violations, retried only by the calls that opt in with ``retry_on``: a new attempt
+# passes when the conflicting row came from a concurrent request, it fails the same way when
+# the request itself is invalid
+OPT_IN_PGCODES = {
+    "23505": "unique_violation",
+    "23P01": "exclusion_violation",
+}
+
+
+class RetryableError(Exception):
+    """raised by an attempt that must run again although the database did not fail"""
+
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+
+def classify(error: Exception, retry_on: Collection[str] = ()) -> Optional[str]:
+    """the reason to retry after ``error``, None when it must propagate
+
+    ``retry_on`` holds the codes of OPT_IN_PGCODES the caller retries as well.
+    """
+    if isinstance(error, RetryableError):
+        return error.reason
+    if isinstance(error, StaleDataError):
+        return "stale_data"
+    if isinstance(error, PendingRollbackError):
+        return "pending_rollback"
+    if isinstance(error, DBAPIError):
+        # psycopg2 and the asyncpg adapter both expose the SQLSTATE as pgcode
+        pgcode = getattr(error.orig, "pgcode", None)
+        if pgcode in retry_on:
+            return OPT_IN_PGCODES.get(pgcode)
+        return RETRYABLE_PGCODES.get(pgcode)
+    return None
+
+
+def backoff(attempt: int) -> float:
+    """delay before the attempt following ``attempt`` (0 based), in seconds"""
+    ceiling = min(
+        settings.DATABASE_TX_RETRY_MAX_DELAY,
+        settings.DATABASE_TX_RETRY_BASE_DELAY * 2**attempt,
+    )
+    return random.uniform(0, ceiling)
+
+
+class RetryStats:
+    """Attempts, conflicts and exhausted retries of every decorated method.
+
+    The counters live in the process, they are reset when the worker restarts.
+    """
+
+    def __init__(self):
+        self._methods: dict = {}
+        self._lock = threading.Lock()
+
+    def _counters(self, method: str) -> dict:
+        return self._methods.setdefault(
+            method, {"attempts": 0, "conflicts": 0, "exhausted": 0, "reasons": {}}
+        )
+
+    def attempt(self, method: str) -> None:
+        with self._lock:
+            self._counters(method)["attempts"] += 1
+
+    def conflict(self, method: str, reason: str) -> None:
+        with self._lock:
+            counters = self._counters(method)
+            counters["conflicts"] += 1
+            counters["reasons"][reason] = counters["reasons"].get(reason, 0) + 1
+
+    def exhausted(self, method: str) -> None:
+        with self._lock:
+            self._counters(method)["exhausted"] += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._methods.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                method: {**counters, "reasons": dict(counters["reasons"])}
+                for method, counters in self._methods.items()
+            }
+
+
+retry_stats = RetryStats()
+
+
+def exhausted_error(error: Exception) -> MkdiError:
+    return MkdiError(
+        "DATABASE_MAX_RETIRES_EXHAUSTED",
+        error_code=MkdiErrorCode.DATABASE_MAX_RETRIES_EXHAUSTED,
+        http_status_code=HTTPStatus.SERVICE_UNAVAILABLE,
+    )
+
+
+def _opted_in(error: Exception, retry_on: Collection[str]) -> bool:
+    """whether ``error`` is retried only because the caller opted in for its code"""
+    return isinstance(error, DBAPIError) and getattr(error.orig, "pgcode", None) in retry_on
+
+
+class _Attempts:
+    """the attempts of one call, bounded by a count and a deadline"""
+
+    def __init__(self, method: str, attempts: Optional[int]):
+        self.method = method
+        self.attempts = attempts or settings.DATABASE_MAX_TX_RETRY_COUNT
+        self.deadline = time.monotonic() + settings.DATABASE_TX_RETRY_DEADLINE
+        self.attempt = 0
+
+    def start(self) -> None:
+        retry_stats.attempt(self.method)
+
+    def failed(self, error: Exception, reason: str) -> Optional[float]:
+        """record a failed attempt, returns the delay before the next one, None when exhausted"""
+        retry_stats.conflict(self.method, reason)
+        delay = backoff(self.attempt)
+        self.attempt += 1
+        if self.attempt >= self.attempts or time.monotonic() + delay > self.deadline:
+            logger.error(f"{self.method}: retries exhausted after {self.attempt} attempts, {error}")
+            retry_stats.exhausted(self.method)
+            return None
+        logger.info(f"{self.method}: {reason}, attempt {self.attempt + 1} in {delay:.3f}s")
+        return delay
+
+
+def with_retries(
+    method: str,
+    attempt: Callable[[], Any],
+    rollback: Callable[[], Any],
+    on_retry: Optional[Callable[[], Any]] = None,
+    exhausted: Callable[[Exception], Exception] = exhausted_error,
+    attempts: Optional[int] = None,
+    retry_on: Collection[str] = (),
+) -> Any:
+    """Run ``attempt`` until it succeeds or fails with an error that is not retryable.
+
+    Args:
+        method (str): name of the decorated method, the key of its counters
+        attempt (Callable): runs and commits the transaction, returns its result
+        rollback (Callable): rolls the failed transaction back
+        on_retry (Callable, optional): called before every new attempt, may raise
+        exhausted (Callable): builds the error raised once the attempts are exhausted
+        attempts (int, optional): defaults to settings.DATABASE_MAX_TX_RETRY_COUNT
+        retry_on (Collection[str], optional): codes of OPT_IN_PGCODES retried by this call, their
+            last error is raised as is once the attempts are exhausted
+
+    Returns:
+        the result of the successful attempt
+    """
+    tries = _Attempts(method, attempts)
+    while True:
+        tries.start()
+        try:
+            return attempt()
+        except Exception as error:
+            reason = classify(error, retry_on)
+            if reason is None:
+                raise
+            rollback()
+            delay = tries.failed(error, reason)
+            if delay is None:
+                if _opted_in(error, retry_on):
+                    # a constraint that keeps failing is not a busy database, the caller handles it
+                    raise
+                raise exhausted(error) from error
+        time.sleep(delay)
+        if on_retry:
+            on_retry()
+
+
+async def a_with_retries(
+    method: str,
+    attempt: Callable[[], Awaitable[Any]],
+    rollback: Callable[[], Awaitable[Any]],
+    on_retry: Optional[Callable[[], Awaitable[Any]]] = None,
+    exhausted: Callable[[Exception], Exception] = exhausted_error,
+    attempts: Optional[int] = None,
+    retry_on: Collection[str] = (),
+) -> Any:
+    """async version of with_retries, the callables are coroutine functions"""
+    tries = _Attempts(method, attempts)
+    while True:
+        tries.start()
+        try:
+            return await attempt()
+        except Exception as error:
+            reason = classify(error, retry_on)
+            if reason is None:
+                raise
+            await rollback()
+            delay = tries.failed(error, reason)
+            if delay is None:
+                if _opted_in(error, retry_on):
+                    # a constraint that keeps failing is not a busy database, the caller handles it
+                    raise
+                raise exhausted(error) from error
+        await asyncio.sleep(delay)
+        if on_retry:
+            await on_retry()
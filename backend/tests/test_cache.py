@@ -0,0 +1,45 @@
+import time
+
+from mkdi_backend.utils.cache import TTLCache
+
+
+def test_cache_evicts_least_recently_used():
+    """
+    The cache never grows beyond its size, the oldest unused entry goes first
+    """
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert cache.stats()["evictions"] == 1
+
+
+def test_cache_entries_expire():
+    """
+    Expired entries count as misses
+    """
+    cache = TTLCache(ttl=0.01)
+    cache.set("a", 1)
+    time.sleep(0.02)
+
+    assert cache.get("a") is None
+    assert cache.stats()["misses"] == 1
+    assert cache.stats()["size"] == 0
+
+
+def test_cache_invalidate_where():
+    """
+    Entries can be dropped by value
+    """
+    cache = TTLCache()
+    cache.set("a", {"id": 1})
+    cache.set("b", {"id": 2})
+    cache.invalidate_where(lambda value: value["id"] == 1)
+
+    assert cache.get("a") is None
+    assert cache.get("b") == {"id": 2}
@@ -0,0 +1,42 @@
+import asyncio
+import gzip
+from decimal import Decimal
+from uuid import UUID
+
+from mkdi_backend.utils.export import csv_lines, encode, ndjson_lines
+from mkdi_shared.schemas import protocol
+
+
+async def _rows():
+    yield {"code": "D1", "amount": Decimal("10.5"), "state": protocol.TransactionState.PAID}
+    yield {"code": "S1", "id": UUID(int=1), "notes": [{"type": "REQUEST"}]}
+
+
+async def _read(chunks) -> bytes:
+    return b"".join([chunk async for chunk in chunks])
+
+
+def test_export_csv_gzip():
+    """
+    The gzip stream is a valid gzip file, rows without a column leave it empty
+    """
+    body = asyncio.run(_read(encode(csv_lines(_rows(), ["code", "amount", "state"]), gzip=True)))
+
+    assert gzip.decompress(body).decode().splitlines() == [
+        "code,amount,state",
+        "D1,10.5,PAID",
+        "S1,,",
+    ]
+
+
+def test_export_ndjson():
+    """
+    One json document per line, with enums, decimals and uuids as strings
+    """
+    body = asyncio.run(_read(encode(ndjson_lines(_rows()), chunk_size=1)))
+
+    assert body.decode().splitlines() == [
+        '{"code": "D1", "amount": "10.5", "state": "PAID"}',
+        '{"code": "S1", "id": "00000000-0000-0000-0000-000000000001", '
+        '"notes": [{"type": "REQUEST"}]}',
+    ]
@@ -0,0 +1,74 @@
+import asyncio
+import time
+
+import pytest
+from jwcrypto import jwk, jwt
+from mkdi_backend.utils.jwks import JwksKeyCache
+
+
+class FakeOpenID:
+    def __init__(self, *keys):
+        self.keys = list(keys)
+        self.calls = 0
+
+    async def a_certs(self):
+        self.calls += 1
+        return {"keys": [key.export_public(as_dict=True) for key in self.keys]}
+
+
+def make_key(kid):
+    return jwk.JWK.generate(kty="RSA", size=2048, kid=kid)
+
+
+def sign(key, **claims):
+    claims = {"exp": int(time.time()) + 300, "azp": "portal", **claims}
+    token = jwt.JWT(header={"alg": "RS256", "kid": key.key_id}, claims=claims)
+    token.make_signed_token(key)
+    return token.serialize()
+
+
+def test_decode_token_uses_cached_keys():
+    """
+    Keys are fetched once and reused for every token
+    """
+    key = make_key("k1")
+    openid = FakeOpenID(key)
+    cache = JwksKeyCache(openid)
+
+    async def run():
+        for _ in range(3):
+            payload = await cache.decode_token(sign(key, sub="u1"), {"azp": "portal"})
+            assert payload["sub"] == "u1"
+
+    asyncio.run(run())
+    assert openid.calls == 1
+
+
+def test_decode_token_refreshes_on_rotation():
+    """
+    A token signed with an unknown key id triggers a reload of the key set
+    """
+    old, new = make_key("k1"), make_key("k2")
+    openid = FakeOpenID(old)
+    cache = JwksKeyCache(openid, min_refresh_interval=0)
+
+    async def run():
+        await cache.decode_token(sign(old))
+        openid.keys.append(new)
+        return await cache.decode_token(sign(new, sub="u2"))
+
+    assert asyncio.run(run())["sub"] == "u2"
+    assert openid.calls == 2
+
+
+def test_decode_token_rejects_invalid_claims():
+    """
+    Expired tokens and tokens issued to another client are refused
+    """
+    key = make_key("k1")
+    cache = JwksKeyCache(FakeOpenID(key))
+
+    with pytest.raises(Exception):
+        asyncio.run(cache.decode_token(sign(key, exp=int(time.time()) - 3600)))
+    with pytest.raises(Exception):
+        asyncio.run(cache.decode_token(sign(key, azp="other"), {"azp": "portal"}))
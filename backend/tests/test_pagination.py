@@ -0,0 +1,39 @@
+from collections import namedtuple
+from datetime import datetime
+from uuid import uuid4
+
+import pytest
+from mkdi_backend.utils.pagination import decode_cursor, encode_cursor, newest_first
+from mkdi_shared.exceptions.mkdi_api_error import MkdiError
+
+Row = namedtuple("Row", ["created_at", "id"])
+
+
+def test_cursor_round_trip():
+    """
+    A cursor decodes to the row it was built from, garbage is rejected
+    """
+    created_at, id = datetime(2024, 5, 1, 10, 30, 15, 123456), uuid4()
+    assert decode_cursor(encode_cursor(created_at, id)) == (created_at, id)
+
+    with pytest.raises(MkdiError):
+        decode_cursor("not a cursor")
+
+
+def test_newest_first_merges_and_stops_at_limit():
+    """
+    Rows of several sorted collections come out newest first, only up to the limit
+    """
+    deposits = [Row(datetime(2024, 5, day), uuid4()) for day in (9, 5, 1)]
+    sendings = [Row(datetime(2024, 5, day), uuid4()) for day in (8, 7, 2)]
+    consumed = []
+
+    def track(rows):
+        for row in rows:
+            consumed.append(row)
+            yield row
+
+    page = newest_first(track(deposits), track(sendings), limit=3)
+
+    assert [row.created_at.day for row in page] == [9, 8, 7]
+    assert len(consumed) < len(deposits) + len(sendings)
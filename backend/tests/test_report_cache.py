@@ -0,0 +1,98 @@
+from datetime import datetime, timedelta
+from decimal import Decimal
+from uuid import UUID
+
+from mkdi_backend.models.report_cache import dumps, invalidate_reports
+from mkdi_backend.models.transactions.transactions import (
+    Deposit,
+    Internal,
+    Sending,
+    WalletTrading,
+)
+from mkdi_shared.schemas import protocol
+
+
+def test_cached_report_round_trip():
+    """
+    A cached report is read back exactly, decimals are not rounded through floats
+    """
+    report = protocol.ReportResponse(
+        results=[
+            protocol.OfficeResult(
+                result_source=protocol.TransactionType.TRADING,
+                result_type=protocol.ResultType.LOSS,
+                amount=Decimal("-16.3333333333333333333333333"),
+                code="T1",
+                tag=None,
+                state=protocol.TransactionState.PAID,
+                date=datetime(2024, 9, 4),
+                transaction_id=UUID(int=1),
+            )
+        ]
+    )
+
+    assert protocol.ReportResponse.parse_raw(dumps(report)) == report
+
+
+class FakeConnection:
+    def __init__(self):
+        self.statements = []
+
+    def execute(self, statement):
+        self.statements.append(statement)
+
+
+class FakeSession:
+    def __init__(self, dirty=(), deleted=()):
+        self.dirty, self.deleted = list(dirty), list(deleted)
+        self.connection_ = FakeConnection()
+
+    def connection(self):
+        return self.connection_
+
+
+def test_invalidation_deletes_once_per_office():
+    """
+    The changed transactions of an office drop its cached reports with a single delete, and
+    start a new generation only when they belong to a closed period
+    """
+    office_id = UUID(int=2)
+    last_month = datetime.now().replace(day=1) - timedelta(days=10)
+    session = FakeSession(
+        dirty=[
+            Internal(
+                office_id=office_id, created_at=last_month, state=protocol.TransactionState.PAID
+            ),
+            Deposit(
+                office_id=office_id, created_at=last_month, state=protocol.TransactionState.PAID
+            ),
+            WalletTrading(
+                walletID="W1",
+                created_at=datetime.now(),
+                notes=[],
+                state=protocol.TransactionState.PAID,
+            ),
+        ],
+        deleted=[Sending(office_id=office_id, created_at=datetime.now())],
+    )
+
+    invalidate_reports(session, None)
+
+    tables = [
+        (type(statement).__name__, statement.table.name)
+        for statement in session.connection_.statements
+    ]
+    assert tables == [
+        ("Insert", "report_cache_generations"),
+        ("Delete", "report_cache"),
+        ("Delete", "report_cache"),
+    ]
+
+
+def test_unchanged_transactions_keep_the_cache():
+    """
+    A flush that does not change any transaction does not touch the cached reports
+    """
+    session = FakeSession()
+    invalidate_reports(session, None)
+    assert session.connection_.statements == []
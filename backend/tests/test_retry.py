@@ -0,0 +1,141 @@
+import asyncio
+
+import pytest
+from mkdi_backend.config import settings
+from mkdi_backend.utils.retry import a_with_retries, backoff, classify, retry_stats, with_retries
+from mkdi_shared.exceptions.mkdi_api_error import MkdiError, MkdiErrorCode
+from sqlalchemy.exc import IntegrityError, OperationalError
+from sqlalchemy.orm.exc import StaleDataError
+
+
+class DriverError(Exception):
+    def __init__(self, pgcode):
+        super().__init__(pgcode)
+        self.pgcode = pgcode
+
+
+def conflict():
+    return OperationalError("UPDATE accounts", {}, DriverError("40001"))
+
+
+@pytest.fixture(autouse=True)
+def no_delay(monkeypatch):
+    monkeypatch.setattr(settings, "DATABASE_TX_RETRY_BASE_DELAY", 0.001)
+    monkeypatch.setattr(settings, "DATABASE_TX_RETRY_DEADLINE", 5.0)
+    retry_stats.clear()
+
+
+def test_classify_by_pgcode():
+    """
+    Errors are retried on their postgres code, whatever the exception class of the driver
+    """
+    assert classify(conflict()) == "serialization_failure"
+    assert classify(OperationalError("", {}, DriverError("40P01"))) == "deadlock_detected"
+    assert classify(IntegrityError("", {}, DriverError("23505"))) is None
+    assert classify(IntegrityError("", {}, DriverError("23505")), {"23505"}) == "unique_violation"
+    assert classify(IntegrityError("", {}, DriverError("23503"))) is None
+    assert classify(StaleDataError()) == "stale_data"
+    assert classify(ValueError()) is None
+
+
+def test_backoff_is_capped(monkeypatch):
+    """
+    The delays grow with the attempts up to the maximum delay
+    """
+    monkeypatch.setattr(settings, "DATABASE_TX_RETRY_BASE_DELAY", 0.1)
+    monkeypatch.setattr(settings, "DATABASE_TX_RETRY_MAX_DELAY", 0.3)
+    assert all(0 <= backoff(0) <= 0.1 for _ in range(100))
+    assert all(0 <= backoff(10) <= 0.3 for _ in range(100))
+
+
+def test_conflicts_are_retried():
+    """
+    A conflict rolls the attempt back and runs it again
+    """
+    calls, rollbacks = [], []
+
+    def attempt():
+        calls.append(1)
+        if len(calls) == 1:
+            raise conflict()
+        return "done"
+
+    assert with_retries("m", attempt, lambda: rollbacks.append(1), attempts=3) == "done"
+    assert len(rollbacks) == 1
+    stats = retry_stats.stats()["m"]
+    assert stats["attempts"] == 2
+    assert stats["conflicts"] == 1
+    assert stats["reasons"] == {"serialization_failure": 1}
+    assert stats["exhausted"] == 0
+
+
+def test_retries_are_exhausted():
+    """
+    The last conflict raises once the attempts are exhausted
+    """
+
+    def attempt():
+        raise conflict()
+
+    with pytest.raises(MkdiError) as error:
+        asyncio.run(a_with_retries("m", _async(attempt), _async(lambda: None), attempts=3))
+
+    assert error.value.error_code == MkdiErrorCode.DATABASE_MAX_RETRIES_EXHAUSTED
+    assert retry_stats.stats()["m"]["attempts"] == 3
+    assert retry_stats.stats()["m"]["exhausted"] == 1
+
+
+def test_deadline_stops_the_retries(monkeypatch):
+    """
+    No attempt starts after the deadline of the call
+    """
+    monkeypatch.setattr(settings, "DATABASE_TX_RETRY_DEADLINE", 0)
+
+    def attempt():
+        raise conflict()
+
+    with pytest.raises(MkdiError):
+        with_retries("m", attempt, lambda: None, attempts=10)
+    assert retry_stats.stats()["m"]["attempts"] == 1
+
+
+def test_other_errors_are_not_retried():
+    """
+    Errors that are not conflicts propagate at once
+    """
+
+    def attempt():
+        raise ValueError("bad input")
+
+    with pytest.raises(ValueError):
+        with_retries("m", attempt, lambda: None)
+    assert retry_stats.stats()["m"]["attempts"] == 1
+
+
+def test_opted_in_violations_raise_the_original_error():
+    """
+    A unique violation is retried only on opt in, and raised as is once the attempts are exhausted
+    """
+
+    def attempt():
+        raise IntegrityError("INSERT accounts", {}, DriverError("23505"))
+
+    with pytest.raises(IntegrityError):
+        with_retries("m", attempt, lambda: None, attempts=3)
+    assert retry_stats.stats()["m"]["attempts"] == 1
+
+    with pytest.raises(IntegrityError):
+        asyncio.run(
+            a_with_retries(
+                "n", _async(attempt), _async(lambda: None), attempts=3, retry_on={"23505"}
+            )
+        )
+    assert retry_stats.stats()["n"]["attempts"] == 3
+    assert retry_stats.stats()["n"]["reasons"] == {"unique_violation": 3}
+
+
+def _async(f):
+    async def wrapped():
+        return f()
+
+    return wrapped
@@ -0,0 +1,67 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+import mkdi_backend.api.deps  # noqa: F401  loads the repositories in their import order
+from mkdi_backend.config import settings
+from mkdi_backend.models.transactions.transactions import Deposit
+from mkdi_backend.repositories.transaction_repos.deposit import DepositTransaction
+from mkdi_backend.utils.retry import retry_stats
+from mkdi_shared.schemas import protocol as pr
+from sqlalchemy.exc import OperationalError
+
+
+class DriverError(Exception):
+    def __init__(self, pgcode):
+        super().__init__(pgcode)
+        self.pgcode = pgcode
+
+
+class FakeSession:
+    """Fails the first commit with a conflict, the rollback restores the stored notes"""
+
+    def __init__(self, transaction):
+        self.transaction = transaction
+        self.stored = transaction.notes
+        self.commits = 0
+
+    def __contains__(self, instance):
+        return instance is self.transaction
+
+    def add(self, instance):
+        pass
+
+    def commit(self):
+        self.commits += 1
+        if self.commits == 1:
+            raise OperationalError("UPDATE deposits", {}, DriverError("40001"))
+        self.stored = self.transaction.notes
+
+    def rollback(self):
+        self.transaction.notes = self.stored
+
+    def refresh(self, instance):
+        pass
+
+
+@pytest.fixture(autouse=True)
+def no_delay(monkeypatch):
+    monkeypatch.setattr(settings, "DATABASE_TX_RETRY_BASE_DELAY", 0.001)
+    retry_stats.clear()
+
+
+def test_review_note_survives_a_retry():
+    """
+    The note is written by the retried attempt, a rolled back attempt does not lose it
+    """
+    transaction = Deposit(code="A010001", notes="[]", state=pr.TransactionState.REVIEW)
+    session = FakeSession(transaction)
+    reviewer = DepositTransaction(session, SimpleNamespace(user_db_id="u1"), None)
+    reviewer.add_note("REVIEW", "not enough funds")
+
+    reviewer.reject(transaction)
+
+    assert session.commits == 2
+    notes = json.loads(session.stored)
+    assert [(n["type"], n["message"]) for n in notes] == [("REVIEW", "not enough funds")]
+    assert transaction.state == pr.TransactionState.REJECTED
@@ -0,0 +1,36 @@
+import asyncio
+
+from mkdi_backend.authproviders import RoleCatalog
+
+
+class FakeAdmin:
+    def __init__(self):
+        self.calls = 0
+
+    async def a_get_realm_roles(self, brief_representation=True):
+        self.calls += 1
+        await asyncio.sleep(0.01)
+        return [{"name": "office_admin", "attributes": {"weight": ["2"]}}]
+
+
+class FakeHelper:
+    def __init__(self):
+        self.admin = FakeAdmin()
+
+    def get_kc_admin(self):
+        return self.admin
+
+
+def test_concurrent_cold_start_loads_once():
+    """
+    Requests waiting on the first load reuse it instead of fetching the roles again
+    """
+    helper = FakeHelper()
+    catalog = RoleCatalog(helper)
+
+    async def run():
+        await asyncio.gather(*(catalog.a_ensure_loaded() for _ in range(10)))
+
+    asyncio.run(run())
+    assert helper.admin.calls == 1
+    assert catalog.is_known("office_admin")
@@ -26,6 +26,28 @@ def custom_serializer(obj):
     return obj
 
 
+class JsonText(sa.types.TypeDecorator):
+    """JSONB column read and written as its JSON text.
+
+    The value is cast to text by the database, so the drivers never decode it.
+    """
+
+    impl = pg.JSONB
+    cache_ok = True
+
+    def bind_processor(self, dialect):
+        return None
+
+    def result_processor(self, dialect, coltype):
+        return None
+
+    def bind_expression(self, bindvalue):
+        return sa.cast(sa.cast(bindvalue, sa.Text), pg.JSONB)
+
+    def column_expression(self, column):
+        return sa.cast(column, sa.Text)
+
+
 class OrganizationBase(SQLModel):
     initials: str = Field(nullable=False, max_length=8, unique=True)
     org_name: str = Field(nullable=False, max_length=64)
@@ -450,7 +472,12 @@ class TransactionDB(TransactionBase):
         default={}, sa_column=sa.Column(MutableDict.as_mutable(pg.JSONB))
     )
 
-    notes: str = Field(default="[]", nullable=False)
+    notes: str = SQLModelField(default="[]", sa_column=sa.Column(JsonText, nullable=False))
+    # taken from the notes when they are written, so listings and reports don't parse them
+    request_message: Optional[str] = SQLModelField(default=None, nullable=True)
+    tags: Optional[List[str]] = SQLModelField(
+        default=None, sa_column=sa.Column(pg.ARRAY(sa.String), nullable=True)
+    )
 
     def to_response(self) -> TransactionResponse:
         return TransactionResponse(**self.dict())
@@ -474,14 +501,6 @@ class TransactionDB(TransactionBase):
         return self.notes
 
     def report(self, is_out: bool = False) -> AccountReportItem:
-
-        def get_request_message(self) -> str:
-            notes = json.loads(self.notes)
-            request = next((note for note in notes if note["type"] == "REQUEST"), None)
-            if request:
-                return request["message"]
-            return ""
-
         return AccountReportItem(
             amount=self.amount,
             code=self.code,
@@ -490,7 +509,7 @@ class TransactionDB(TransactionBase):
             is_out=is_out,
             state=self.state,
             type=self.type,
-            description=get_request_message(self),
+            description=self.request_message or "",
         )
 
     def update(self, request: TransactionRequest):
@@ -669,6 +688,23 @@ class ReportResponse(BaseModel):
     results: List[OfficeResult]
 
 
+class ReportPeriod(Enum):
+    DAY = "day"
+    MONTH = "month"
+
+
+class ProviderReportItem(BaseModel):
+    """Forex totals of a provider over a day or a month."""
+
+    provider: str
+    period: datetime
+    count: int
+    amount: Decimal
+    buying_amount: Decimal
+    selling_amount: Decimal
+    forex_result: Decimal
+
+
 class DateRange(BaseModel):
     """Date range."""
 
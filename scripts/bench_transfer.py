@@ -0,0 +1,226 @@
+"""Count the database round trips of an internal transfer.
+
+Seeds an office in the database configured by the backend settings (POSTGRES_*), then runs
+internal transfers through the transaction repository, each one requested then approved in
+its own session like two API calls. Prints the round trips (statements, BEGIN, COMMIT and
+ROLLBACK) and the median duration of every step. Run it on two commits to compare them.
+
+usage (from the backend directory, database migrated to head):
+
+    PYTHONPATH=. python ../scripts/bench_transfer.py --transfers 100 [--async]
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+import uuid
+from collections import Counter, defaultdict
+from datetime import date
+from decimal import Decimal
+
+import mkdi_backend.api.deps  # noqa: F401, resolves the repositories import cycle
+import sqlalchemy as sa
+from loguru import logger
+from mkdi_backend.database import engine
+from mkdi_backend.dbmanager import sessionmanager
+from mkdi_backend.models import Account, Activity, Agent, Employee, Office, Organization
+from mkdi_backend.models.models import KcUser
+from mkdi_backend.repositories.transactions import TransactionRepository
+from mkdi_shared.schemas import protocol as pr
+from sqlalchemy.engine import Engine
+from sqlmodel import Session
+
+BALANCE = Decimal(10**9)
+
+# commands sent by every engine, the async engine included
+sent = Counter()
+
+
+@sa.event.listens_for(Engine, "before_cursor_execute")
+def _statement(conn, cursor, statement, parameters, context, executemany):
+    sent["statements"] += 1
+
+
+@sa.event.listens_for(Engine, "begin")
+def _begin(conn):
+    sent["transactions"] += 1
+
+
+@sa.event.listens_for(Engine, "commit")
+def _commit(conn):
+    sent["transactions"] += 1
+
+
+@sa.event.listens_for(Engine, "rollback")
+def _rollback(conn):
+    sent["transactions"] += 1
+
+
+def seed(db: Session) -> tuple:
+    """office with a funded sender, a receiver and an open activity"""
+    # account and agent initials are limited to 4 characters
+    suffix = uuid.uuid4().hex[:2].upper()
+    org = Organization(initials=f"T{suffix}", org_name=f"transfers {suffix}")
+    db.add(org)
+    db.flush()
+    office = Office(
+        country="ML", initials=f"T{suffix}", name="transfers", organization_id=org.id, currencies=[]
+    )
+    db.add(office)
+    db.flush()
+    employee = Employee(
+        email=f"transfers{suffix}@mwague.local",
+        username=f"transfers{suffix}",
+        office_id=office.id,
+        organization_id=org.id,
+        roles=["office_admin"],
+        provider_account_id=f"transfers-{suffix}",
+    )
+    db.add(employee)
+    db.flush()
+
+    def account(initials: str, type: pr.AccountType, owner_id, balance=Decimal(0)) -> Account:
+        account = Account(
+            initials=initials,
+            type=type,
+            currency=pr.Currency.USD,
+            owner_id=owner_id,
+            created_by=employee.id,
+            office_id=office.id,
+            balance=balance,
+            version=1,
+        )
+        db.add(account)
+        return account
+
+    account(f"O{suffix}", pr.AccountType.OFFICE, office.id)
+    fund = account(f"F{suffix}", pr.AccountType.FUND, office.id, BALANCE)
+    agents = []
+    for index, balance in enumerate((BALANCE, Decimal(0))):
+        agent = Agent(
+            name=f"agent {index}",
+            initials=f"{suffix}{index:02}",
+            phone="0",
+            country="ML",
+            type=pr.AgentType.AGENT,
+            org_id=org.id,
+            office_id=office.id,
+        )
+        db.add(agent)
+        db.flush()
+        agents.append(account(agent.initials, pr.AccountType.AGENT, agent.id, balance).initials)
+    db.flush()
+
+    db.add(
+        Activity(
+            started_at=date.today(),
+            state=pr.ActivityState.OPEN,
+            office_id=office.id,
+            started_by=employee.id,
+            openning_fund=0,
+            closing_fund=0,
+            account_id=fund.id,
+        )
+    )
+    db.commit()
+
+    user = KcUser(
+        id=employee.provider_account_id,
+        username=employee.username,
+        email=employee.email,
+        first_name="transfers",
+        last_name="transfers",
+        roles=["office_admin"],
+        office_id=str(office.id),
+        organization_id=str(org.id),
+        user_db_id=str(employee.id),
+    )
+    return user, agents[0], agents[1]
+
+
+def transfer_request(sender: str, receiver: str) -> pr.TransactionRequest:
+    return pr.TransactionRequest(
+        amount=pr.Amount(amount=Decimal(10), rate=Decimal(1)),
+        charges=None,
+        message="bench",
+        data=pr.InternalRequest(type="INTERNAL", sender=sender, receiver=receiver),
+    )
+
+
+def approval(code: str) -> pr.TransactionReviewReq:
+    return pr.TransactionReviewReq(
+        code=code,
+        type=pr.TransactionType.INTERNAL,
+        state=pr.ValidationState.APPROVED,
+        notes="bench",
+        amount=pr.Amount(amount=Decimal(10), rate=Decimal(1)),
+    )
+
+
+async def call(use_async: bool, method: str, *args):
+    """call a repository method in its own session, as an API call would"""
+    if use_async:
+        async with sessionmanager.session() as db:
+            return await getattr(TransactionRepository(db), f"a_{method}")(*args)
+    with Session(engine) as db:
+        return getattr(TransactionRepository(db), method)(*args)
+
+
+async def measure(results: dict, step: str, run):
+    before = sent.copy()
+    start = time.perf_counter()
+    result = await run()
+    results[step].append(((time.perf_counter() - start) * 1000, sent - before))
+    return result
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--transfers", type=int, default=100)
+    parser.add_argument("--async", dest="use_async", action="store_true", help="async routes")
+    args = parser.parse_args()
+    # the repositories log every step
+    logger.disable("mkdi_backend")
+
+    with Session(engine) as db:
+        user, sender, receiver = seed(db)
+
+    results = defaultdict(list)
+    for _ in range(args.transfers):
+        transaction = await measure(
+            results,
+            "request",
+            lambda: call(
+                args.use_async, "request_for_approval", user, transfer_request(sender, receiver)
+            ),
+        )
+        await measure(
+            results,
+            "approve",
+            lambda: call(
+                args.use_async,
+                "review_transaction",
+                transaction.code,
+                user,
+                approval(transaction.code),
+            ),
+        )
+    results["transfer"] = [
+        (request[0] + approve[0], request[1] + approve[1])
+        for request, approve in zip(results["request"], results["approve"])
+    ]
+
+    print(f"{args.transfers} transfers, {'async' if args.use_async else 'sync'} session")
+    print(f"{'step':<10}  {'round trips':>11}  {'statements':>10}  {'median ms':>9}")
+    for step, runs in results.items():
+        statements = sum(counts["statements"] for _, counts in runs) / len(runs)
+        transactions = sum(counts["transactions"] for _, counts in runs) / len(runs)
+        duration = statistics.median(duration for duration, _ in runs)
+        print(
+            f"{step:<10}  {statements + transactions:>11.1f}  {statements:>10.1f}  {duration:>9.2f}"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())